@@ -0,0 +1,131 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache of feature dictionaries shared between prediction targets."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Mapping, Optional
+import uuid
+
+from absl import logging
+import numpy as np
+
+FeatureDict = Mapping[str, np.ndarray]
+
+_TMP_PREFIX = '.tmp-'
+# Lists the features of an entry. It is written last, so an entry without it
+# is incomplete.
+_MANIFEST = 'MANIFEST'
+
+
+class FeatureCache:
+  """Stores feature dictionaries on disk, one uncompressed .npy per feature.
+
+  Entries are read back memory-mapped, so processes on the same machine share
+  a single copy through the OS page cache. Object arrays of bytes (e.g. species
+  identifiers) are stored as fixed-width byte strings and converted back on
+  read. Once the cache holds more than `max_size_bytes`, the least recently
+  used entries are evicted. Evicted entries are renamed out of the way before
+  they are deleted, so a concurrent `get` sees either a complete entry or none.
+  """
+
+  def __init__(self, cache_dir: str, max_size_bytes: Optional[int] = None):
+    """Initializes the cache.
+
+    Args:
+      cache_dir: Directory holding the cache entries. It is created if it does
+        not exist and may be shared by concurrent processes.
+      max_size_bytes: Maximum total size of the cache. If None, entries are
+        never evicted.
+    """
+    self._cache_dir = cache_dir
+    self._max_size_bytes = max_size_bytes
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def _entry_dir(self, key: str) -> str:
+    return os.path.join(
+        self._cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+  def get(self, key: str) -> Optional[FeatureDict]:
+    """Returns the features stored under `key`, or None if not cached."""
+    entry_dir = self._entry_dir(key)
+    features = {}
+    try:
+      with open(os.path.join(entry_dir, _MANIFEST)) as f:
+        feature_names = f.read().split()
+      for feature_name in feature_names:
+        feature = np.load(os.path.join(entry_dir, f'{feature_name}.npy'),
+                          mmap_mode='r', allow_pickle=False)
+        if feature.dtype.kind == 'S':
+          feature = np.array(feature, dtype=np.object_)
+        features[feature_name] = feature
+      # Mark the entry as recently used.
+      os.utime(entry_dir)
+    except FileNotFoundError:
+      # Either never cached or evicted by another process while reading.
+      return None
+    return features or None
+
+  def put(self, key: str, features: FeatureDict) -> None:
+    """Stores `features` under `key` and evicts old entries if needed."""
+    tmp_dir = tempfile.mkdtemp(prefix=_TMP_PREFIX, dir=self._cache_dir)
+    for feature_name, feature in features.items():
+      feature = np.asarray(feature)
+      if feature.dtype == np.object_:
+        feature = feature.astype(np.bytes_)
+      np.save(os.path.join(tmp_dir, f'{feature_name}.npy'), feature,
+              allow_pickle=False)
+    with open(os.path.join(tmp_dir, _MANIFEST), 'w') as f:
+      f.write('\n'.join(features))
+    try:
+      # Renaming makes the entry visible to readers only once complete.
+      os.rename(tmp_dir, self._entry_dir(key))
+    except OSError:
+      # Another process stored the same entry first.
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+    self._evict()
+
+  def _evict(self) -> None:
+    """Removes least recently used entries until the size limit is met."""
+    if self._max_size_bytes is None:
+      return
+    entries = []
+    for name in os.listdir(self._cache_dir):
+      if name.startswith(_TMP_PREFIX):
+        continue
+      entry_dir = os.path.join(self._cache_dir, name)
+      try:
+        size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+        entries.append((os.stat(entry_dir).st_mtime, size, entry_dir))
+      except FileNotFoundError:
+        continue
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, entry_dir in sorted(entries):
+      if total_size <= self._max_size_bytes:
+        break
+      logging.info('Evicting feature cache entry %s', entry_dir)
+      # Readers only look up entries by name, so once renamed the entry can be
+      # deleted without them ever seeing it partially removed.
+      evicted_dir = os.path.join(
+          self._cache_dir, f'{_TMP_PREFIX}evicted-{uuid.uuid4().hex}')
+      try:
+        os.rename(entry_dir, evicted_dir)
+      except FileNotFoundError:
+        pass  # Already evicted by another process.
+      else:
+        shutil.rmtree(evicted_dir, ignore_errors=True)
+      total_size -= size
@@ -0,0 +1,109 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for feature_cache."""
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from absl.testing import absltest
+from alphafold.data import feature_cache
+import numpy as np
+
+
+def _all_seq_features(num_seq, num_res):
+  return {
+      'msa_all_seq': np.arange(num_seq * num_res, dtype=np.int32).reshape(
+          num_seq, num_res),
+      'deletion_matrix_int_all_seq': np.zeros((num_seq, num_res), np.int32),
+      'msa_species_identifiers_all_seq': np.array(
+          [b''] + [b'HUMAN'] * (num_seq - 1), dtype=np.object_),
+  }
+
+
+class FeatureCacheTest(absltest.TestCase):
+
+  def test_round_trip(self):
+    cache = feature_cache.FeatureCache(
+        self.enter_context(tempfile.TemporaryDirectory()))
+    features = _all_seq_features(num_seq=5, num_res=7)
+
+    self.assertIsNone(cache.get('MKV'))
+    cache.put('MKV', features)
+    cached = cache.get('MKV')
+
+    self.assertSameElements(cached.keys(), features.keys())
+    for k, v in features.items():
+      self.assertEqual(cached[k].dtype, v.dtype)
+      np.testing.assert_array_equal(cached[k], v)
+    self.assertIsInstance(cached['msa_all_seq'], np.memmap)
+    self.assertIsNone(cache.get('MKVL'))
+
+  def test_evicts_least_recently_used(self):
+    cache_dir = self.enter_context(tempfile.TemporaryDirectory())
+    features = _all_seq_features(num_seq=100, num_res=100)
+    entry_size = sum(v.nbytes for v in features.values())
+    cache = feature_cache.FeatureCache(
+        cache_dir, max_size_bytes=int(2.5 * entry_size))
+
+    now = time.time()
+    for key, last_used in (('A', now - 20), ('B', now - 10)):
+      cache.put(key, features)
+      os.utime(cache._entry_dir(key), (last_used, last_used))
+    cache.get('A')
+    cache.put('C', features)
+
+    self.assertIsNotNone(cache.get('A'))
+    self.assertIsNone(cache.get('B'))
+    self.assertIsNotNone(cache.get('C'))
+
+  def test_get_racing_eviction_is_a_miss(self):
+    cache_dir = self.enter_context(tempfile.TemporaryDirectory())
+    features = _all_seq_features(num_seq=100, num_res=100)
+    entry_size = sum(v.nbytes for v in features.values())
+    cache = feature_cache.FeatureCache(
+        cache_dir, max_size_bytes=int(1.5 * entry_size))
+    cache.put('A', features)
+    os.utime(cache._entry_dir('A'), (0, 0))
+
+    rmtree = shutil.rmtree
+    cached_during_eviction = []
+    def rmtree_racing_get(path, **kwargs):
+      # Another process reads 'A' while it is partially removed.
+      os.remove(os.path.join(path, 'msa_all_seq.npy'))
+      cached_during_eviction.append(cache.get('A'))
+      rmtree(path, **kwargs)
+
+    with mock.patch.object(
+        feature_cache.shutil, 'rmtree', side_effect=rmtree_racing_get):
+      cache.put('B', features)
+
+    self.assertEqual(cached_during_eviction, [None])
+    self.assertIsNone(cache.get('A'))
+    self.assertIsNotNone(cache.get('B'))
+
+  def test_get_incomplete_entry_is_a_miss(self):
+    cache = feature_cache.FeatureCache(
+        self.enter_context(tempfile.TemporaryDirectory()))
+    cache.put('A', _all_seq_features(num_seq=5, num_res=7))
+    os.remove(os.path.join(cache._entry_dir('A'), 'msa_all_seq.npy'))
+
+    self.assertIsNone(cache.get('A'))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -171,9 +171,10 @@ def process_final(np_example: pipeline.FeatureDict) -> pipeline.FeatureDict:
 
 def _correct_msa_restypes(np_example):
   """Correct MSA restype to have the same order as residue_constants."""
-  new_order_list = residue_constants.MAP_HHBLITS_AATYPE_TO_OUR_AATYPE
-  np_example['msa'] = np.take(new_order_list, np_example['msa'], axis=0)
-  np_example['msa'] = np_example['msa'].astype(np.int32)
+  new_order = np.asarray(
+      residue_constants.MAP_HHBLITS_AATYPE_TO_OUR_AATYPE, dtype=np.int32)
+  # Taking from an int32 table avoids an int64 intermediate of the full MSA.
+  np_example['msa'] = np.take(new_order, np_example['msa'], axis=0)
   return np_example
 
 
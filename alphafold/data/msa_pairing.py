@@ -21,7 +21,6 @@ from alphafold.common import residue_constants
 from alphafold.data import pipeline
 import numpy as np
 import pandas as pd
-import scipy.linalg
 
 MSA_GAP_IDX = residue_constants.restypes_with_x_and_gap.index('-')
 SEQUENCE_GAP_CUTOFF = 0.5
@@ -252,15 +251,57 @@ def reorder_paired_rows(all_paired_msa_rows_dict: Dict[int, np.ndarray]
   return np.array(all_paired_msa_rows)
 
 
+def _block_diag_into(out: np.ndarray, arrs: Sequence[np.ndarray]):
+  """Writes `arrs` as consecutive diagonal blocks into the bottom of `out`."""
+  row = out.shape[0] - sum(x.shape[0] for x in arrs)
+  col = 0
+  for x in arrs:
+    out[row:row + x.shape[0], col:col + x.shape[1]] = x
+    row += x.shape[0]
+    col += x.shape[1]
+
+
 def block_diag(*arrs: np.ndarray, pad_value: float = 0.0) -> np.ndarray:
   """Like scipy.linalg.block_diag but with an optional padding value."""
-  ones_arrs = [np.ones_like(x) for x in arrs]
-  off_diag_mask = 1.0 - scipy.linalg.block_diag(*ones_arrs)
-  diag = scipy.linalg.block_diag(*arrs)
-  diag += (off_diag_mask * pad_value).astype(diag.dtype)
+  arrs = [np.atleast_2d(x) for x in arrs]
+  diag = np.full((sum(x.shape[0] for x in arrs), sum(x.shape[1] for x in arrs)),
+                 pad_value, dtype=np.result_type(*arrs))
+  _block_diag_into(diag, arrs)
   return diag
 
 
+def _merge_paired_and_unpaired_msa(
+    feats: Sequence[np.ndarray],
+    feats_all_seq: Sequence[np.ndarray],
+    pad_value: float) -> np.ndarray:
+  """Stacks the paired MSA on top of the block diagonalised unpaired MSA.
+
+  The merged array is allocated once at its final size and every chain block
+  is written into it in place, instead of block diagonalising and then
+  concatenating.
+
+  Args:
+    feats: Per-chain unpaired MSA features.
+    feats_all_seq: Per-chain paired MSA features, all with the same number of
+      rows.
+    pad_value: Value used off the diagonal in the unpaired part.
+
+  Returns:
+    Array of shape [num_paired + sum(num_unpaired), sum(num_res)].
+  """
+  num_paired = feats_all_seq[0].shape[0]
+  merged = np.full(
+      (num_paired + sum(x.shape[0] for x in feats),
+       sum(x.shape[1] for x in feats)),
+      pad_value, dtype=np.result_type(*feats, *feats_all_seq))
+  col = 0
+  for x in feats_all_seq:
+    merged[:num_paired, col:col + x.shape[1]] = x
+    col += x.shape[1]
+  _block_diag_into(merged, feats)
+  return merged
+
+
 def _correct_post_merged_feats(
     np_example: pipeline.FeatureDict,
     np_chains_list: Sequence[pipeline.FeatureDict],
@@ -295,16 +336,16 @@ def _correct_post_merged_feats(
     np_example['cluster_bias_mask'][0] = 1
 
     # Initialize Bert mask with masked out off diagonals.
-    msa_masks = [np.ones(x['msa'].shape, dtype=np.float32) for
-                 x in np_chains_list]
-    msa_masks_all_seq = [np.ones(x['msa_all_seq'].shape, dtype=np.float32) for
-                         x in np_chains_list]
-
-    msa_mask_block_diag = block_diag(
-        *msa_masks, pad_value=0)
-    msa_mask_all_seq = np.concatenate(msa_masks_all_seq, axis=1)
-    np_example['bert_mask'] = np.concatenate(
-        [msa_mask_all_seq, msa_mask_block_diag], axis=0)
+    bert_mask = np.zeros(np_example['msa'].shape, dtype=np.float32)
+    num_paired = np_chains_list[0]['msa_all_seq'].shape[0]
+    bert_mask[:num_paired] = 1
+    row, col = num_paired, 0
+    for chain in np_chains_list:
+      num_seq, num_res = chain['msa'].shape
+      bert_mask[row:row + num_seq, col:col + num_res] = 1
+      row += num_seq
+      col += num_res
+    np_example['bert_mask'] = bert_mask
   return np_example
 
 
@@ -332,13 +373,17 @@ def _pad_templates(chains: Sequence[pipeline.FeatureDict],
 
 def _merge_features_from_multiple_chains(
     chains: Sequence[pipeline.FeatureDict],
-    pair_msa_sequences: bool) -> pipeline.FeatureDict:
+    pair_msa_sequences: bool,
+    prepend_paired_msa: bool = False) -> pipeline.FeatureDict:
   """Merge features from multiple chains.
 
   Args:
     chains: A list of feature dictionaries that we want to merge.
     pair_msa_sequences: Whether to concatenate MSA features along the
       num_res dimension (if True), or to block diagonalize them (if False).
+    prepend_paired_msa: Whether to place the matching `_all_seq` features on
+      top of the block diagonalised MSA features. Only used if
+      pair_msa_sequences is False.
 
   Returns:
     A feature dictionary for the merged example.
@@ -350,6 +395,10 @@ def _merge_features_from_multiple_chains(
     if feature_name_split in MSA_FEATURES:
       if pair_msa_sequences or '_all_seq' in feature_name:
         merged_example[feature_name] = np.concatenate(feats, axis=1)
+      elif prepend_paired_msa:
+        merged_example[feature_name] = _merge_paired_and_unpaired_msa(
+            feats, [x[feature_name + '_all_seq'] for x in chains],
+            pad_value=MSA_PAD_VALUES[feature_name])
       else:
         merged_example[feature_name] = block_diag(
             *feats, pad_value=MSA_PAD_VALUES[feature_name])
@@ -391,21 +440,6 @@ def _merge_homomers_dense_msa(
   return chains
 
 
-def _concatenate_paired_and_unpaired_features(
-    example: pipeline.FeatureDict) -> pipeline.FeatureDict:
-  """Merges paired and block-diagonalised features."""
-  features = MSA_FEATURES
-  for feature_name in features:
-    if feature_name in example:
-      feat = example[feature_name]
-      feat_all_seq = example[feature_name + '_all_seq']
-      merged_feat = np.concatenate([feat_all_seq, feat], axis=0)
-      example[feature_name] = merged_feat
-  example['num_alignments'] = np.array(example['msa'].shape[0],
-                                       dtype=np.int32)
-  return example
-
-
 def merge_chain_features(np_chains_list: List[pipeline.FeatureDict],
                          pair_msa_sequences: bool,
                          max_templates: int) -> pipeline.FeatureDict:
@@ -423,11 +457,10 @@ def merge_chain_features(np_chains_list: List[pipeline.FeatureDict],
       np_chains_list, max_templates=max_templates)
   np_chains_list = _merge_homomers_dense_msa(np_chains_list)
   # Unpaired MSA features will be always block-diagonalised; paired MSA
-  # features will be concatenated.
+  # features will be concatenated and written above them.
   np_example = _merge_features_from_multiple_chains(
-      np_chains_list, pair_msa_sequences=False)
-  if pair_msa_sequences:
-    np_example = _concatenate_paired_and_unpaired_features(np_example)
+      np_chains_list, pair_msa_sequences=False,
+      prepend_paired_msa=pair_msa_sequences)
   np_example = _correct_post_merged_feats(
       np_example=np_example,
       np_chains_list=np_chains_list,
@@ -436,6 +469,25 @@ def merge_chain_features(np_chains_list: List[pipeline.FeatureDict],
   return np_example
 
 
+def _rows_as_void(arr: np.ndarray) -> np.ndarray:
+  """Views each row of a 2D array as a single opaque scalar for hashing."""
+  arr = np.ascontiguousarray(arr)
+  row_dtype = np.dtype((np.void, arr.dtype.itemsize * arr.shape[1]))
+  return arr.view(row_dtype).reshape(arr.shape[0])
+
+
+def _unpaired_rows_to_keep(msa: np.ndarray,
+                           msa_all_seq: np.ndarray) -> np.ndarray:
+  """Returns indices of `msa` rows that do not appear in `msa_all_seq`."""
+  if msa.shape[1] != msa_all_seq.shape[1] or not msa_all_seq.shape[0]:
+    return np.arange(msa.shape[0])
+  # Compare values rather than bytes when the two MSAs differ in dtype.
+  dtype = np.result_type(msa, msa_all_seq)
+  msa_rows = _rows_as_void(msa.astype(dtype, copy=False))
+  paired_rows = _rows_as_void(msa_all_seq.astype(dtype, copy=False))
+  return np.flatnonzero(~np.isin(msa_rows, paired_rows))
+
+
 def deduplicate_unpaired_sequences(
     np_chains: List[pipeline.FeatureDict]) -> List[pipeline.FeatureDict]:
   """Removes unpaired sequences which duplicate a paired sequence."""
@@ -444,14 +496,11 @@ def deduplicate_unpaired_sequences(
   msa_features = MSA_FEATURES
 
   for chain in np_chains:
-    # Convert the msa_all_seq numpy array to a tuple for hashing.
-    sequence_set = set(tuple(s) for s in chain['msa_all_seq'])
-    keep_rows = []
     # Go through unpaired MSA seqs and remove any rows that correspond to the
-    # sequences that are already present in the paired MSA.
-    for row_num, seq in enumerate(chain['msa']):
-      if tuple(seq) not in sequence_set:
-        keep_rows.append(row_num)
+    # sequences that are already present in the paired MSA. Each row is viewed
+    # as a single fixed-width scalar so membership is tested in bulk instead of
+    # hashing one Python tuple per row.
+    keep_rows = _unpaired_rows_to_keep(chain['msa'], chain['msa_all_seq'])
     for feature_name in feature_names:
       if feature_name in msa_features:
         chain[feature_name] = chain[feature_name][keep_rows]
@@ -0,0 +1,115 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for msa_pairing."""
+
+from absl.testing import absltest
+from alphafold.data import msa_pairing
+import numpy as np
+import scipy.linalg
+
+
+def _reference_keep_rows(msa, msa_all_seq):
+  sequence_set = set(tuple(s) for s in msa_all_seq)
+  return [i for i, seq in enumerate(msa) if tuple(seq) not in sequence_set]
+
+
+def _random_chain(rng, num_res, num_seq, num_seq_all_seq):
+  msa_all_seq = rng.integers(0, 4, size=(num_seq_all_seq, num_res),
+                             dtype=np.int32)
+  msa = rng.integers(0, 4, size=(num_seq, num_res), dtype=np.int32)
+  # Copy some of the paired rows into the unpaired MSA, including repeats.
+  duplicate_from = rng.integers(0, num_seq_all_seq, size=num_seq // 3)
+  duplicate_to = rng.choice(num_seq, size=num_seq // 3, replace=False)
+  msa[duplicate_to] = msa_all_seq[duplicate_from]
+  return {
+      'msa': msa,
+      'msa_mask': np.ones_like(msa, dtype=np.float32),
+      'deletion_matrix': rng.random(msa.shape).astype(np.float32),
+      'msa_all_seq': msa_all_seq,
+      'num_alignments': np.asarray(num_seq, dtype=np.int32),
+  }
+
+
+class MsaPairingTest(absltest.TestCase):
+
+  def test_deduplicate_unpaired_sequences_matches_tuple_reference(self):
+    rng = np.random.default_rng(0)
+    chains = [_random_chain(rng, num_res=3, num_seq=200, num_seq_all_seq=50),
+              _random_chain(rng, num_res=17, num_seq=90, num_seq_all_seq=30)]
+    expected = [
+        {k: v[_reference_keep_rows(c['msa'], c['msa_all_seq'])]
+         for k, v in c.items() if k in msa_pairing.MSA_FEATURES}
+        for c in chains]
+
+    deduplicated = msa_pairing.deduplicate_unpaired_sequences(chains)
+
+    for chain, expected_chain in zip(deduplicated, expected):
+      for k, v in expected_chain.items():
+        np.testing.assert_array_equal(chain[k], v)
+      self.assertEqual(chain['num_alignments'], len(expected_chain['msa']))
+
+  def test_deduplicate_unpaired_sequences_compares_values_across_dtypes(self):
+    msa_all_seq = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.int64)
+    msa = np.array([[4, 5, 6], [1, 2, 4], [1, 2, 3]], dtype=np.int32)
+    chain = {'msa': msa, 'msa_all_seq': msa_all_seq}
+
+    msa_pairing.deduplicate_unpaired_sequences([chain])
+
+    np.testing.assert_array_equal(chain['msa'], [[1, 2, 4]])
+    self.assertEqual(chain['num_alignments'], 1)
+
+  def test_block_diag_matches_scipy_with_padding(self):
+    arrs = [np.arange(6, dtype=np.int32).reshape(2, 3),
+            np.arange(4, dtype=np.int32).reshape(4, 1)]
+    ones_mask = scipy.linalg.block_diag(*[np.ones_like(x) for x in arrs])
+    expected = scipy.linalg.block_diag(*arrs) + (1 - ones_mask) * 21
+
+    diag = msa_pairing.block_diag(*arrs, pad_value=21)
+
+    np.testing.assert_array_equal(diag, expected)
+    self.assertEqual(diag.dtype, np.int32)
+
+  def test_merge_chain_features_stacks_paired_on_block_diag(self):
+    rng = np.random.default_rng(1)
+    chains = []
+    for entity_id, (num_res, num_seq) in enumerate([(4, 3), (2, 5)], start=1):
+      chains.append({
+          'msa': rng.integers(0, 21, (num_seq, num_res), dtype=np.int32),
+          'msa_all_seq': rng.integers(0, 21, (6, num_res), dtype=np.int32),
+          'msa_mask': np.ones((num_seq, num_res), dtype=np.float32),
+          'msa_mask_all_seq': np.ones((6, num_res), dtype=np.float32),
+          'aatype': np.zeros(num_res, dtype=np.int32),
+          'entity_id': np.full(num_res, entity_id),
+      })
+
+    example = msa_pairing.merge_chain_features(
+        [dict(c) for c in chains], pair_msa_sequences=True, max_templates=4)
+
+    gap = msa_pairing.MSA_GAP_IDX
+    expected_msa = np.concatenate([
+        np.concatenate([c['msa_all_seq'] for c in chains], axis=1),
+        np.block([[chains[0]['msa'], np.full((3, 2), gap)],
+                  [np.full((5, 4), gap), chains[1]['msa']]])])
+    np.testing.assert_array_equal(example['msa'], expected_msa)
+    expected_bert_mask = np.concatenate([
+        np.ones((6, 6)), np.block([[np.ones((3, 4)), np.zeros((3, 2))],
+                                   [np.zeros((5, 4)), np.ones((5, 2))]])])
+    np.testing.assert_array_equal(example['bert_mask'], expected_bert_mask)
+    self.assertEqual(example['bert_mask'].dtype, np.float32)
+    self.assertEqual(example['num_alignments'], 14)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -21,11 +21,12 @@ import dataclasses
 import json
 import os
 import tempfile
-from typing import Mapping, MutableMapping, Sequence
+from typing import Mapping, MutableMapping, Optional, Sequence
 
 from absl import logging
 from alphafold.common import protein
 from alphafold.common import residue_constants
+from alphafold.data import feature_cache
 from alphafold.data import feature_processing
 from alphafold.data import msa_pairing
 from alphafold.data import parsers
@@ -155,6 +156,30 @@ def add_assembly_features(
   return new_all_chain_features
 
 
+def assemble_features(
+    all_chain_features: MutableMapping[str, pipeline.FeatureDict]
+    ) -> pipeline.FeatureDict:
+  """Pairs and merges per-chain features into the features of the complex.
+
+  Args:
+    all_chain_features: A dictionary which maps chain_id to the features of that
+      chain, as output by DataPipeline.process_chain. The chain features are
+      modified in place.
+
+  Returns:
+    The features of the whole complex.
+  """
+  all_chain_features = add_assembly_features(all_chain_features)
+
+  np_example = feature_processing.pair_and_merge(
+      all_chain_features=all_chain_features)
+
+  # Pad MSA to avoid zero-sized extra_msa.
+  np_example = pad_msa(np_example, 512)
+
+  return np_example
+
+
 def pad_msa(np_example, min_num_seq):
   np_example = dict(np_example)
   num_seq = np_example['msa'].shape[0]
@@ -175,7 +200,9 @@ class DataPipeline:
                jackhmmer_binary_path: str,
                uniprot_database_path: str,
                max_uniprot_hits: int = 50000,
-               use_precomputed_msas: bool = False):
+               use_precomputed_msas: bool = False,
+               all_seq_feature_cache: Optional[
+                   feature_cache.FeatureCache] = None):
     """Initializes the data pipeline.
 
     Args:
@@ -186,6 +213,8 @@ class DataPipeline:
         will be searched with jackhmmer and used for MSA pairing.
       max_uniprot_hits: The maximum number of hits to return from uniprot.
       use_precomputed_msas: Whether to use pre-existing MSAs; see run_alphafold.
+      all_seq_feature_cache: Optional cache of the uniprot pairing features,
+        keyed by chain sequence, that is shared between prediction targets.
     """
     self._monomer_data_pipeline = monomer_data_pipeline
     self._uniprot_msa_runner = jackhmmer.Jackhmmer(
@@ -193,6 +222,7 @@ class DataPipeline:
         database_path=uniprot_database_path)
     self._max_uniprot_hits = max_uniprot_hits
     self.use_precomputed_msas = use_precomputed_msas
+    self._all_seq_feature_cache = all_seq_feature_cache
 
   def _process_single_chain(
       self,
@@ -216,11 +246,56 @@ class DataPipeline:
       # We only construct the pairing features if there are 2 or more unique
       # sequences.
       if not is_homomer_or_monomer:
-        all_seq_msa_features = self._all_seq_msa_features(chain_fasta_path,
-                                                          chain_msa_output_dir)
+        all_seq_msa_features = self._cached_all_seq_msa_features(
+            sequence, chain_fasta_path, chain_msa_output_dir)
         chain_features.update(all_seq_msa_features)
     return chain_features
 
+  def process_chain(
+      self,
+      chain_id: str,
+      sequence: str,
+      description: str,
+      msa_output_dir: str,
+      is_homomer_or_monomer: bool) -> pipeline.FeatureDict:
+    """Computes the multimer features of a single chain.
+
+    Args:
+      chain_id: PDB-format chain ID, naming the chain's MSA output directory.
+      sequence: The chain's amino acid sequence.
+      description: The chain's FASTA description.
+      msa_output_dir: Directory in which a subdirectory for the chain is made.
+      is_homomer_or_monomer: Whether the complex has a single unique sequence,
+        in which case the uniprot MSA features used for pairing are skipped.
+
+    Returns:
+      The chain's features, to be combined with those of the other chains by
+      assemble_features.
+    """
+    chain_features = self._process_single_chain(
+        chain_id=chain_id,
+        sequence=sequence,
+        description=description,
+        msa_output_dir=msa_output_dir,
+        is_homomer_or_monomer=is_homomer_or_monomer)
+    return convert_monomer_features(chain_features, chain_id=chain_id)
+
+  def _cached_all_seq_msa_features(self, sequence, input_fasta_path,
+                                   msa_output_dir):
+    """Get MSA features for pairing, reusing them from the cache if present."""
+    if self._all_seq_feature_cache is None:
+      return self._all_seq_msa_features(input_fasta_path, msa_output_dir)
+
+    cache_key = '\n'.join((self._uniprot_msa_runner.database_path,
+                           str(self._max_uniprot_hits), sequence))
+    feats = self._all_seq_feature_cache.get(cache_key)
+    if feats is not None:
+      logging.info('Using cached uniprot MSA features for %s', sequence)
+      return feats
+    feats = self._all_seq_msa_features(input_fasta_path, msa_output_dir)
+    self._all_seq_feature_cache.put(cache_key, feats)
+    return feats
+
   def _all_seq_msa_features(self, input_fasta_path, msa_output_dir):
     """Get MSA features for unclustered uniprot, for pairing."""
     out_path = os.path.join(msa_output_dir, 'uniprot_hits.sto')
@@ -261,24 +336,13 @@ class DataPipeline:
         all_chain_features[chain_id] = copy.deepcopy(
             sequence_features[fasta_chain.sequence])
         continue
-      chain_features = self._process_single_chain(
+      chain_features = self.process_chain(
           chain_id=chain_id,
           sequence=fasta_chain.sequence,
           description=fasta_chain.description,
           msa_output_dir=msa_output_dir,
           is_homomer_or_monomer=is_homomer_or_monomer)
-
-      chain_features = convert_monomer_features(chain_features,
-                                                chain_id=chain_id)
       all_chain_features[chain_id] = chain_features
       sequence_features[fasta_chain.sequence] = chain_features
 
-    all_chain_features = add_assembly_features(all_chain_features)
-
-    np_example = feature_processing.pair_and_merge(
-        all_chain_features=all_chain_features)
-
-    # Pad MSA to avoid zero-sized extra_msa.
-    np_example = pad_msa(np_example, 512)
-
-    return np_example
+    return assemble_features(all_chain_features)
@@ -0,0 +1,262 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Splits long single chains into overlapping windows and stitches them.
+
+Chains that are too long to predict at once are predicted as overlapping
+windows of residues. The features of each window are cropped from the
+features of the full chain, so the data pipeline runs once, and the predicted
+windows are superposed on their overlaps to assemble the full chain.
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from alphafold.common import protein
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+import numpy as np
+
+# A window of residues [start, end) of the full chain.
+Window = Tuple[int, int]
+
+# Minimum number of residues shared by consecutive windows, as three CA atoms
+# are needed to superpose them.
+MIN_OVERLAP = 3
+
+# Axis over residues of the monomer features that are cropped.
+_RESIDUE_AXES = {
+    'aatype': 0,
+    'between_segment_residues': 0,
+    'residue_index': 0,
+    'seq_length': 0,
+    'num_alignments': 0,
+    'msa': 1,
+    'deletion_matrix_int': 1,
+    'template_aatype': 1,
+    'template_all_atom_masks': 1,
+    'template_all_atom_positions': 1,
+}
+
+
+def _check_overlap(window_size: int, overlap: int) -> None:
+  if overlap < MIN_OVERLAP:
+    raise ValueError(f'The overlap {overlap} must be at least {MIN_OVERLAP} '
+                     'residues to superpose the windows.')
+  if overlap >= window_size:
+    raise ValueError(f'The overlap {overlap} must be smaller than the window '
+                     f'size {window_size}.')
+
+
+def _windows_from_cuts(cuts: Sequence[int], num_res: int,
+                       overlap: int) -> List[Window]:
+  """Makes windows that overlap by `overlap` residues around each cut."""
+  bounds = [0, *cuts, num_res]
+  return [(max(start - overlap // 2, 0),
+           min(end + overlap - overlap // 2, num_res))
+          for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def fixed_stride_windows(num_res: int, window_size: int,
+                         overlap: int) -> List[Window]:
+  """Splits a chain into windows of equal size.
+
+  Args:
+    num_res: Number of residues of the chain.
+    window_size: Maximum number of residues of a window.
+    overlap: Number of residues shared by consecutive windows.
+
+  Returns:
+    The fewest windows of at most `window_size` residues that cover the chain,
+    a single one if the chain fits in one.
+  """
+  _check_overlap(window_size, overlap)
+  # Interior windows extend their segment by the whole overlap and edge
+  # windows by half of it, so add windows until the largest one fits.
+  num_windows = math.ceil(max(num_res - overlap, 1) / (window_size - overlap))
+  while True:
+    cuts = [round(i * num_res / num_windows) for i in range(1, num_windows)]
+    windows = _windows_from_cuts(cuts, num_res, overlap)
+    if max(end - start for start, end in windows) <= window_size:
+      return windows
+    num_windows += 1
+
+
+def domain_windows(pae: np.ndarray, window_size: int,
+                   overlap: int) -> List[Window]:
+  """Splits a chain into windows that end between its domains.
+
+  Each window ends where the predicted aligned error between the residues
+  before and after the end is highest, i.e. where the chain is least confident
+  about the relative position of both sides, while keeping every window
+  between half and all of `window_size` residues.
+
+  Args:
+    pae: [num_res, num_res] predicted aligned error of an existing model of
+      the chain, e.g. from the AlphaFold Database.
+    window_size: Maximum number of residues of a window.
+    overlap: Number of residues shared by consecutive windows.
+
+  Returns:
+    Windows of at most `window_size` residues that cover the chain.
+  """
+  _check_overlap(window_size, overlap)
+  num_res = pae.shape[0]
+  segment_size = window_size - overlap
+  flank = max(overlap, 1)
+
+  def cut_score(cut):
+    before = slice(max(cut - flank, 0), cut)
+    after = slice(cut, min(cut + flank, num_res))
+    return np.mean(pae[before, after]) + np.mean(pae[after, before])
+
+  cuts = []
+  cut = 0
+  while num_res - cut > segment_size:
+    candidates = range(cut + max(segment_size // 2, 1),
+                       min(cut + segment_size, num_res - 1) + 1)
+    cut = max(candidates, key=cut_score)
+    cuts.append(cut)
+  return _windows_from_cuts(cuts, num_res, overlap)
+
+
+def crop_features(feature_dict: pipeline.FeatureDict,
+                  window: Window) -> pipeline.FeatureDict:
+  """Crops the monomer features of a chain to a window of its residues.
+
+  The residue indices of the full chain are kept, so that the structures of
+  the windows are numbered as the full chain.
+
+  Args:
+    feature_dict: Features of the full chain as output by the data pipeline.
+    window: The residues to keep.
+
+  Returns:
+    The features of the window.
+  """
+  start, end = window
+  cropped = {}
+  for k, v in feature_dict.items():
+    if k in _RESIDUE_AXES:
+      v = np.take(v, np.arange(start, end), axis=_RESIDUE_AXES[k])
+    elif k in ('sequence', 'template_sequence'):
+      v = np.array([s[start:end] for s in v], dtype=np.object_)
+    cropped[k] = v
+  cropped['seq_length'] = np.full_like(cropped['seq_length'], end - start)
+  return cropped
+
+
+def _superpose(mobile: np.ndarray, target: np.ndarray,
+               weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float]:
+  """Finds the rigid transform of `mobile` onto `target`.
+
+  Args:
+    mobile: [num_points, 3] the points to move.
+    target: [num_points, 3] the points to move them to.
+    weights: [num_points] mask of the points to superpose.
+
+  Returns:
+    The rotation and translation such that `mobile @ rotation + translation`
+    is closest to `target`, and the root mean square deviation after the
+    superposition.
+  """
+  mobile, target = mobile[weights > 0], target[weights > 0]
+  mobile_center, target_center = mobile.mean(axis=0), target.mean(axis=0)
+  u, _, vt = np.linalg.svd((mobile - mobile_center).T @ (target - target_center))
+  # Avoid reflections.
+  d = np.sign(np.linalg.det(u @ vt))
+  rotation = u @ np.diag([1., 1., d]) @ vt
+  translation = target_center - mobile_center @ rotation
+  rmsd = np.sqrt(np.mean(np.sum(
+      (mobile @ rotation + translation - target)**2, axis=-1)))
+  return rotation, translation, float(rmsd)
+
+
+def stitch(windows: Sequence[Window],
+           predictions: Sequence[protein.Protein],
+           num_res: Optional[int] = None,
+           ) -> Tuple[protein.Protein, List[float]]:
+  """Assembles the predicted structures of windows into the full chain.
+
+  Each window is superposed on the previous one using the CA atoms of their
+  overlap. Each residue of an overlap takes its coordinates and confidence
+  from the window whose edge it is furthest from, so the chain is cut in the
+  middle of every overlap.
+
+  Args:
+    windows: The windows, ordered along the chain.
+    predictions: The predicted structure of each window, with the pLDDT in its
+      B-factors.
+    num_res: Number of residues of the full chain. Defaults to the end of the
+      last window.
+
+  Returns:
+    The structure of the full chain and the CA RMSD of each overlap after
+    superposition, which indicates how consistent the windows are.
+
+  Raises:
+    ValueError: If consecutive windows share fewer than MIN_OVERLAP CA atoms.
+  """
+  if len(windows) != len(predictions):
+    raise ValueError(f'Got {len(predictions)} predictions for {len(windows)} '
+                     'windows.')
+  if num_res is None:
+    num_res = windows[-1][1]
+  ca = residue_constants.atom_order['CA']
+
+  positions = np.zeros((num_res, residue_constants.atom_type_num, 3))
+  atom_mask = np.zeros((num_res, residue_constants.atom_type_num))
+  aatype = np.zeros(num_res, dtype=np.int32)
+  residue_index = np.zeros(num_res, dtype=np.int32)
+  b_factors = np.zeros((num_res, residue_constants.atom_type_num))
+  rmsds = []
+  # The transformed coordinates of the whole previous window, as only those up
+  # to the middle of the overlap are kept in `positions`.
+  prev_positions = prev_mask = None
+  for i, ((start, end), prediction) in enumerate(zip(windows, predictions)):
+    if prediction.aatype.shape[0] != end - start:
+      raise ValueError(f'The prediction of window {start}-{end} has '
+                       f'{prediction.aatype.shape[0]} residues.')
+    window_positions = prediction.atom_positions
+    if i:
+      prev_start, prev_end = windows[i - 1]
+      weights = (prediction.atom_mask[:prev_end - start, ca] *
+                 prev_mask[start - prev_start:, ca])
+      if np.sum(weights > 0) < MIN_OVERLAP:
+        raise ValueError(f'Window {start}-{end} shares fewer than '
+                         f'{MIN_OVERLAP} CA atoms with the previous window.')
+      rotation, translation, rmsd = _superpose(
+          window_positions[:prev_end - start, ca],
+          prev_positions[start - prev_start:, ca], weights)
+      window_positions = window_positions @ rotation + translation
+      rmsds.append(rmsd)
+    prev_positions, prev_mask = window_positions, prediction.atom_mask
+    # Keep the residues up to the middle of the overlaps with the neighbours.
+    first = (start + windows[i - 1][1]) // 2 if i else start
+    last = ((windows[i + 1][0] + end) // 2 if i + 1 < len(windows) else end)
+    kept = slice(first - start, last - start)
+    positions[first:last] = window_positions[kept]
+    atom_mask[first:last] = prediction.atom_mask[kept]
+    aatype[first:last] = prediction.aatype[kept]
+    residue_index[first:last] = prediction.residue_index[kept]
+    b_factors[first:last] = prediction.b_factors[kept]
+
+  stitched = protein.Protein(
+      atom_positions=positions * atom_mask[..., None],
+      aatype=aatype,
+      atom_mask=atom_mask,
+      residue_index=residue_index,
+      chain_index=np.zeros(num_res, dtype=np.int32),
+      b_factors=b_factors)
+  return stitched, rmsds
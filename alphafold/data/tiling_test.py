@@ -0,0 +1,164 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for tiling."""
+
+import dataclasses
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.common import protein
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+from alphafold.data import tiling
+import numpy as np
+from scipy.spatial.transform import Rotation
+
+
+def _random_protein(num_res, seed=0):
+  rng = np.random.default_rng(seed)
+  # A random walk of CA atoms with the other atoms around them.
+  ca = np.cumsum(rng.normal(size=(num_res, 3)) * 2., axis=0)
+  positions = ca[:, None] + rng.normal(
+      size=(num_res, residue_constants.atom_type_num, 3))
+  return protein.Protein(
+      atom_positions=positions,
+      aatype=rng.integers(0, 20, num_res).astype(np.int32),
+      atom_mask=np.ones((num_res, residue_constants.atom_type_num)),
+      residue_index=np.arange(1, num_res + 1, dtype=np.int32),
+      chain_index=np.zeros(num_res, dtype=np.int32),
+      b_factors=rng.uniform(
+          0, 100, (num_res, 1)).repeat(residue_constants.atom_type_num, 1))
+
+
+def _predict_windows(full, windows):
+  predictions = []
+  for i, (start, end) in enumerate(windows):
+    # Every window is predicted in its own frame.
+    rotation = Rotation.random(random_state=i).as_matrix()
+    predictions.append(protein.Protein(
+        atom_positions=full.atom_positions[start:end] @ rotation + i * 10.,
+        aatype=full.aatype[start:end],
+        atom_mask=full.atom_mask[start:end],
+        residue_index=full.residue_index[start:end],
+        chain_index=full.chain_index[start:end],
+        b_factors=full.b_factors[start:end]))
+  return predictions
+
+
+class TilingTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('single', 90, [(0, 90)]),
+      ('two', 150, [(0, 85), (65, 150)]),
+      ('three', 200, [(0, 77), (57, 143), (123, 200)]),
+      # Three windows of 80 new residues would make the middle one too large.
+      ('four', 250, [(0, 72), (52, 135), (115, 198), (178, 250)]),
+  )
+  def test_fixed_stride_windows(self, num_res, expected):
+    windows = tiling.fixed_stride_windows(num_res, window_size=100,
+                                          overlap=20)
+    self.assertEqual(windows, expected)
+    for start, end in windows:
+      self.assertLessEqual(end - start, 100)
+
+  @parameterized.parameters(
+      (3100, 1200, 200), (2200, 1200, 200), (5000, 1000, 300), (1001, 300, 100))
+  def test_fixed_stride_windows_fit_and_cover_chain(self, num_res, window_size,
+                                                    overlap):
+    windows = tiling.fixed_stride_windows(num_res, window_size, overlap)
+    self.assertEqual(windows[0][0], 0)
+    self.assertEqual(windows[-1][1], num_res)
+    for (_, end), (next_start, _) in zip(windows[:-1], windows[1:]):
+      self.assertGreaterEqual(end - next_start, overlap)
+    self.assertLessEqual(max(end - start for start, end in windows),
+                         window_size)
+
+  def test_domain_windows_end_between_domains(self):
+    # Two domains of 70 and 80 residues that are confident within but not
+    # between each other.
+    pae = np.full((150, 150), 30.)
+    pae[:70, :70] = 2.
+    pae[70:, 70:] = 2.
+    windows = tiling.domain_windows(pae, window_size=100, overlap=10)
+    self.assertEqual(windows, [(0, 75), (65, 150)])
+
+  def test_crop_features(self):
+    feature_dict = pipeline.make_sequence_features(
+        sequence='MAVLKG', description='test', num_res=6)
+    feature_dict['msa'] = np.arange(12).reshape(2, 6)
+    feature_dict['template_aatype'] = np.ones((1, 6, 22))
+    feature_dict['template_sequence'] = np.array([b'MAVLKG'], np.object_)
+
+    cropped = tiling.crop_features(feature_dict, (2, 5))
+    self.assertEqual(cropped['sequence'][0], b'VLK')
+    self.assertEqual(cropped['template_sequence'][0], b'VLK')
+    np.testing.assert_array_equal(cropped['residue_index'], [2, 3, 4])
+    np.testing.assert_array_equal(cropped['seq_length'], [3, 3, 3])
+    np.testing.assert_array_equal(cropped['msa'], [[2, 3, 4], [8, 9, 10]])
+    self.assertEqual(cropped['aatype'].shape, (3, 21))
+    self.assertEqual(cropped['template_aatype'].shape, (1, 3, 22))
+    self.assertEqual(feature_dict['sequence'][0], b'MAVLKG')
+
+  def test_stitch_recovers_full_chain(self):
+    full = _random_protein(150)
+    windows = tiling.fixed_stride_windows(150, window_size=100, overlap=20)
+    predictions = _predict_windows(full, windows)
+
+    stitched, rmsds = tiling.stitch(windows, predictions)
+    self.assertLen(rmsds, 1)
+    self.assertLess(rmsds[0], 1e-6)
+    _, _, rmsd = tiling._superpose(
+        stitched.atom_positions.reshape(-1, 3),
+        full.atom_positions.reshape(-1, 3), np.ones(150 * 37))
+    self.assertLess(rmsd, 1e-6)
+    np.testing.assert_array_equal(stitched.aatype, full.aatype)
+    np.testing.assert_array_equal(stitched.residue_index, full.residue_index)
+    np.testing.assert_array_equal(stitched.b_factors, full.b_factors)
+
+  def test_stitch_superposes_on_whole_overlap(self):
+    full = _random_protein(150)
+    windows = tiling.fixed_stride_windows(150, window_size=100, overlap=20)
+    self.assertEqual(windows, [(0, 85), (65, 150)])
+    # The second window disagrees with the first one only in the half of
+    # their overlap that it contributes to the stitched chain.
+    disagreeing = full.atom_positions.copy()
+    disagreeing[75:85] += np.random.default_rng(1).normal(
+        size=(10, residue_constants.atom_type_num, 3)) * 5.
+    predictions = _predict_windows(full, windows)
+    predictions[1] = _predict_windows(
+        dataclasses.replace(full, atom_positions=disagreeing), windows)[1]
+
+    stitched, rmsds = tiling.stitch(windows, predictions)
+    ca = residue_constants.atom_order['CA']
+    _, _, expected_rmsd = tiling._superpose(
+        disagreeing[65:85, ca], full.atom_positions[65:85, ca], np.ones(20))
+    self.assertGreater(expected_rmsd, 1.)
+    self.assertAlmostEqual(rmsds[0], expected_rmsd, places=5)
+    self.assertFalse(np.isnan(stitched.atom_positions).any())
+
+  @parameterized.parameters(0, 1, 2)
+  def test_small_overlaps_are_rejected(self, overlap):
+    with self.assertRaisesRegex(ValueError, 'at least 3'):
+      tiling.fixed_stride_windows(60, window_size=40, overlap=overlap)
+    with self.assertRaisesRegex(ValueError, 'at least 3'):
+      tiling.domain_windows(np.ones((60, 60)), window_size=40, overlap=overlap)
+    full = _random_protein(60)
+    windows = [(0, 30), (30 - overlap, 60)]
+    with self.assertRaisesRegex(ValueError, 'fewer than 3 CA atoms'):
+      tiling.stitch(windows, _predict_windows(full, windows))
+
+
+if __name__ == '__main__':
+  absltest.main()
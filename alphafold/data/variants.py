@@ -0,0 +1,106 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Derives features of sequence variants from the wild type's features."""
+
+import dataclasses
+import re
+from typing import Sequence
+
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+import numpy as np
+
+_MUTATION_REGEX = re.compile(r'^([A-Z])(\d+)([A-Z])$')
+
+
+@dataclasses.dataclass(frozen=True)
+class Mutation:
+  """A residue substitution, at a 1-based position as in `A123G`."""
+  wild_type: str
+  position: int
+  mutant: str
+
+  def __str__(self):
+    return f'{self.wild_type}{self.position}{self.mutant}'
+
+
+def parse_mutations(variant: str) -> Sequence[Mutation]:
+  """Parses a variant such as `A123G` or `A123G:L150P` into its mutations."""
+  mutations = []
+  for mutation_str in variant.strip().split(':'):
+    match = _MUTATION_REGEX.match(mutation_str.strip().upper())
+    if not match:
+      raise ValueError(f'Could not parse mutation "{mutation_str}" of variant '
+                       f'"{variant}". Expected e.g. "A123G".')
+    wild_type, position, mutant = match.groups()
+    for residue in (wild_type, mutant):
+      if residue not in residue_constants.restype_order_with_x:
+        raise ValueError(f'Unknown residue "{residue}" in variant "{variant}".')
+    mutations.append(Mutation(wild_type, int(position), mutant))
+  if len({m.position for m in mutations}) != len(mutations):
+    raise ValueError(f'Variant "{variant}" mutates a position more than once.')
+  return mutations
+
+
+def apply_mutations(sequence: str, mutations: Sequence[Mutation]) -> str:
+  """Returns `sequence` with the mutations applied, checking the wild type."""
+  residues = list(sequence)
+  for mutation in mutations:
+    if not 1 <= mutation.position <= len(sequence):
+      raise ValueError(f'Mutation {mutation} is outside of the sequence of '
+                       f'length {len(sequence)}.')
+    if residues[mutation.position - 1] != mutation.wild_type:
+      raise ValueError(
+          f'Mutation {mutation} does not match the wild type residue '
+          f'{residues[mutation.position - 1]} at position {mutation.position}.')
+    residues[mutation.position - 1] = mutation.mutant
+  return ''.join(residues)
+
+
+def make_variant_features(
+    wild_type_features: pipeline.FeatureDict,
+    mutations: Sequence[Mutation]) -> pipeline.FeatureDict:
+  """Makes monomer features of a variant from the wild type's features.
+
+  The MSA and templates of the wild type are reused; only the query sequence
+  is changed in `aatype`, `sequence` and the first (query) row of the MSA.
+  Substitutions do not move any residue, so the query-to-template alignment
+  encoded in the template features stays valid as is.
+
+  Args:
+    wild_type_features: Features output by pipeline.DataPipeline.process for
+      the wild type sequence. They are not modified.
+    mutations: The substitutions that make the variant.
+
+  Returns:
+    The features of the variant. Arrays that do not depend on the query
+    sequence are shared with `wild_type_features`.
+  """
+  wild_type_sequence = wild_type_features['sequence'][0].decode('utf-8')
+  sequence = apply_mutations(wild_type_sequence, mutations)
+
+  features = dict(wild_type_features)
+  features['aatype'] = residue_constants.sequence_to_onehot(
+      sequence=sequence,
+      mapping=residue_constants.restype_order_with_x,
+      map_unknown_to_x=True)
+  features['sequence'] = np.array([sequence.encode('utf-8')], dtype=np.object_)
+
+  msa = wild_type_features['msa'].copy()
+  for mutation in mutations:
+    msa[0, mutation.position - 1] = residue_constants.HHBLITS_AA_TO_ID[
+        mutation.mutant]
+  features['msa'] = msa
+  return features
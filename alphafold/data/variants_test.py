@@ -0,0 +1,77 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for variants."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+from alphafold.data import variants
+import numpy as np
+
+
+class VariantsTest(parameterized.TestCase):
+
+  def test_parse_mutations(self):
+    self.assertEqual(
+        variants.parse_mutations('a2g:L4P'),
+        [variants.Mutation('A', 2, 'G'), variants.Mutation('L', 4, 'P')])
+
+  @parameterized.named_parameters(
+      ('malformed', 'A2'),
+      ('unknown_residue', 'A2B'),
+      ('repeated_position', 'A2G:A2V'),
+  )
+  def test_parse_mutations_raises(self, variant):
+    with self.assertRaises(ValueError):
+      variants.parse_mutations(variant)
+
+  @parameterized.named_parameters(
+      ('wrong_wild_type', 'K2G'),
+      ('out_of_range', 'A9G'),
+  )
+  def test_apply_mutations_raises(self, variant):
+    with self.assertRaises(ValueError):
+      variants.apply_mutations('MAVL', variants.parse_mutations(variant))
+
+  def test_make_variant_features(self):
+    wild_type_features = pipeline.make_sequence_features(
+        sequence='MAVL', description='test', num_res=4)
+    msa = np.array([[residue_constants.HHBLITS_AA_TO_ID[r] for r in seq]
+                    for seq in ('MAVL', 'MSVL')], dtype=np.int32)
+    wild_type_features['msa'] = msa
+    wild_type_features['template_aatype'] = np.ones((1, 4, 22))
+
+    features = variants.make_variant_features(
+        wild_type_features, variants.parse_mutations('A2G'))
+
+    expected_features = pipeline.make_sequence_features(
+        sequence='MGVL', description='test', num_res=4)
+    np.testing.assert_array_equal(features['aatype'],
+                                  expected_features['aatype'])
+    self.assertEqual(features['sequence'][0], b'MGVL')
+    self.assertEqual(features['msa'][0, 1],
+                     residue_constants.HHBLITS_AA_TO_ID['G'])
+    np.testing.assert_array_equal(features['msa'][1:], msa[1:])
+    self.assertIs(features['template_aatype'],
+                  wild_type_features['template_aatype'])
+    # The wild type features are left untouched.
+    self.assertEqual(wild_type_features['sequence'][0], b'MAVL')
+    self.assertEqual(wild_type_features['msa'][0, 1],
+                     residue_constants.HHBLITS_AA_TO_ID['A'])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -148,6 +148,10 @@ CONFIG_DIFFS.update(
 CONFIG = ml_collections.ConfigDict({
     'data': {
         'common': {
+            # Number of extra MSA sequences compared with the MSA cluster
+            # centres at a time, which bounds the memory of the cluster
+            # assignment of deep MSAs.
+            'cluster_assignment_chunk_size': 1024,
             'masked_msa': {
                 'profile_prob': 0.1,
                 'same_prob': 0.1,
@@ -155,6 +159,12 @@ CONFIG = ml_collections.ConfigDict({
             },
             'max_extra_msa': 1024,
             'msa_cluster_features': True,
+            # The MSA clusters and extra MSA sequences are only padded to the
+            # smallest of these sizes that fits the MSA of the target, capped
+            # at max_msa_clusters and max_extra_msa, so that shallow MSAs do
+            # not run through the full size and each size compiles once. An
+            # empty list always pads to the maxima.
+            'msa_depth_buckets': [32, 64, 128, 256, 512, 1024, 2048, 5120],
             'num_recycle': 3,
             'reduce_msa_clusters_by_max_templates': False,
             'resample_msa_in_recycling': True,
@@ -169,6 +179,9 @@ CONFIG = ml_collections.ConfigDict({
                 'deletion_matrix'
             ],
             'use_templates': False,
+            # Whether to process features with the NumPy pipeline instead of
+            # the TensorFlow one. Only affects NumPy feature dicts.
+            'use_numpy_pipeline': False,
         },
         'eval': {
             'feat': {
@@ -378,8 +391,28 @@ CONFIG = ml_collections.ConfigDict({
             }
         },
         'global_config': {
+            # If set, attention is computed over chunks of at most this many
+            # queries and keys, trading speed for a smaller peak memory.
+            'attention_chunk_size': None,
+            # If set, TriangleMultiplication and OuterProductMean compute at
+            # most this many rows of their pair update at a time.
+            'pair_chunk_size': None,
+            # If set and pair_chunk_size is not, the chunk sizes of
+            # TriangleMultiplication and OuterProductMean are chosen so that
+            # their intermediate activations fit in this many MiB.
+            'pair_chunk_memory_budget_mb': None,
+            # Whether to run the Evoformer in bfloat16, and whether to return
+            # its representations in bfloat16 instead of float32.
+            'bfloat16': False,
+            'bfloat16_output': False,
+            # Whether RunModel.process_features removes the empty template
+            # slots, which the model would only mask out.
+            'crop_empty_templates': True,
             'deterministic': False,
             'multimer_mode': False,
+            # Whether to shard the MSA and pair activations across the local
+            # devices along residues, see sharding.py.
+            'shard_residues': False,
             'subbatch_size': 4,
             'use_remat': False,
             'zero_init': True,
@@ -455,7 +488,21 @@ CONFIG = ml_collections.ConfigDict({
                 'weight': 2.0
             },
         },
+        # Number of ensemble members whose representations are computed at
+        # once with vmap, which is faster but takes as many times the memory
+        # of the Evoformer activations.
+        'ensemble_batch_size': 1,
         'num_recycle': 3,
+        # Dot-separated paths of the outputs returned by RunModel.predict, e.g.
+        # 'plddt' or 'structure_module.final_atom_positions'. Heads that no
+        # selected output depends on are pruned from the compiled model. None
+        # returns all outputs.
+        'outputs': None,
+        # As in the multimer models, a positive value stops recycling early if
+        # the difference in pairwise CA distances between recycling steps is
+        # less than the tolerance. A negative value always runs `num_recycle`
+        # recycling iterations, as the published monomer models did.
+        'recycle_early_stop_tolerance': -1.0,
         'resample_msa_in_recycling': True
     },
 })
@@ -610,10 +657,30 @@ CONFIG_MULTIMER = ml_collections.ConfigDict({
             },
         },
         'global_config': {
+            # If set, attention is computed over chunks of at most this many
+            # queries and keys, trading speed for a smaller peak memory.
+            'attention_chunk_size': None,
+            # If set, TriangleMultiplication and OuterProductMean compute at
+            # most this many rows of their pair update at a time.
+            'pair_chunk_size': None,
+            # If set and pair_chunk_size is not, the chunk sizes of
+            # TriangleMultiplication and OuterProductMean are chosen so that
+            # their intermediate activations fit in this many MiB.
+            'pair_chunk_memory_budget_mb': None,
+            # If set, the cluster assignment of the extra MSA is computed
+            # over chunks of extra sequences whose one-hot encodings and
+            # agreements fit in this many MiB.
+            'extra_msa_chunk_memory_budget_mb': None,
             'bfloat16': True,
             'bfloat16_output': False,
+            # Whether RunModel.process_features removes the empty template
+            # slots, which the model would only mask out.
+            'crop_empty_templates': True,
             'deterministic': False,
             'multimer_mode': True,
+            # Whether to shard the MSA and pair activations across the local
+            # devices along residues, see sharding.py.
+            'shard_residues': False,
             'subbatch_size': 4,
             'use_remat': False,
             'zero_init': True,
@@ -688,6 +755,11 @@ CONFIG_MULTIMER = ml_collections.ConfigDict({
         },
         'num_ensemble_eval': 1,
         'num_recycle': 20,
+        # Dot-separated paths of the outputs returned by RunModel.predict, e.g.
+        # 'plddt' or 'structure_module.final_atom_positions'. Heads that no
+        # selected output depends on are pruned from the compiled model. None
+        # returns all outputs.
+        'outputs': None,
         # A negative value indicates that no early stopping will occur, i.e.
         # the model will always run `num_recycle` number of recycling
         # iterations.  A positive value will enable early stopping if the
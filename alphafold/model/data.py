@@ -15,19 +15,165 @@
 """Convenience functions for reading data."""
 
 import io
+import json
 import os
+import threading
+import time
+from typing import Dict, Mapping
+
+from absl import logging
 from alphafold.model import utils
 import haiku as hk
 import numpy as np
 # Internal import (7716).
 
+# Suffix of the uncompressed, memory-mappable parameter files written by
+# convert_npz_params. Their index of arrays is stored next to them in a JSON
+# file with the same name and the `.json` suffix.
+MEMMAP_PARAMS_SUFFIX = '.bin'
+# Arrays are aligned in the memory-mappable files for efficient access.
+_MEMMAP_PARAMS_ALIGNMENT = 64
+
+_params_cache = {}
+_params_cache_lock = threading.Lock()
+
+
+def _memmap_params_index_path(path: str) -> str:
+  return os.path.splitext(path)[0] + '.json'
+
+
+def save_memmap_params(params: Mapping[str, np.ndarray], path: str) -> None:
+  """Writes flat parameters to an uncompressed, memory-mappable file.
+
+  Args:
+    params: Flat mapping from `scope//name` to the parameter array.
+    path: Path of the file to write, which should end with
+      MEMMAP_PARAMS_SUFFIX. The index of the arrays is written next to it.
+  """
+  index = {}
+  tmp_path = path + '.tmp'
+  with open(tmp_path, 'wb') as f:
+    for name, array in params.items():
+      array = np.ascontiguousarray(array)
+      offset = (-(-f.tell() // _MEMMAP_PARAMS_ALIGNMENT) *
+                _MEMMAP_PARAMS_ALIGNMENT)
+      f.seek(offset)
+      f.write(array.tobytes())
+      index[name] = {'offset': offset, 'dtype': array.dtype.str,
+                     'shape': list(array.shape)}
+  with open(_memmap_params_index_path(tmp_path), 'w') as f:
+    json.dump(index, f, indent=1, sort_keys=True)
+  # Rename the index last, so that the parameters are only found complete.
+  os.replace(tmp_path, path)
+  os.replace(_memmap_params_index_path(tmp_path),
+             _memmap_params_index_path(path))
+
+
+def load_memmap_params(path: str) -> Dict[str, np.ndarray]:
+  """Memory-maps flat parameters written by save_memmap_params.
+
+  The arrays are read-only views of the file, so processes that load the same
+  file share its pages in the OS page cache instead of holding copies.
+
+  Args:
+    path: Path of the file written by save_memmap_params.
+
+  Returns:
+    Flat mapping from `scope//name` to the memory-mapped parameter array.
+  """
+  with open(_memmap_params_index_path(path)) as f:
+    index = json.load(f)
+  buffer = np.memmap(path, dtype=np.uint8, mode='r')
+  params = {}
+  for name, entry in index.items():
+    dtype = np.dtype(entry['dtype'])
+    count = int(np.prod(entry['shape']))
+    params[name] = np.frombuffer(
+        buffer, dtype=dtype, count=count, offset=entry['offset']).reshape(
+            entry['shape'])
+  return params
+
+
+def convert_npz_params(npz_path: str) -> str:
+  """Converts a `.npz` parameter file to the memory-mappable format.
+
+  Args:
+    npz_path: Path of the `params_{model_name}.npz` file.
+
+  Returns:
+    The path of the written file, next to `npz_path`.
+  """
+  with np.load(npz_path, allow_pickle=False) as params:
+    output_path = os.path.splitext(npz_path)[0] + MEMMAP_PARAMS_SUFFIX
+    save_memmap_params({k: params[k] for k in params.files}, output_path)
+  return output_path
 
-def get_model_haiku_params(model_name: str, data_dir: str) -> hk.Params:
-  """Get the Haiku parameters from a model name."""
 
-  path = os.path.join(data_dir, 'params', f'params_{model_name}.npz')
+def get_model_params_path(model_name: str, data_dir: str) -> str:
+  """Returns the path of the parameters of a model.
 
+  The memory-mappable parameters are preferred over the `.npz` ones if they
+  were converted with convert_npz_params.
+
+  Args:
+    model_name: Name of the model.
+    data_dir: The AlphaFold data directory.
+
+  Returns:
+    The path of the memory-mappable parameters if they exist, else the path
+    of the `.npz` parameters.
+  """
+  path = os.path.join(data_dir, 'params', f'params_{model_name}')
+  if os.path.exists(_memmap_params_index_path(path + MEMMAP_PARAMS_SUFFIX)):
+    return path + MEMMAP_PARAMS_SUFFIX
+  return path + '.npz'
+
+
+def load_haiku_params(path: str) -> hk.Params:
+  """Loads Haiku parameters from a `.npz` or memory-mappable file.
+
+  Memory-mapped parameters are kept as NumPy arrays backed by the file and only
+  copied when transferred to the device.
+
+  Args:
+    path: Path of the parameters.
+
+  Returns:
+    The Haiku parameters.
+  """
+  if path.endswith(MEMMAP_PARAMS_SUFFIX):
+    return utils.flat_params_to_haiku(load_memmap_params(path),
+                                      copy_to_jax=False)
   with open(path, 'rb') as f:
     params = np.load(io.BytesIO(f.read()), allow_pickle=False)
-
   return utils.flat_params_to_haiku(params)
+
+
+def get_model_haiku_params(model_name: str, data_dir: str) -> hk.Params:
+  """Get the Haiku parameters from a model name.
+
+  Parameters are cached per file, so runners of the same model share them.
+
+  Args:
+    model_name: Name of the model.
+    data_dir: The AlphaFold data directory.
+
+  Returns:
+    The Haiku parameters of the model.
+  """
+  path = get_model_params_path(model_name, data_dir)
+  with _params_cache_lock:
+    if path not in _params_cache:
+      t_0 = time.time()
+      rss_0 = utils.host_rss_mib()
+      _params_cache[path] = load_haiku_params(path)
+      rss = utils.host_rss_mib()
+      logging.info(
+          'Loaded parameters of %s from %s in %.2fs, host RSS %.0f MiB '
+          '(%+.0f MiB)', model_name, path, time.time() - t_0, rss, rss - rss_0)
+    return _params_cache[path]
+
+
+def clear_params_cache() -> None:
+  with _params_cache_lock:
+    _params_cache.clear()
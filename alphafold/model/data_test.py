@@ -0,0 +1,96 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for data."""
+
+import os
+import tempfile
+
+from absl.testing import absltest
+from alphafold.model import data
+import numpy as np
+
+
+def _make_flat_params():
+  rng = np.random.default_rng(0)
+  return {
+      'alphafold/alphafold_iteration/evoformer//w': rng.normal(
+          size=(3, 5)).astype(np.float32),
+      'alphafold/alphafold_iteration/evoformer//b': rng.normal(
+          size=(5,)).astype(np.float32),
+      'alphafold/alphafold_iteration/heads//scale': np.array(
+          2., dtype=np.float32),
+      'alphafold/alphafold_iteration/heads//index': np.arange(
+          7, dtype=np.int32),
+  }
+
+
+def _is_memory_mapped(array):
+  while array is not None:
+    if isinstance(array, np.memmap):
+      return True
+    array = getattr(array, 'base', None)
+  return False
+
+
+class DataTest(absltest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.data_dir = self.enter_context(tempfile.TemporaryDirectory())
+    os.makedirs(os.path.join(self.data_dir, 'params'))
+    self.npz_path = os.path.join(self.data_dir, 'params', 'params_model_1.npz')
+    np.savez(self.npz_path, **_make_flat_params())
+    self.addCleanup(data.clear_params_cache)
+
+  def test_memmap_params_round_trip(self):
+    path = data.convert_npz_params(self.npz_path)
+    params = data.load_memmap_params(path)
+
+    expected = _make_flat_params()
+    self.assertSameElements(params.keys(), expected.keys())
+    for name, array in params.items():
+      with self.subTest(name):
+        self.assertTrue(_is_memory_mapped(array))
+        self.assertFalse(array.flags.writeable)
+        self.assertEqual(array.ctypes.data % 64, 0)
+        self.assertEqual(array.dtype, expected[name].dtype)
+        np.testing.assert_array_equal(array, expected[name])
+
+  def test_memmap_params_are_preferred(self):
+    self.assertEqual(
+        data.get_model_params_path('model_1', self.data_dir), self.npz_path)
+    path = data.convert_npz_params(self.npz_path)
+    self.assertEqual(data.get_model_params_path('model_1', self.data_dir), path)
+
+    npz_params = data.load_haiku_params(self.npz_path)
+    memmap_params = data.get_model_haiku_params('model_1', self.data_dir)
+    self.assertEqual(memmap_params.keys(), npz_params.keys())
+    for scope, scope_params in memmap_params.items():
+      for name, array in scope_params.items():
+        self.assertIsInstance(array, np.ndarray)
+        np.testing.assert_array_equal(array, npz_params[scope][name])
+
+  def test_params_are_cached(self):
+    params = data.get_model_haiku_params('model_1', self.data_dir)
+    self.assertIs(data.get_model_haiku_params('model_1', self.data_dir),
+                  params)
+    data.clear_params_cache()
+    self.assertIsNot(data.get_model_haiku_params('model_1', self.data_dir),
+                     params)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -14,23 +14,52 @@
 
 """Code to generate processed features."""
 import copy
-from typing import List, Mapping, Tuple
+from typing import TYPE_CHECKING, List, Mapping, Optional, Sequence, Tuple
 
-from alphafold.model.tf import input_pipeline
-from alphafold.model.tf import proteins_dataset
+from alphafold.common import residue_constants
+from alphafold.model import np_input_pipeline
+from alphafold.model.tf import shape_placeholders
 
 import ml_collections
 import numpy as np
-import tensorflow.compat.v1 as tf
+
+if TYPE_CHECKING:
+  import tensorflow.compat.v1 as tf  # pylint: disable=g-bad-import-order
 
 FeatureDict = Mapping[str, np.ndarray]
 
+NUM_RES = shape_placeholders.NUM_RES
+
+
+def _msa_depth_bucket(depth: int, buckets: Sequence[int],
+                      max_depth: int) -> int:
+  """Returns the smallest bucket that fits `depth`, at most `max_depth`."""
+  for bucket in sorted(buckets):
+    if bucket >= depth:
+      return min(bucket, max_depth)
+  return max_depth
+
 
 def make_data_config(
     config: ml_collections.ConfigDict,
     num_res: int,
+    num_msa: Optional[int] = None,
     ) -> Tuple[ml_collections.ConfigDict, List[str]]:
-  """Makes a data config for the input pipeline."""
+  """Makes a data config for the input pipeline.
+
+  If `num_msa` is given, the MSA clusters and extra MSA sequences are padded
+  to the smallest of `config.data.common.msa_depth_buckets` that fits them
+  instead of to the configured maxima. The same sequences are sampled either
+  way, as the maxima are only lowered to sizes the MSA does not exceed.
+
+  Args:
+    config: The model config.
+    num_res: The number of residues of the target.
+    num_msa: The number of sequences in the MSA of the target, if known.
+
+  Returns:
+    The data config and the names of the features it uses.
+  """
   cfg = copy.deepcopy(config.data)
 
   feature_names = cfg.common.unsupervised_features
@@ -40,15 +69,192 @@ def make_data_config(
   with cfg.unlocked():
     cfg.eval.crop_size = num_res
 
+    buckets = cfg.common.get('msa_depth_buckets')
+    if num_msa is not None and buckets:
+      num_templates = (cfg.eval.max_templates
+                       if cfg.common.reduce_msa_clusters_by_max_templates
+                       else 0)
+      max_clusters = cfg.eval.max_msa_clusters - num_templates
+      num_clusters = min(num_msa, max_clusters)
+      cfg.eval.max_msa_clusters = num_templates + _msa_depth_bucket(
+          num_clusters, buckets, max_clusters)
+      if cfg.common.max_extra_msa:
+        cfg.common.max_extra_msa = _msa_depth_bucket(
+            num_msa - num_clusters, buckets, cfg.common.max_extra_msa)
+
   return cfg, feature_names
 
 
-def tf_example_to_features(tf_example: tf.train.Example,
+def crop_empty_templates(processed_features: FeatureDict) -> FeatureDict:
+  """Removes the template slots that no ensemble member has a template in.
+
+  The input pipeline pads the templates to `max_templates` slots. Empty slots
+  are masked out in the model but still run through the template stack, and
+  their torsion angle rows through the Evoformer. Cropping them gives the same
+  predictions up to floating point rounding at a cost proportional to the
+  number of actual templates. Without templates, the model skips the template
+  embedding altogether.
+
+  Args:
+    processed_features: Features as output by np_example_to_features or
+      tf_example_to_features, with a leading ensemble dimension.
+
+  Returns:
+    The features with only the non-empty template slots.
+  """
+  if 'template_mask' not in processed_features:
+    return processed_features
+  keep = np.flatnonzero(np.any(processed_features['template_mask'], axis=0))
+  if len(keep) == processed_features['template_mask'].shape[1]:
+    return processed_features
+  return {k: np.take(v, keep, axis=1) if k.startswith('template_') else v
+          for k, v in processed_features.items()}
+
+
+def placeholder_features(num_res: int, num_msa: int,
+                         num_templates: int = 0) -> FeatureDict:
+  """Makes monomer features of the given sizes with placeholder values.
+
+  The features have the names, shapes and types of the features output by the
+  data pipeline for a poly-alanine target, so processing them gives the shapes
+  of the processed features of any target of these sizes, e.g. to compile the
+  model ahead of time.
+
+  Args:
+    num_res: The number of residues of the target.
+    num_msa: The number of sequences in its MSA, including the query.
+    num_templates: The number of its templates. Without templates, the data
+      pipeline outputs an empty one.
+
+  Returns:
+    The features as output by the data pipeline.
+  """
+  num_restypes = len(residue_constants.restypes_with_x_and_gap)
+  num_atoms = residue_constants.atom_type_num
+  num_slots = max(num_templates, 1)
+  template_mask = np.full((num_slots, num_res, num_atoms),
+                          float(num_templates > 0), np.float32)
+  return {
+      'aatype': np.eye(21, dtype=np.int32)[np.zeros(num_res, np.int32)],
+      'between_segment_residues': np.zeros(num_res, np.int32),
+      'domain_name': np.array([b'placeholder'], np.object_),
+      'residue_index': np.arange(num_res, dtype=np.int32),
+      'seq_length': np.full(num_res, num_res, np.int32),
+      'sequence': np.array([b'A' * num_res], np.object_),
+      'deletion_matrix_int': np.zeros((num_msa, num_res), np.int32),
+      'msa': np.zeros((num_msa, num_res), np.int32),
+      'num_alignments': np.full(num_res, num_msa, np.int32),
+      'msa_species_identifiers': np.array([b''] * num_msa, np.object_),
+      'template_aatype': np.zeros((num_slots, num_res, num_restypes),
+                                  np.float32),
+      'template_all_atom_masks': template_mask,
+      'template_all_atom_positions': np.zeros(
+          (num_slots, num_res, num_atoms, 3), np.float32),
+      'template_domain_names': np.array([b''] * num_slots, np.object_),
+      'template_sequence': np.array([b''] * num_slots, np.object_),
+      'template_sum_probs': np.zeros((num_slots, 1), np.float32),
+  }
+
+
+def stack_processed_features(
+    processed_features: Sequence[FeatureDict],
+    config: ml_collections.ConfigDict,
+    num_res: Optional[int] = None) -> FeatureDict:
+  """Pads the processed features of several targets and stacks them.
+
+  The features are padded with zeros as in the input pipeline, so the padded
+  residues, MSA sequences and templates are masked out in the model.
+
+  Args:
+    processed_features: Features of each target as output by
+      np_example_to_features or tf_example_to_features, with a leading
+      ensemble dimension.
+    config: The model config the features were processed with.
+    num_res: The number of residues to pad every target to. Defaults to the
+      number of residues of the longest target.
+
+  Returns:
+    The features with a new leading dimension over the targets.
+  """
+  longest = max(f['aatype'].shape[1] for f in processed_features)
+  if num_res is None:
+    num_res = longest
+  elif num_res < longest:
+    raise ValueError(f'Cannot pad targets of {longest} residues to {num_res}.')
+
+  stacked = {}
+  for k in processed_features[0]:
+    values = [f[k] for f in processed_features]
+    shape = np.max([v.shape for v in values], axis=0)
+    # The leading ensemble dimension is not part of the schema.
+    for i, dim in enumerate(config.data.eval.feat.get(k, ()), start=1):
+      if dim == NUM_RES:
+        shape[i] = num_res
+    stacked[k] = np.stack([
+        np.pad(v, [(0, n - m) for n, m in zip(shape, v.shape)])
+        for v in values])
+  return stacked
+
+
+def merge_empty_multimer_templates(np_example: FeatureDict) -> FeatureDict:
+  """Merges the identical empty template slots of multimer features.
+
+  The multimer model averages the embeddings of all template slots, including
+  the empty ones. Empty slots all have the same features and thus the same
+  embedding, so they are replaced by a single slot that is weighted by their
+  number in the `template_weight` feature. This gives the same predictions up
+  to floating point rounding with at most one empty slot to embed.
+
+  Args:
+    np_example: Features as output by the multimer data pipeline.
+
+  Returns:
+    The features with at most one empty template slot.
+  """
+  if 'template_all_atom_mask' not in np_example:
+    return np_example
+  masks = np_example['template_all_atom_mask']
+  empty = np.flatnonzero(~np.any(masks.reshape(masks.shape[0], -1), axis=1))
+  if len(empty) < 2:
+    return np_example
+  template_keys = [k for k, v in np_example.items()
+                   if k.startswith('template_') and np.ndim(v) and
+                   v.shape[0] == masks.shape[0]]
+  for k in template_keys:
+    if not all(np.array_equal(np_example[k][i], np_example[k][empty[0]])
+               for i in empty[1:]):
+      return np_example
+
+  keep = np.concatenate([np.flatnonzero(np.any(
+      masks.reshape(masks.shape[0], -1), axis=1)), empty[:1]])
+  weight = np.ones(len(keep), dtype=np.float32)
+  weight[-1] = len(empty)
+  merged = {k: v[keep] if k in template_keys else v
+            for k, v in np_example.items()}
+  merged['template_weight'] = weight
+  return merged
+
+
+def _import_tf_pipeline():
+  """Imports TensorFlow on first use, as importing it takes seconds."""
+  # pylint: disable=g-import-not-at-top
+  import tensorflow.compat.v1 as tf
+  from alphafold.model.tf import input_pipeline
+  from alphafold.model.tf import proteins_dataset
+  # pylint: enable=g-import-not-at-top
+  return tf, input_pipeline, proteins_dataset
+
+
+def tf_example_to_features(tf_example: 'tf.train.Example',
                            config: ml_collections.ConfigDict,
                            random_seed: int = 0) -> FeatureDict:
   """Converts tf_example to numpy feature dictionary."""
+  tf, input_pipeline, proteins_dataset = _import_tf_pipeline()
   num_res = int(tf_example.features.feature['seq_length'].int64_list.value[0])
-  cfg, feature_names = make_data_config(config, num_res=num_res)
+  num_msa = int(
+      tf_example.features.feature['num_alignments'].int64_list.value[0])
+  cfg, feature_names = make_data_config(
+      config, num_res=num_res, num_msa=num_msa)
 
   if 'deletion_matrix_int' in set(tf_example.features.feature):
     deletion_matrix_int = (
@@ -78,15 +284,35 @@ def tf_example_to_features(tf_example: tf.train.Example,
 def np_example_to_features(np_example: FeatureDict,
                            config: ml_collections.ConfigDict,
                            random_seed: int = 0) -> FeatureDict:
-  """Preprocesses NumPy feature dict using TF pipeline."""
+  """Preprocesses NumPy feature dict using the TF or the NumPy pipeline.
+
+  The NumPy pipeline is used if `config.data.common.use_numpy_pipeline` is set.
+
+  Args:
+    np_example: Features as output by the data pipeline.
+    config: The model config.
+    random_seed: The random seed of the pipeline.
+
+  Returns:
+    The processed features.
+  """
   np_example = dict(np_example)
   num_res = int(np_example['seq_length'][0])
-  cfg, feature_names = make_data_config(config, num_res=num_res)
+  cfg, feature_names = make_data_config(
+      config, num_res=num_res, num_msa=np_example['msa'].shape[0])
 
   if 'deletion_matrix_int' in np_example:
     np_example['deletion_matrix'] = (
         np_example.pop('deletion_matrix_int').astype(np.float32))
 
+  if cfg.common.use_numpy_pipeline:
+    return np_input_pipeline.process_np_example(
+        np_example=np_example,
+        data_config=cfg,
+        feature_names=feature_names,
+        random_seed=random_seed)
+
+  tf, input_pipeline, proteins_dataset = _import_tf_pipeline()
   tf_graph = tf.Graph()
   with tf_graph.as_default(), tf.device('/device:CPU:0'):
     tf.compat.v1.set_random_seed(random_seed)
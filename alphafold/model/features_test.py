@@ -0,0 +1,121 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for features."""
+
+from absl.testing import absltest
+from alphafold.model import config
+from alphafold.model import features
+from alphafold.model import modules_multimer
+import haiku as hk
+import jax
+import numpy as np
+
+
+def _make_multimer_templates(num_res, num_templates, num_empty_templates,
+                             seed=0):
+  """Makes random multimer template features padded with empty slots."""
+  rng = np.random.default_rng(seed)
+  num_slots = num_templates + num_empty_templates
+  mask = np.zeros((num_slots, num_res, 37), np.float32)
+  mask[:num_templates] = 1
+  aatype = np.zeros((num_slots, num_res), np.int32)
+  aatype[:num_templates] = rng.integers(0, 21, (num_templates, num_res))
+  return {
+      'aatype': rng.integers(0, 20, num_res).astype(np.int32),
+      'template_aatype': aatype,
+      'template_all_atom_mask': mask,
+      'template_all_atom_positions': mask[..., None] * rng.normal(
+          size=(num_slots, num_res, 37, 3)).astype(np.float32) * 10,
+  }
+
+
+class FeaturesTest(absltest.TestCase):
+
+  def test_crop_empty_templates(self):
+    template_mask = np.array([[1, 1, 0, 0], [1, 0, 0, 0]], np.float32)
+    processed_features = {
+        'template_mask': template_mask,
+        'template_aatype': np.arange(8).reshape(2, 4),
+        'msa_feat': np.ones((2, 3)),
+    }
+    cropped = features.crop_empty_templates(processed_features)
+    np.testing.assert_array_equal(cropped['template_mask'],
+                                  template_mask[:, :2])
+    np.testing.assert_array_equal(cropped['template_aatype'],
+                                  [[0, 1], [4, 5]])
+    self.assertIs(cropped['msa_feat'], processed_features['msa_feat'])
+
+  def test_stack_processed_features(self):
+    cfg = config.model_config('model_1')
+    short = {'aatype': np.ones((2, 5), np.int32),
+             'msa_feat': np.ones((2, 3, 5, 49), np.float32),
+             'seq_length': np.array([5, 5], np.int32)}
+    long = {'aatype': np.ones((2, 7), np.int32),
+            'msa_feat': np.ones((2, 4, 7, 49), np.float32),
+            'seq_length': np.array([7, 7], np.int32)}
+    stacked = features.stack_processed_features([short, long], cfg, num_res=8)
+    self.assertEqual(stacked['aatype'].shape, (2, 2, 8))
+    self.assertEqual(stacked['msa_feat'].shape, (2, 2, 4, 8, 49))
+    np.testing.assert_array_equal(stacked['seq_length'], [[5, 5], [7, 7]])
+    # The targets are padded with zeros.
+    np.testing.assert_array_equal(stacked['msa_feat'][0, :, 3], 0)
+    np.testing.assert_array_equal(stacked['msa_feat'][0, :, :3, 5:], 0)
+    np.testing.assert_array_equal(stacked['aatype'][1, :, :7], 1)
+    with self.assertRaises(ValueError):
+      features.stack_processed_features([short, long], cfg, num_res=6)
+
+  def test_merge_empty_multimer_templates(self):
+    np_example = _make_multimer_templates(
+        num_res=10, num_templates=1, num_empty_templates=3)
+    merged = features.merge_empty_multimer_templates(np_example)
+    self.assertEqual(merged['template_aatype'].shape, (2, 10))
+    np.testing.assert_array_equal(merged['template_weight'], [1, 3])
+    self.assertIs(merged['aatype'], np_example['aatype'])
+
+    model_config = config.model_config('model_1_multimer_v3').model
+    template_config = model_config.embeddings_and_evoformer.template
+    template_config.template_pair_stack.num_block = 1
+    global_config = model_config.global_config
+    global_config.zero_init = False
+    query_embedding = np.random.default_rng(1).normal(
+        size=(10, 10, 128)).astype(np.float32)
+    mask_2d = np.ones((10, 10), np.float32)
+
+    def forward(template_batch):
+      return modules_multimer.TemplateEmbedding(
+          template_config, global_config)(
+              query_embedding, template_batch, mask_2d, mask_2d,
+              is_training=False)
+
+    template_embedding = hk.transform(forward)
+    template_batch = {k: v for k, v in np_example.items()
+                      if k.startswith('template_')}
+    params = template_embedding.init(jax.random.PRNGKey(0), template_batch)
+    expected = template_embedding.apply(
+        params, jax.random.PRNGKey(1), template_batch)
+    actual = template_embedding.apply(
+        params, jax.random.PRNGKey(1),
+        {k: v for k, v in merged.items() if k.startswith('template_')})
+    np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-4)
+
+  def test_merge_keeps_templates_without_empty_slots(self):
+    np_example = _make_multimer_templates(
+        num_res=10, num_templates=2, num_empty_templates=1)
+    self.assertIs(features.merge_empty_multimer_templates(np_example),
+                  np_example)
+
+
+if __name__ == '__main__':
+  absltest.main()
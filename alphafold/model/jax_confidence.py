@@ -0,0 +1,237 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""JAX versions of the confidence metrics in alphafold.common.confidence.
+
+They run on the device as part of the model call, so that only the reduced
+metrics and not the logits need to be copied to the host.
+"""
+
+from typing import Any, Dict, Mapping, Optional
+
+import jax
+import jax.numpy as jnp
+
+
+def compute_plddt(logits: jax.Array) -> jax.Array:
+  """Computes per-residue pLDDT from logits.
+
+  Args:
+    logits: [num_res, num_bins] output from the PredictedLDDTHead.
+
+  Returns:
+    plddt: [num_res] per-residue pLDDT.
+  """
+  num_bins = logits.shape[-1]
+  bin_width = 1.0 / num_bins
+  bin_centers = jnp.arange(0.5 * bin_width, 1.0, bin_width)
+  probs = jax.nn.softmax(logits.astype(jnp.float32), axis=-1)
+  return jnp.sum(probs * bin_centers, axis=-1) * 100
+
+
+def _calculate_bin_centers(breaks: jax.Array) -> jax.Array:
+  step = breaks[1] - breaks[0]
+  bin_centers = breaks + step / 2
+  # Add a catch-all bin at the end.
+  return jnp.concatenate([bin_centers, bin_centers[-1:] + step], axis=0)
+
+
+def _expected_aligned_error(probs: jax.Array,
+                            breaks: jax.Array) -> Dict[str, jax.Array]:
+  bin_centers = _calculate_bin_centers(breaks)
+  return {
+      'aligned_confidence_probs': probs,
+      'predicted_aligned_error': jnp.sum(probs * bin_centers, axis=-1),
+      'max_predicted_aligned_error': bin_centers[-1],
+  }
+
+
+def compute_predicted_aligned_error(
+    logits: jax.Array,
+    breaks: jax.Array) -> Dict[str, jax.Array]:
+  """Computes aligned confidence metrics from logits.
+
+  Args:
+    logits: [num_res, num_res, num_bins] the logits output from
+      PredictedAlignedErrorHead.
+    breaks: [num_bins - 1] the error bin edges.
+
+  Returns:
+    aligned_confidence_probs: [num_res, num_res, num_bins] the predicted
+      aligned error probabilities over bins for each residue pair.
+    predicted_aligned_error: [num_res, num_res] the expected aligned distance
+      error for each pair of residues.
+    max_predicted_aligned_error: The maximum predicted error possible.
+  """
+  return _expected_aligned_error(
+      jax.nn.softmax(logits.astype(jnp.float32), axis=-1), breaks)
+
+
+def _predicted_tm_score(probs: jax.Array,
+                        breaks: jax.Array,
+                        residue_weights: jax.Array,
+                        pair_mask: jax.Array) -> jax.Array:
+  """Computes the pTM of the residue pairs in `pair_mask` from probabilities."""
+  bin_centers = _calculate_bin_centers(breaks)
+
+  # Clip num_res to avoid negative/undefined d0, see
+  # alphafold.common.confidence.predicted_tm_score.
+  clipped_num_res = jnp.maximum(jnp.floor(jnp.sum(residue_weights)), 19)
+  d0 = 1.24 * (clipped_num_res - 15) ** (1./3) - 1.8
+
+  # TM-Score term for every bin.
+  tm_per_bin = 1. / (1 + jnp.square(bin_centers) / jnp.square(d0))
+  # E_distances tm(distance).
+  predicted_tm_term = jnp.sum(probs * tm_per_bin, axis=-1) * pair_mask
+
+  pair_residue_weights = pair_mask * (
+      residue_weights[None, :] * residue_weights[:, None])
+  normed_residue_mask = pair_residue_weights / (1e-8 + jnp.sum(
+      pair_residue_weights, axis=-1, keepdims=True))
+  per_alignment = jnp.sum(predicted_tm_term * normed_residue_mask, axis=-1)
+  return per_alignment[(per_alignment * residue_weights).argmax()]
+
+
+def predicted_tm_score(
+    logits: jax.Array,
+    breaks: jax.Array,
+    residue_weights: Optional[jax.Array] = None,
+    asym_id: Optional[jax.Array] = None,
+    interface: bool = False) -> jax.Array:
+  """Computes predicted TM alignment or predicted interface TM alignment score.
+
+  Args:
+    logits: [num_res, num_res, num_bins] the logits output from
+      PredictedAlignedErrorHead.
+    breaks: [num_bins] the error bins.
+    residue_weights: [num_res] the per residue weights to use for the
+      expectation, e.g. the mask of the residues that are not padding.
+    asym_id: [num_res] the asymmetric unit ID - the chain ID. Only needed for
+      ipTM calculation, i.e. when interface=True.
+    interface: If True, interface predicted TM score is computed.
+
+  Returns:
+    ptm_score: The predicted TM alignment or the predicted iTM score.
+  """
+  if residue_weights is None:
+    residue_weights = jnp.ones(logits.shape[0])
+  pair_mask = jnp.ones(logits.shape[:2], dtype=bool)
+  if interface:
+    pair_mask &= asym_id[:, None] != asym_id[None, :]
+  return _predicted_tm_score(
+      jax.nn.softmax(logits.astype(jnp.float32), axis=-1), breaks,
+      residue_weights.astype(jnp.float32), pair_mask)
+
+
+def chain_pair_metrics(
+    probs: jax.Array,
+    predicted_aligned_error: jax.Array,
+    breaks: jax.Array,
+    asym_id: jax.Array,
+    residue_mask: jax.Array,
+    num_chains: int) -> Dict[str, jax.Array]:
+  """Computes the ipTM and mean PAE of every pair of chains.
+
+  Args:
+    probs: [num_res, num_res, num_bins] the predicted aligned error
+      probabilities.
+    predicted_aligned_error: [num_res, num_res] the expected aligned error.
+    breaks: [num_bins - 1] the error bin edges.
+    asym_id: [num_res] the chain of each residue, from 1 to `num_chains`.
+    residue_mask: [num_res] mask of the residues that are not padding.
+    num_chains: The number of chains.
+
+  Returns:
+    chain_pair_iptm: [num_chains, num_chains] the ipTM of the interface of
+      each pair of chains, computed on the residues of the two chains only,
+      and the pTM of each chain on the diagonal.
+    chain_pair_pae: [num_chains, num_chains] the mean predicted aligned error
+      of the residues of the second chain when aligned on the first one.
+  """
+  residue_mask = residue_mask.astype(jnp.float32)
+  chain_masks = (asym_id[None] == jnp.arange(1, num_chains + 1)[:, None]) * (
+      residue_mask[None])
+  chain_sizes = jnp.sum(chain_masks, axis=-1)
+  pae_sums = jnp.einsum('ai,ij,bj->ab', chain_masks, predicted_aligned_error,
+                        chain_masks)
+  chain_pair_pae = pae_sums / jnp.maximum(
+      chain_sizes[:, None] * chain_sizes[None, :], 1.)
+
+  interface_mask = asym_id[:, None] != asym_id[None, :]
+  def pair_iptm(pair):
+    a, b = pair // num_chains, pair % num_chains
+    residue_weights = jnp.maximum(chain_masks[a], chain_masks[b])
+    pair_mask = jnp.where(a == b, True, interface_mask)
+    return _predicted_tm_score(probs, breaks, residue_weights, pair_mask)
+  # The pairs are computed one after the other, as each needs a pass over all
+  # the probabilities.
+  chain_pair_iptm = jax.lax.map(
+      pair_iptm, jnp.arange(num_chains * num_chains)).reshape(
+          num_chains, num_chains)
+  return {'chain_pair_iptm': chain_pair_iptm,
+          'chain_pair_pae': chain_pair_pae}
+
+
+def confidence_metrics(
+    prediction_result: Mapping[str, Any],
+    residue_mask: jax.Array,
+    multimer_mode: bool,
+    num_chains: Optional[int] = None) -> Dict[str, jax.Array]:
+  """Computes the confidence metrics of model.get_confidence_metrics.
+
+  The predicted aligned error probabilities are computed once and shared by
+  the PAE, pTM, ipTM and chain pair metrics.
+
+  Args:
+    prediction_result: The outputs of the model.
+    residue_mask: [num_res] mask of the residues that are not padding, which
+      are left out of the pTM, ipTM and monomer ranking confidence.
+    multimer_mode: Whether the outputs are those of a multimer model.
+    num_chains: The number of chains of a multimer model. If set, the
+      chain pair metrics are computed as well, see chain_pair_metrics.
+
+  Returns:
+    The pLDDT, the ranking confidence and, if the model has a predicted
+    aligned error head, the predicted aligned error and the pTM, as well as
+    the ipTM and the chain pair metrics for multimer models.
+  """
+  metrics = {}
+  metrics['plddt'] = compute_plddt(
+      prediction_result['predicted_lddt']['logits'])
+  residue_mask = residue_mask.astype(jnp.float32)
+  if 'predicted_aligned_error' in prediction_result:
+    pae_output = prediction_result['predicted_aligned_error']
+    breaks = pae_output['breaks']
+    probs = jax.nn.softmax(pae_output['logits'].astype(jnp.float32), axis=-1)
+    metrics.update(_expected_aligned_error(probs, breaks))
+    all_pairs = jnp.ones(probs.shape[:2], dtype=bool)
+    metrics['ptm'] = _predicted_tm_score(probs, breaks, residue_mask,
+                                         all_pairs)
+    if multimer_mode:
+      # Compute the ipTM only for the multimer model.
+      asym_id = pae_output['asym_id']
+      metrics['iptm'] = _predicted_tm_score(
+          probs, breaks, residue_mask, asym_id[:, None] != asym_id[None, :])
+      metrics['ranking_confidence'] = (
+          0.8 * metrics['iptm'] + 0.2 * metrics['ptm'])
+      if num_chains is not None:
+        metrics.update(chain_pair_metrics(
+            probs, metrics['predicted_aligned_error'], breaks, asym_id,
+            residue_mask, num_chains))
+
+  if not multimer_mode:
+    # Monomer models use mean pLDDT for model ranking.
+    metrics['ranking_confidence'] = (
+        jnp.sum(metrics['plddt'] * residue_mask) / jnp.sum(residue_mask))
+  return metrics
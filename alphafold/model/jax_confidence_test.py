@@ -0,0 +1,112 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for jax_confidence."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.common import confidence
+from alphafold.model import jax_confidence
+import jax
+import numpy as np
+
+
+def _make_prediction_result(num_res, seed=0):
+  rng = np.random.default_rng(seed)
+  return {
+      'predicted_lddt': {
+          'logits': rng.normal(size=(num_res, 50)).astype(np.float32)},
+      'predicted_aligned_error': {
+          'logits': rng.normal(size=(num_res, num_res, 64)).astype(np.float32),
+          'breaks': np.linspace(0., 31., 63).astype(np.float32),
+          'asym_id': np.repeat([1, 2, 3], num_res // 3).astype(np.int32),
+      },
+  }
+
+
+class JaxConfidenceTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('monomer', False),
+      ('multimer', True),
+  )
+  def test_matches_host_metrics(self, multimer_mode):
+    prediction_result = _make_prediction_result(num_res=24)
+    pae_output = prediction_result['predicted_aligned_error']
+    expected = confidence.compute_predicted_aligned_error(
+        logits=pae_output['logits'], breaks=pae_output['breaks'])
+    expected['plddt'] = confidence.compute_plddt(
+        prediction_result['predicted_lddt']['logits'])
+    expected['ptm'] = confidence.predicted_tm_score(
+        logits=pae_output['logits'], breaks=pae_output['breaks'])
+    if multimer_mode:
+      expected['iptm'] = confidence.predicted_tm_score(
+          logits=pae_output['logits'], breaks=pae_output['breaks'],
+          asym_id=pae_output['asym_id'], interface=True)
+      expected['ranking_confidence'] = (
+          0.8 * expected['iptm'] + 0.2 * expected['ptm'])
+    else:
+      expected['ranking_confidence'] = np.mean(expected['plddt'])
+    actual = jax.jit(jax_confidence.confidence_metrics, static_argnums=2)(
+        prediction_result, np.ones(24, np.float32), multimer_mode)
+
+    self.assertSameElements(actual.keys(), expected.keys())
+    for k, v in expected.items():
+      with self.subTest(k):
+        np.testing.assert_allclose(actual[k], v, rtol=1e-5, atol=1e-5)
+
+  def test_chain_pair_metrics(self):
+    prediction_result = _make_prediction_result(num_res=24)
+    pae_output = prediction_result['predicted_aligned_error']
+    metrics = jax_confidence.confidence_metrics(
+        prediction_result, np.ones(24, np.float32), multimer_mode=True,
+        num_chains=3)
+    chain_pair_iptm = np.asarray(metrics['chain_pair_iptm'])
+    chain_pair_pae = np.asarray(metrics['chain_pair_pae'])
+    self.assertEqual(chain_pair_iptm.shape, (3, 3))
+
+    chains = [np.arange(8 * a, 8 * (a + 1)) for a in range(3)]
+    for a in range(3):
+      for b in range(3):
+        residues = np.union1d(chains[a], chains[b])
+        logits = pae_output['logits'][residues][:, residues]
+        expected_iptm = confidence.predicted_tm_score(
+            logits=logits, breaks=pae_output['breaks'],
+            asym_id=pae_output['asym_id'][residues], interface=a != b)
+        np.testing.assert_allclose(chain_pair_iptm[a, b], expected_iptm,
+                                   rtol=1e-5)
+        np.testing.assert_allclose(
+            chain_pair_pae[a, b],
+            np.mean(metrics['predicted_aligned_error'][chains[a]][
+                :, chains[b]]), rtol=1e-5)
+
+  def test_padded_residues_are_ignored(self):
+    prediction_result = _make_prediction_result(num_res=24)
+    padded_result = jax.tree.map(
+        lambda x: np.pad(x, [(0, 6)] * (x.ndim - 1) + [(0, 0)])
+        if x.ndim > 1 else x, prediction_result)
+    expected = jax_confidence.confidence_metrics(
+        prediction_result, np.ones(24, np.float32), multimer_mode=False)
+    actual = jax_confidence.confidence_metrics(
+        padded_result, np.pad(np.ones(24, np.float32), (0, 6)),
+        multimer_mode=False)
+
+    for k in ('ptm', 'ranking_confidence'):
+      np.testing.assert_allclose(actual[k], expected[k], rtol=1e-5)
+    np.testing.assert_allclose(actual['plddt'][:24], expected['plddt'],
+                               rtol=1e-5)
+
+
+if __name__ == '__main__':
+  absltest.main()
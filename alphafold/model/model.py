@@ -13,52 +13,184 @@
 # limitations under the License.
 
 """Code for constructing the model."""
-from typing import Any, Mapping, Optional, Union
+import functools
+import hashlib
+import os
+import pickle
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 from absl import logging
-from alphafold.common import confidence
+from alphafold.common import protein
 from alphafold.model import features
+from alphafold.model import jax_confidence
 from alphafold.model import modules
 from alphafold.model import modules_multimer
+from alphafold.model import sharding
+from alphafold.model import utils
 import haiku as hk
 import jax
+from jax.experimental import serialize_executable
 import ml_collections
 import numpy as np
-import tensorflow.compat.v1 as tf
 import tree
 
+if TYPE_CHECKING:
+  import tensorflow.compat.v1 as tf  # pylint: disable=g-bad-import-order
+
+# Called with the index, mean pLDDT and CA distance change of each recycling
+# iteration, returns whether to stop recycling.
+RecycleCallback = Callable[[int, float, float], bool]
+
+# Axes over residues of every monomer model output, which predict_batch crops
+# the padding of.
+_RESIDUE_AXES = {
+    ('aligned_confidence_probs',): (0, 1),
+    ('distogram', 'bin_edges'): (),
+    ('distogram', 'logits'): (0, 1),
+    ('experimentally_resolved', 'logits'): (0,),
+    ('masked_msa', 'logits'): (1,),
+    ('max_predicted_aligned_error',): (),
+    ('num_recycles',): (),
+    ('plddt',): (0,),
+    ('predicted_aligned_error',): (0, 1),
+    ('predicted_lddt', 'logits'): (0,),
+    ('ptm',): (),
+    ('ranking_confidence',): (),
+    ('representations', 'msa'): (1,),
+    ('representations', 'msa_first_row'): (0,),
+    ('representations', 'pair'): (0, 1),
+    ('representations', 'single'): (0,),
+    ('representations', 'structure_module'): (0,),
+    ('structure_module', 'final_atom_mask'): (0,),
+    ('structure_module', 'final_atom_positions'): (0,),
+}
+
+
+# Identifies compiled executables by the number of chains, for multimer
+# models, and the name, shape and type of every feature.
+_ExecutableKey = Tuple[Optional[int], Tuple[Tuple[str, Tuple[int, ...], str],
+                                            ...]]
+
+
+def _executable_key(feat: Mapping[str, Any],
+                    num_chains: Optional[int]) -> _ExecutableKey:
+  return num_chains, tuple(sorted(
+      (k, tuple(np.shape(v)), np.dtype(v.dtype).name)
+      for k, v in feat.items()))
+
+
+# Features that start recycling from an earlier structure instead of zeros.
+RECYCLE_FEATURES = ('prev_pos', 'prev_msa_first_row', 'prev_pair')
+
+
+def recycle_features(
+    num_res: int,
+    prot: Optional[protein.Protein] = None,
+    prediction_result: Optional[Mapping[str, Any]] = None,
+) -> features.FeatureDict:
+  """Makes the features that start recycling from an earlier structure.
+
+  Adding them to the processed features passed to RunModel.predict warm
+  starts the model, so that with recycle_early_stop_tolerance set it usually
+  needs fewer recycling iterations to converge.
+
+  Args:
+    num_res: Number of residues of the processed features, including padding.
+    prot: A structure of the target with its residues in the order of the
+      features, e.g. an earlier model or one from the AlphaFold Database.
+      Recycling starts from its atom positions.
+    prediction_result: Outputs of an earlier prediction of the target by a
+      model with the same config. Recycling starts from its final atom
+      positions and, if they are among its outputs, from its
+      `representations.msa_first_row` and `representations.pair`.
+
+  Returns:
+    `prev_pos` and, from `prediction_result`, possibly `prev_msa_first_row`
+    and `prev_pair`, padded with zeros to `num_res` residues.
+  """
+  if (prot is None) == (prediction_result is None):
+    raise ValueError('Exactly one of prot and prediction_result must be set.')
+  if prot is not None:
+    recycled = {
+        'prev_pos': prot.atom_positions * prot.atom_mask[..., None],
+    }
+  else:
+    representations = prediction_result.get('representations', {})
+    recycled = {
+        'prev_pos': prediction_result['structure_module'][
+            'final_atom_positions'],
+    }
+    if 'msa_first_row' in representations and 'pair' in representations:
+      recycled['prev_msa_first_row'] = representations['msa_first_row']
+      recycled['prev_pair'] = representations['pair']
+
+  if recycled['prev_pos'].shape[0] > num_res:
+    raise ValueError(f'Cannot start recycling from a structure of '
+                     f'{recycled["prev_pos"].shape[0]} residues for features '
+                     f'of {num_res} residues.')
+  def pad(x, num_res_axes):
+    padding = [(0, num_res - x.shape[0]) if axis < num_res_axes else (0, 0)
+               for axis in range(x.ndim)]
+    return np.pad(np.asarray(x, np.float32), padding)
+  return {k: pad(v, num_res_axes=2 if k == 'prev_pair' else 1)
+          for k, v in recycled.items()}
+
 
 def get_confidence_metrics(
     prediction_result: Mapping[str, Any],
     multimer_mode: bool) -> Mapping[str, Any]:
-  """Post processes prediction_result to get confidence metrics."""
-  confidence_metrics = {}
-  confidence_metrics['plddt'] = confidence.compute_plddt(
-      prediction_result['predicted_lddt']['logits'])
-  if 'predicted_aligned_error' in prediction_result:
-    confidence_metrics.update(confidence.compute_predicted_aligned_error(
-        logits=prediction_result['predicted_aligned_error']['logits'],
-        breaks=prediction_result['predicted_aligned_error']['breaks']))
-    confidence_metrics['ptm'] = confidence.predicted_tm_score(
-        logits=prediction_result['predicted_aligned_error']['logits'],
-        breaks=prediction_result['predicted_aligned_error']['breaks'],
-        asym_id=None)
-    if multimer_mode:
-      # Compute the ipTM only for the multimer model.
-      confidence_metrics['iptm'] = confidence.predicted_tm_score(
-          logits=prediction_result['predicted_aligned_error']['logits'],
-          breaks=prediction_result['predicted_aligned_error']['breaks'],
-          asym_id=prediction_result['predicted_aligned_error']['asym_id'],
-          interface=True)
-      confidence_metrics['ranking_confidence'] = (
-          0.8 * confidence_metrics['iptm'] + 0.2 * confidence_metrics['ptm'])
-
-  if not multimer_mode:
-    # Monomer models use mean pLDDT for model ranking.
-    confidence_metrics['ranking_confidence'] = np.mean(
-        confidence_metrics['plddt'])
-
-  return confidence_metrics
+  """Post processes prediction_result to get confidence metrics.
+
+  RunModel.predict already returns these metrics, computed on the device.
+
+  Args:
+    prediction_result: The outputs of the model.
+    multimer_mode: Whether the outputs are those of a multimer model.
+
+  Returns:
+    The confidence metrics as NumPy arrays, see
+    jax_confidence.confidence_metrics.
+  """
+  num_res = prediction_result['predicted_lddt']['logits'].shape[0]
+  return jax.device_get(_confidence_metrics(
+      prediction_result, np.ones(num_res, np.float32), multimer_mode))
+
+
+_confidence_metrics = jax.jit(jax_confidence.confidence_metrics,
+                              static_argnames=('multimer_mode', 'num_chains'))
+
+
+def _crop_residue_padding(result: Mapping[str, Any],
+                          num_res: int) -> Mapping[str, Any]:
+  """Crops the outputs of a monomer model to the first `num_res` residues."""
+  def crop(path, x):
+    if path not in _RESIDUE_AXES:
+      # Returning the output padded would silently misalign it.
+      raise ValueError(f'The residue axes of the model output '
+                       f'{".".join(map(str, path))} are unknown.')
+    axes = _RESIDUE_AXES[path]
+    return x[tuple(slice(num_res) if axis in axes else slice(None)
+                   for axis in range(np.ndim(x)))]
+  return tree.map_structure_with_path(crop, result)
+
+
+def _select_outputs(result: Mapping[str, Any],
+                    outputs: Optional[Sequence[str]]) -> Mapping[str, Any]:
+  """Selects the model outputs named by dot-separated paths, e.g. `plddt`."""
+  if outputs is None:
+    return result
+  selected = {}
+  for output in outputs:
+    *path, name = output.split('.')
+    source, target = result, selected
+    for key in path:
+      source = source.get(key, {})
+      target = target.setdefault(key, {})
+    if name not in source:
+      raise ValueError(f'The model has no output {output}.')
+    target[name] = source[name]
+  return selected
 
 
 class RunModel:
@@ -69,25 +201,89 @@ class RunModel:
                params: Optional[Mapping[str, Mapping[str, jax.Array]]] = None):
     self.config = config
     self.params = params
+    if params is not None:
+      # Memory-mapped parameters would otherwise be copied to the device on
+      # every call, so copy them once per runner.
+      num_bytes = sum(x.nbytes for x in jax.tree.leaves(params))
+      self.params = jax.device_put(params)
+      logging.info(
+          'Copied %.1f MiB of parameters to the device, host RSS %.0f MiB',
+          num_bytes / 2**20, utils.host_rss_mib())
     self.multimer_mode = config.model.global_config.multimer_mode
 
+    # The representations are only returned if selected, as they are large.
+    outputs = self.config.model.get('outputs')
+    return_representations = outputs is not None and any(
+        output.split('.')[0] == 'representations' for output in outputs)
+
     if self.multimer_mode:
-      def _forward_fn(batch):
+      def _model_fn(batch, recycle_callback=None):
         model = modules_multimer.AlphaFold(self.config.model)
         return model(
             batch,
-            is_training=False)
+            is_training=False,
+            return_representations=return_representations,
+            recycle_callback=recycle_callback)
     else:
-      def _forward_fn(batch):
+      def _model_fn(batch, recycle_callback=None):
         model = modules.AlphaFold(self.config.model)
         return model(
             batch,
             is_training=False,
             compute_loss=False,
-            ensemble_representations=True)
+            ensemble_representations=True,
+            return_representations=return_representations,
+            recycle_callback=recycle_callback)
+
+    def _forward_fn(batch, recycle_callback=None, num_chains=None):
+      result = _model_fn(batch, recycle_callback=recycle_callback)
+      # The confidence metrics are reduced on the device, and the outputs that
+      # are not selected are pruned from the compiled model.
+      seq_mask = batch['seq_mask']
+      if not self.multimer_mode:
+        seq_mask = seq_mask[0]
+      result.update(jax_confidence.confidence_metrics(
+          result, residue_mask=seq_mask, multimer_mode=self.multimer_mode,
+          num_chains=num_chains))
+      return _select_outputs(result, outputs)
+
+    if self.config.model.global_config.shard_residues:
+      self._mesh = sharding.make_mesh()
+      logging.info('Sharding residues over %d devices', self._mesh.size)
+    else:
+      self._mesh = None
 
-    self.apply = jax.jit(hk.transform(_forward_fn).apply)
-    self.init = jax.jit(hk.transform(_forward_fn).init)
+    # The number of chains sets the shape of the chain pair metrics.
+    self._jit_apply = jax.jit(hk.transform(_forward_fn).apply,
+                              static_argnames='num_chains')
+    self.apply = self._with_mesh(self._jit_apply)
+    self.init = self._with_mesh(jax.jit(hk.transform(_forward_fn).init))
+    # Maps over a leading target dimension of the features and random keys.
+    self._apply_batch = self._with_mesh(jax.jit(jax.vmap(
+        hk.transform(_forward_fn).apply, in_axes=(None, 0, 0))))
+
+    # The model is only compiled with the callback once a prediction uses one.
+    # The compiled callback calls the callback of the current prediction.
+    self._recycle_callback = None
+    def _recycle_callback(*args):
+      return self._recycle_callback(*args)
+    self._apply_with_recycle_callback = self._with_mesh(jax.jit(hk.transform(
+        functools.partial(_forward_fn, recycle_callback=_recycle_callback)
+    ).apply, static_argnames='num_chains'))
+
+    # Executables of `apply` compiled ahead of time, see `compile`.
+    self._executables: Dict[_ExecutableKey, jax.stages.Compiled] = {}
+
+  def _with_mesh(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Traces `fn` in the residue sharding context of the model, if any."""
+    if self._mesh is None:
+      return fn
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+      with sharding.residue_sharding(self._mesh):
+        return fn(*args, **kwargs)
+    return wrapped
 
   def init_params(self, feat: features.FeatureDict, random_seed: int = 0):
     """Initializes the model parameters.
@@ -110,7 +306,7 @@ class RunModel:
 
   def process_features(
       self,
-      raw_features: Union[tf.train.Example, features.FeatureDict],
+      raw_features: Union['tf.train.Example', features.FeatureDict],
       random_seed: int) -> features.FeatureDict:
     """Processes features to prepare for feeding them into the model.
 
@@ -123,20 +319,27 @@ class RunModel:
       A dict of NumPy feature arrays suitable for feeding into the model.
     """
 
+    crop_empty_templates = (
+        self.config.model.global_config.crop_empty_templates)
     if self.multimer_mode:
+      if crop_empty_templates:
+        return features.merge_empty_multimer_templates(raw_features)
       return raw_features
 
     # Single-chain mode.
     if isinstance(raw_features, dict):
-      return features.np_example_to_features(
+      processed_features = features.np_example_to_features(
           np_example=raw_features,
           config=self.config,
           random_seed=random_seed)
     else:
-      return features.tf_example_to_features(
+      processed_features = features.tf_example_to_features(
           tf_example=raw_features,
           config=self.config,
           random_seed=random_seed)
+    if crop_empty_templates:
+      processed_features = features.crop_empty_templates(processed_features)
+    return processed_features
 
   def eval_shape(self, feat: features.FeatureDict) -> jax.ShapeDtypeStruct:
     self.init_params(feat)
@@ -146,32 +349,264 @@ class RunModel:
     logging.info('Output shape was %s', shape)
     return shape
 
+  def abstract_features(
+      self,
+      num_res: int,
+      num_msa: int,
+      num_templates: int = 0) -> Dict[str, jax.ShapeDtypeStruct]:
+    """Returns the shapes of the processed features of targets of given sizes.
+
+    Args:
+      num_res: The number of residues of the targets.
+      num_msa: The number of sequences in their MSAs. With
+        `config.data.common.msa_depth_buckets` set, every MSA depth in the same
+        bucket gives the same shapes.
+      num_templates: The number of their templates.
+
+    Returns:
+      The shape and type of every feature output by process_features.
+    """
+    if self.multimer_mode:
+      raise ValueError('The shapes of multimer features depend on their '
+                       'chains, compile the model with example features '
+                       'instead.')
+    processed_features = self.process_features(
+        features.placeholder_features(num_res, num_msa, num_templates),
+        random_seed=0)
+    return {k: jax.ShapeDtypeStruct(v.shape, v.dtype)
+            for k, v in processed_features.items()}
+
+  def compile(self,
+              feat: Mapping[str, Any],
+              num_chains: Optional[int] = None) -> bool:
+    """Compiles the model ahead of time for features of the shapes of `feat`.
+
+    Later predictions without a recycle callback on features of the same
+    shapes and types run the compiled executable instead of tracing and
+    compiling the model. Predictions of monomer models also run the executable
+    of the fewest residues that fits them, padding the residues.
+
+    Args:
+      feat: Features as output by process_features, or their shapes as
+        jax.ShapeDtypeStruct, e.g. from abstract_features.
+      num_chains: The number of chains of multimer features. Only needed if
+        `feat` holds shapes.
+
+    Returns:
+      Whether the model was compiled, i.e. not compiled or loaded for these
+      shapes already.
+    """
+    abstract_feat = {k: jax.ShapeDtypeStruct(np.shape(v), v.dtype)
+                     for k, v in feat.items()}
+    if self.multimer_mode and num_chains is None:
+      if isinstance(feat['asym_id'], jax.ShapeDtypeStruct):
+        raise ValueError('The number of chains of multimer feature shapes '
+                         'must be given.')
+      num_chains = self._num_chains(feat)
+    key = _executable_key(abstract_feat, num_chains)
+    if key in self._executables:
+      return False
+    params = self.params
+    if not params:
+      # The parameters are only initialized on the first prediction.
+      params = hk.data_structures.to_mutable_dict(
+          jax.eval_shape(self.init, jax.random.PRNGKey(0), abstract_feat))
+
+    t_0 = time.time()
+    lowered = self._with_mesh(self._jit_apply.lower)(
+        params, jax.random.PRNGKey(0), abstract_feat, num_chains=num_chains)
+    self._executables[key] = lowered.compile()
+    logging.info('Compiled the model for shape(feat) = %s in %.1fs',
+                 {k: v.shape for k, v in abstract_feat.items()},
+                 time.time() - t_0)
+    return True
+
+  def save_executables(self, path: str) -> None:
+    """Writes the executables compiled by `compile` to a file.
+
+    Args:
+      path: The file to write, to be read by load_executables of a model with
+        the same config on the same JAX version and devices.
+    """
+    serialized = {key: serialize_executable.serialize(executable)
+                  for key, executable in self._executables.items()}
+    with open(path + '.tmp', 'wb') as f:
+      pickle.dump({'fingerprint': self._executable_fingerprint(),
+                   'executables': serialized}, f, protocol=4)
+    os.replace(path + '.tmp', path)
+    logging.info('Saved %d executables to %s', len(serialized), path)
+
+  def load_executables(self, path: str) -> int:
+    """Reads the executables written by save_executables, e.g. at start up.
+
+    Args:
+      path: The file written by save_executables.
+
+    Returns:
+      The number of executables loaded. None are loaded from a model with
+      another config or from another JAX version or devices, which need to
+      compile the model again.
+    """
+    with open(path, 'rb') as f:
+      saved = pickle.load(f)
+    if saved['fingerprint'] != self._executable_fingerprint():
+      logging.warning('Not loading the executables in %s, which were compiled '
+                      'for another config, JAX version or devices.', path)
+      return 0
+    for key, (payload, in_tree, out_tree) in saved['executables'].items():
+      self._executables[key] = serialize_executable.deserialize_and_load(
+          payload, in_tree, out_tree)
+    logging.info('Loaded %d executables from %s', len(saved['executables']),
+                 path)
+    return len(saved['executables'])
+
+  def _executable_fingerprint(self) -> str:
+    """Identifies the config, JAX version and devices executables run with."""
+    devices = [(d.platform, d.device_kind) for d in jax.devices()]
+    return hashlib.sha256(repr((
+        self.config.to_json_best_effort(sort_keys=True),
+        jax.__version__, jax.lib.__version__, devices)).encode()).hexdigest()
+
+  def _find_executable(
+      self,
+      feat: features.FeatureDict,
+      num_chains: Optional[int],
+  ) -> Tuple[Optional[jax.stages.Compiled], features.FeatureDict]:
+    """Returns the executable compiled for `feat` and the features it takes.
+
+    Monomer features without an executable of their shapes are padded to the
+    fewest residues that one was compiled for, if any.
+    """
+    executable = self._executables.get(_executable_key(feat, num_chains))
+    if executable is not None or self.multimer_mode:
+      return executable, feat
+    num_res = feat['aatype'].shape[1]
+    compiled_num_res = sorted(
+        {dict((k, shape) for k, shape, _ in shapes)['aatype'][1]
+         for _, shapes in self._executables})
+    for padded_num_res in compiled_num_res:
+      if padded_num_res <= num_res:
+        continue
+      padded_feat = jax.tree.map(
+          lambda x: x[0], features.stack_processed_features(
+              [feat], self.config, num_res=padded_num_res))
+      executable = self._executables.get(
+          _executable_key(padded_feat, num_chains))
+      if executable is not None:
+        return executable, padded_feat
+    return None, feat
+
   def predict(self,
               feat: features.FeatureDict,
               random_seed: int,
+              recycle_callback: Optional[RecycleCallback] = None,
               ) -> Mapping[str, Any]:
     """Makes a prediction by inferencing the model on the provided features.
 
     Args:
       feat: A dictionary of NumPy feature arrays as output by
-        RunModel.process_features.
+        RunModel.process_features, optionally with the features made by
+        recycle_features to start recycling from an earlier structure.
       random_seed: The random seed to use when running the model. In the
         multimer model this controls the MSA sampling.
+      recycle_callback: Optional function called from within the model after
+        each recycling iteration with the index of the iteration, starting at
+        0, its mean pLDDT and the root mean square change of its pairwise CA
+        distances. Recycling stops early if it returns True.
 
     Returns:
-      A dictionary of model outputs.
+      A dictionary of the model outputs selected by `config.model.outputs` and
+      their confidence metrics, copied to the host as NumPy arrays. Multimer
+      models also return the ipTM and mean PAE of every pair of chains as
+      `chain_pair_iptm` and `chain_pair_pae`.
     """
     self.init_params(feat)
     logging.info('Running predict with shape(feat) = %s',
                  tree.map_structure(lambda x: x.shape, feat))
-    result = self.apply(self.params, jax.random.PRNGKey(random_seed), feat)
+    num_chains = self._num_chains(feat)
+    if recycle_callback is None:
+      executable, padded_feat = self._find_executable(feat, num_chains)
+      if executable is None:
+        result = self.apply(self.params, jax.random.PRNGKey(random_seed), feat,
+                            num_chains=num_chains)
+      else:
+        result = executable(self.params, jax.random.PRNGKey(random_seed),
+                            padded_feat)
+        if padded_feat is not feat:
+          result = _crop_residue_padding(
+              result, num_res=feat['aatype'].shape[1])
+    else:
+      self._recycle_callback = recycle_callback
+      try:
+        result = self._apply_with_recycle_callback(
+            self.params, jax.random.PRNGKey(random_seed), feat,
+            num_chains=num_chains)
+        # The callback may be called until the outputs are ready.
+        jax.tree.map(lambda x: x.block_until_ready(), result)
+      finally:
+        self._recycle_callback = None
+
+    return self._to_host(result)
+
+  def _num_chains(self, feat: features.FeatureDict) -> Optional[int]:
+    """Returns the number of chains of multimer features, else None."""
+    if not self.multimer_mode:
+      return None
+    return int(np.max(feat['asym_id']))
 
-    # This block is to ensure benchmark timings are accurate. Some blocking is
-    # already happening when computing get_confidence_metrics, and this ensures
-    # all outputs are blocked on.
+  def _to_host(self, result: Any) -> Any:
+    """Copies the outputs of the model to the host and logs their size."""
+    # This block is to ensure benchmark timings are accurate.
     jax.tree.map(lambda x: x.block_until_ready(), result)
-    result.update(
-        get_confidence_metrics(result, multimer_mode=self.multimer_mode))
+    num_bytes = sum(x.nbytes for x in jax.tree.leaves(result))
+    result = jax.device_get(result)
     logging.info('Output shape was %s',
                  tree.map_structure(lambda x: x.shape, result))
+    logging.info('Copied %.1f MiB of outputs to the host, host RSS %.0f MiB',
+                 num_bytes / 2**20, utils.host_rss_mib())
     return result
+
+  def predict_batch(self,
+                    feats: Sequence[features.FeatureDict],
+                    random_seeds: Sequence[int],
+                    num_res: Optional[int] = None,
+                    ) -> List[Mapping[str, Any]]:
+    """Makes predictions for several monomer targets in one model call.
+
+    The features of the targets are padded to common shapes, see
+    features.stack_processed_features, and the model is mapped over them, so
+    that short targets make better use of the accelerator. Targets padded to
+    the same shapes share one compilation.
+
+    Args:
+      feats: The features of each target as output by
+        RunModel.process_features.
+      random_seeds: The random seed of each target.
+      num_res: The number of residues to pad every target to. Defaults to the
+        number of residues of the longest target.
+
+    Returns:
+      The model outputs of each target without the padded residues. The
+      masked MSA logits keep the padded MSA rows.
+    """
+    if self.multimer_mode:
+      raise ValueError('Batched predictions are only supported by monomer '
+                       'models.')
+    if any(k in feat for feat in feats for k in RECYCLE_FEATURES):
+      raise ValueError('Batched predictions cannot start recycling from an '
+                       'earlier structure.')
+    if len(feats) != len(random_seeds):
+      raise ValueError(f'Got {len(random_seeds)} random seeds for '
+                       f'{len(feats)} targets.')
+    batch = features.stack_processed_features(feats, self.config, num_res)
+    self.init_params(jax.tree.map(lambda x: x[0], batch))
+    logging.info('Running predict_batch with shape(feat) = %s',
+                 tree.map_structure(lambda x: x.shape, batch))
+    keys = np.stack(
+        [jax.random.PRNGKey(random_seed) for random_seed in random_seeds])
+    results = self._to_host(self._apply_batch(self.params, keys, batch))
+    return [
+        _crop_residue_padding(jax.tree.map(lambda x, i=i: x[i], results),
+                              num_res=feat['aatype'].shape[1])
+        for i, feat in enumerate(feats)
+    ]
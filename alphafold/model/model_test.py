@@ -0,0 +1,118 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for model."""
+
+import os
+import tempfile
+from unittest import mock
+
+from absl.testing import absltest
+from alphafold.model import config
+from alphafold.model import features
+from alphafold.model import model
+import jax
+import numpy as np
+
+
+def _make_model_config():
+  cfg = config.model_config('model_1')
+  cfg.data.common.use_numpy_pipeline = True
+  cfg.data.common.num_recycle = 0
+  cfg.data.common.max_extra_msa = 8
+  cfg.data.common.msa_depth_buckets = [4, 8]
+  cfg.data.common.reduce_msa_clusters_by_max_templates = False
+  cfg.data.eval.max_msa_clusters = 4
+  cfg.model.num_recycle = 0
+  evoformer_config = cfg.model.embeddings_and_evoformer
+  evoformer_config.evoformer_num_block = 1
+  evoformer_config.extra_msa_stack_num_block = 1
+  evoformer_config.template.enabled = False
+  cfg.model.heads.structure_module.num_layer = 2
+  cfg.model.global_config.zero_init = False
+  return cfg
+
+
+class RunModelTest(absltest.TestCase):
+
+  def test_compile_ahead_of_time_and_load(self):
+    cfg = _make_model_config()
+    model_runner = model.RunModel(cfg)
+    # The MSA of the target is in the same depth bucket.
+    self.assertTrue(model_runner.compile(
+        model_runner.abstract_features(num_res=16, num_msa=7)))
+    self.assertFalse(model_runner.compile(
+        model_runner.abstract_features(num_res=16, num_msa=8)))
+    feat = model_runner.process_features(
+        features.placeholder_features(num_res=12, num_msa=6), random_seed=0)
+    model_runner.init_params(feat)
+    expected = model.RunModel(cfg, model_runner.params).predict(
+        feat, random_seed=0)
+
+    # The residues of the target are padded to those of the executable.
+    with mock.patch.object(model_runner, 'apply', side_effect=AssertionError):
+      actual = model_runner.predict(feat, random_seed=0)
+    self.assertEqual(actual['plddt'].shape, (12,))
+    np.testing.assert_allclose(
+        actual['structure_module']['final_atom_positions'],
+        expected['structure_module']['final_atom_positions'],
+        rtol=1e-4, atol=1e-4)
+
+    path = os.path.join(
+        self.enter_context(tempfile.TemporaryDirectory()), 'executables.pkl')
+    model_runner.save_executables(path)
+    loaded_runner = model.RunModel(cfg, model_runner.params)
+    self.assertEqual(loaded_runner.load_executables(path), 1)
+    with mock.patch.object(loaded_runner, 'apply', side_effect=AssertionError):
+      loaded = loaded_runner.predict(feat, random_seed=0)
+    np.testing.assert_allclose(
+        loaded['structure_module']['final_atom_positions'],
+        actual['structure_module']['final_atom_positions'], rtol=1e-6)
+
+    cfg.model.num_recycle = 1
+    self.assertEqual(model.RunModel(cfg).load_executables(path), 0)
+
+  def test_crop_residue_padding_of_every_output(self):
+    cfg = _make_model_config()
+    cfg.model.heads.experimentally_resolved.weight = 0.01
+    cfg.model.heads.predicted_aligned_error.weight = 0.1
+    feat = model.RunModel(cfg).abstract_features(num_res=16, num_msa=7)
+    # The representations are only returned if selected.
+    for outputs in (None, ['representations']):
+      cfg.model.outputs = outputs
+      model_runner = model.RunModel(cfg)
+      params = jax.eval_shape(model_runner.init, jax.random.PRNGKey(0), feat)
+      result = jax.eval_shape(
+          model_runner.apply, params, jax.random.PRNGKey(0), feat)
+      cropped = model._crop_residue_padding(
+          jax.tree.map(lambda x: np.zeros(x.shape, x.dtype), result),
+          num_res=12)
+      for x in jax.tree.leaves(cropped):
+        self.assertNotIn(16, x.shape)
+
+    with self.assertRaisesRegex(ValueError, 'representations.unknown'):
+      model._crop_residue_padding(
+          {'representations': {'unknown': np.zeros(16)}}, num_res=12)
+
+  def test_memory_mapped_params_are_copied_to_the_device_once(self):
+    params = {'alphafold/layer': {'weights': np.ones((4, 4), np.float32)}}
+    model_runner = model.RunModel(_make_model_config(), params)
+
+    weights = model_runner.params['alphafold/layer']['weights']
+    self.assertIsInstance(weights, jax.Array)
+    np.testing.assert_array_equal(weights, params['alphafold/layer']['weights'])
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -26,10 +26,13 @@ from alphafold.model import lddt
 from alphafold.model import mapping
 from alphafold.model import prng
 from alphafold.model import quat_affine
+from alphafold.model import sharding
 from alphafold.model import utils
 import haiku as hk
 import jax
+from jax.experimental import io_callback
 import jax.numpy as jnp
+import numpy as np
 
 
 _SOFTMAX_MASK = -1e9
@@ -98,32 +101,131 @@ def dropout_wrapper(module,
 
   new_act = output_act + residual
 
-  return new_act
+  return sharding.shard_residues(new_act, gc)
 
 
-def create_extra_msa_feature(batch):
-  """Expand extra_msa into 1hot and concat with other extra msa features.
+class ExtraMsaEmbedding(hk.Module):
+  """Embeds the extra MSA without materializing its one-hot encoding.
 
-  We do this as late as possible as the one_hot extra msa can be very large.
+  Equivalent to a Linear layer on the concatenation of the one-hot extra MSA,
+  has_deletion and deletion_value, and has the same parameters. As the one-hot
+  part of the projection selects a row of the weights, it is computed as a
+  gather, so the memory of the embedding is that of its output.
+  """
+
+  def __init__(self, num_output, name='extra_msa_activations'):
+    super().__init__(name=name)
+    self.num_output = num_output
+
+  def __call__(self, extra_msa, has_deletion, deletion_value):
+    """Builds ExtraMsaEmbedding module.
+
+    Arguments:
+      extra_msa: [N_extra_seq, N_res] MSA that wasn't selected as a cluster
+        centre. Note, that this is not one-hot encoded.
+      has_deletion: [N_extra_seq, N_res] Whether there is a deletion to the
+        left of each position in the extra MSA.
+      deletion_value: [N_extra_seq, N_res] The number of deletions to the left
+        of each position in the extra MSA, transformed to [0, 1].
+
+    Returns:
+      Extra MSA activations of shape [N_extra_seq, N_res, num_output].
+    """
+    # 23 = 20 amino acids + 'X' for unknown + gap + bert mask, followed by
+    # has_deletion and deletion_value.
+    num_input = 23 + 2
+    weights = hk.get_parameter(
+        'weights', (num_input, self.num_output), has_deletion.dtype,
+        common_modules.get_initializer_scale('linear', (num_input,)))
+    bias = hk.get_parameter('bias', (self.num_output,), has_deletion.dtype,
+                            hk.initializers.Constant(0.))
+    return (jnp.take(weights[:23], extra_msa, axis=0) +
+            has_deletion[..., None] * weights[23] +
+            deletion_value[..., None] * weights[24] + bias)
+
+
+def extra_msa_chunk_size(global_config, num_rows, row_bytes):
+  """Number of extra MSA sequences featurized at a time.
 
   Arguments:
-    batch: a dictionary with the following keys:
-     * 'extra_msa': [N_extra_seq, N_res] MSA that wasn't selected as a cluster
-       centre. Note, that this is not one-hot encoded.
-     * 'extra_has_deletion': [N_extra_seq, N_res] Whether there is a deletion to
-       the left of each position in the extra MSA.
-     * 'extra_deletion_value': [N_extra_seq, N_res] The number of deletions to
-       the left of each position in the extra MSA.
+    global_config: The global config of the model.
+    num_rows: Number of sequences in the extra MSA.
+    row_bytes: Size in bytes of the intermediate arrays per sequence.
 
   Returns:
-    Concatenated tensor of extra MSA features.
+    The largest chunk size whose intermediate arrays fit in
+    global_config.extra_msa_chunk_memory_budget_mb if set. None means that
+    all sequences are featurized at once.
   """
-  # 23 = 20 amino acids + 'X' for unknown + gap + bert mask
-  msa_1hot = jax.nn.one_hot(batch['extra_msa'], 23)
-  msa_feat = [msa_1hot,
-              jnp.expand_dims(batch['extra_has_deletion'], axis=-1),
-              jnp.expand_dims(batch['extra_deletion_value'], axis=-1)]
-  return jnp.concatenate(msa_feat, axis=-1)
+  budget_mb = global_config.get('extra_msa_chunk_memory_budget_mb')
+  if not budget_mb:
+    return None
+  chunk_size = max(1, int(budget_mb * 2**20 // row_bytes))
+  if chunk_size >= num_rows:
+    return None
+  return chunk_size
+
+
+def ca_distance_change(prev_pos, next_pos, seq_mask):
+  """Root mean square change of the pairwise CA distances of two structures.
+
+  Arguments:
+    prev_pos: [N_res, 37, 3] atom positions of the previous recycling iteration.
+    next_pos: [N_res, 37, 3] atom positions of the next recycling iteration.
+    seq_mask: [N_res] mask of the residues.
+
+  Returns:
+    The change in Angstroms, used as the convergence criterion of recycling.
+  """
+  def distances(points):
+    """Compute all pairwise distances for a set of points."""
+    return jnp.sqrt(jnp.sum((points[:, None] - points[None, :])**2,
+                            axis=-1))
+
+  ca_idx = residue_constants.atom_order['CA']
+  sq_diff = jnp.square(distances(prev_pos[:, ca_idx, :]) -
+                       distances(next_pos[:, ca_idx, :]))
+  mask = seq_mask[:, None] * seq_mask[None, :]
+  sq_diff = utils.mask_mean(mask, sq_diff)
+  # Early stopping criteria based on criteria used in
+  # AF2Complex: https://www.nature.com/articles/s41467-022-29394-2
+  return jnp.sqrt(sq_diff + 1e-8)  # avoid bad numerics giving negatives
+
+
+def report_recycle(recycle_callback, recycle_idx, ret, prev, next_in,
+                   seq_mask):
+  """Reports a recycling iteration to a Python callback on the host.
+
+  Arguments:
+    recycle_callback: Function of the recycling iteration index, the mean
+      pLDDT and the CA distance change of that iteration, returning whether to
+      stop recycling.
+    recycle_idx: Index of the recycling iteration, starting at 0.
+    ret: Output of the recycling iteration.
+    prev: Recycled features that were input to the iteration.
+    next_in: Recycled features output by the iteration.
+    seq_mask: [N_res] mask of the residues.
+
+  Returns:
+    Boolean scalar, whether the callback requested to stop recycling.
+  """
+  logits = ret['predicted_lddt']['logits']
+  num_bins = logits.shape[-1]
+  bin_centers = (jnp.arange(num_bins) + 0.5) / num_bins
+  plddt = jnp.sum(jax.nn.softmax(logits, axis=-1) * bin_centers, axis=-1) * 100
+  mean_plddt = utils.mask_mean(seq_mask, plddt)
+  if 'prev_pos' in prev:
+    # The first iteration is compared to the zero initialized positions.
+    diff = ca_distance_change(prev['prev_pos'], next_in['prev_pos'], seq_mask)
+  else:
+    diff = jnp.array(jnp.nan)
+
+  def host_callback(recycle_idx, mean_plddt, diff):
+    return np.bool_(recycle_callback(int(recycle_idx), float(mean_plddt),
+                                     float(diff)))
+
+  return io_callback(host_callback, jax.ShapeDtypeStruct((), jnp.bool_),
+                     recycle_idx, mean_plddt, diff)
 
 
 class AlphaFoldIteration(hk.Module):
@@ -164,15 +266,23 @@ class AlphaFoldIteration(hk.Module):
     evoformer_module = EmbeddingsAndEvoformer(
         self.config.embeddings_and_evoformer, self.global_config)
     batch0 = slice_batch(0)
-    representations = evoformer_module(batch0, is_training)
 
-    # MSA representations are not ensembled so
-    # we don't pass tensor into the loop.
-    msa_representation = representations['msa']
-    del representations['msa']
+    ensemble_batch_size = min(self.config.ensemble_batch_size,
+                              ensembled_batch['seq_length'].shape[0])
+    if ensemble_representations and ensemble_batch_size > 1:
+      representations, msa_representation = self._batched_ensemble(
+          evoformer_module, ensembled_batch, non_ensembled_batch,
+          ensemble_batch_size, is_training)
+    else:
+      representations = evoformer_module(batch0, is_training)
+
+      # MSA representations are not ensembled so
+      # we don't pass tensor into the loop.
+      msa_representation = representations['msa']
+      del representations['msa']
 
     # Average the representations (except MSA) over the batch dimension.
-    if ensemble_representations:
+    if ensemble_representations and ensemble_batch_size <= 1:
       def body(x):
         """Add one element to the representations ensemble."""
         i, current_representations = x
@@ -196,6 +306,7 @@ class AlphaFoldIteration(hk.Module):
             body,
             (1, representations))
 
+    if ensemble_representations:
       for k in representations:
         if k != 'msa':
           representations[k] /= num_ensemble.astype(representations[k].dtype)
@@ -273,6 +384,64 @@ class AlphaFoldIteration(hk.Module):
       return ret
 
 
+  def _batched_ensemble(self, evoformer_module, ensembled_batch,
+                        non_ensembled_batch, ensemble_batch_size,
+                        is_training):
+    """Sums the representations of all ensemble members in vmapped batches.
+
+    Arguments:
+      evoformer_module: The EmbeddingsAndEvoformer module.
+      ensembled_batch: Features with a leading ensemble dimension.
+      non_ensembled_batch: Features shared by all ensemble members.
+      ensemble_batch_size: Number of ensemble members computed at once.
+      is_training: Whether the module is in training mode.
+
+    Returns:
+      The representations except the MSA one summed over the ensemble members
+      in the same order as the sequential loop, and the MSA representation of
+      the first member.
+    """
+    num_ensemble = ensembled_batch['seq_length'].shape[0]
+    batched_evoformer = hk.vmap(
+        lambda b: evoformer_module({**b, **non_ensembled_batch}, is_training),
+        split_rng=False)
+
+    def run_members(start, size):
+      return batched_evoformer(jax.tree.map(
+          lambda x: jax.lax.dynamic_slice_in_dim(x, start, size),
+          ensembled_batch))
+
+    def add_members(representations, members, indices):
+      for j in indices:
+        representations = {
+            k: v + members[k][j] for k, v in representations.items()}
+      return representations
+
+    members = run_members(0, ensemble_batch_size)
+    # MSA representations are not ensembled.
+    msa_representation = members.pop('msa')[0]
+    representations = add_members(
+        {k: v[0] for k, v in members.items()}, members,
+        range(1, ensemble_batch_size))
+
+    def body(x):
+      i, current_representations = x
+      members = run_members(i * ensemble_batch_size, ensemble_batch_size)
+      return i + 1, add_members(current_representations, members,
+                                range(ensemble_batch_size))
+
+    num_batches = num_ensemble // ensemble_batch_size
+    if num_batches > 1 and not hk.running_init():
+      _, representations = hk.while_loop(
+          lambda x: x[0] < num_batches, body, (1, representations))
+    remainder = num_ensemble % ensemble_batch_size
+    if remainder:
+      representations = add_members(
+          representations, run_members(num_ensemble - remainder, remainder),
+          range(remainder))
+    return representations, msa_representation
+
+
 class AlphaFold(hk.Module):
   """AlphaFold model with recycling.
 
@@ -290,17 +459,23 @@ class AlphaFold(hk.Module):
       is_training,
       compute_loss=False,
       ensemble_representations=False,
-      return_representations=False):
+      return_representations=False,
+      recycle_callback=None):
     """Run the AlphaFold model.
 
     Arguments:
-      batch: Dictionary with inputs to the AlphaFold model.
+      batch: Dictionary with inputs to the AlphaFold model. It may contain
+        `prev_pos`, `prev_msa_first_row` and `prev_pair` without an ensemble
+        dimension to start recycling from, see model.recycle_features.
       is_training: Whether the system is in training or inference mode.
       compute_loss: Whether to compute losses (requires extra features
         to be present in the batch and knowing the true structure).
       ensemble_representations: Whether to use ensembling of representations.
       return_representations: Whether to also return the intermediate
         representations.
+      recycle_callback: Optional function called on the host after each
+        recycling iteration, see `report_recycle`. Recycling stops early if
+        it returns True.
 
     Returns:
       When compute_loss is True:
@@ -357,6 +532,13 @@ class AlphaFold(hk.Module):
           [num_residues, emb_config.msa_channel])
       prev['prev_pair'] = jnp.zeros(
           [num_residues, num_residues, emb_config.pair_channel])
+    # Recycling starts from the recycled features in the batch, if any, e.g.
+    # from an earlier prediction of the target. They have no ensemble
+    # dimension, so they are taken out of the ensembled batch.
+    batch = dict(batch)
+    for k in prev:
+      if k in batch:
+        prev[k] = batch.pop(k).astype(prev[k].dtype)
 
     if self.config.num_recycle:
       if 'num_iter_recycling' in batch:
@@ -372,22 +554,45 @@ class AlphaFold(hk.Module):
         # Eval mode or tests: use the maximum number of iterations.
         num_iter = self.config.num_recycle
 
-      body = lambda x: (x[0] + 1,  # pylint: disable=g-long-lambda
-                        get_prev(do_call(x[1], recycle_idx=x[0],
-                                         compute_loss=False)))
+      # The sequence mask is the same for each ensemble batch.
+      seq_mask = batch['seq_mask'][0]
+
+      def recycle_body(x):
+        i, _, prev, _ = x
+        ret = do_call(prev, recycle_idx=i, compute_loss=False)
+        next_in = get_prev(ret)
+        if recycle_callback is None or hk.running_init():
+          stop = jnp.array(False)
+        else:
+          stop = report_recycle(recycle_callback, i, ret, prev, next_in,
+                                seq_mask)
+        return i + 1, prev, next_in, stop
+
+      def recycle_cond(x):
+        i, prev, next_in, stop = x
+        less_than_max_recycles = (i < num_iter) & ~stop
+        if 'prev_pos' not in prev:
+          return less_than_max_recycles
+        diff = ca_distance_change(prev['prev_pos'], next_in['prev_pos'],
+                                  seq_mask)
+        has_exceeded_tolerance = (
+            (i == 0) | (diff > self.config.recycle_early_stop_tolerance))
+        return less_than_max_recycles & has_exceeded_tolerance
+
       if hk.running_init():
         # When initializing the Haiku module, run one iteration of the
         # while_loop to initialize the Haiku modules used in `body`.
-        _, prev = body((0, prev))
+        num_recycles, _, prev, _ = recycle_body((0, prev, prev, False))
       else:
-        _, prev = hk.while_loop(
-            lambda x: x[0] < num_iter,
-            body,
-            (0, prev))
+        num_recycles, _, prev, _ = hk.while_loop(
+            recycle_cond,
+            recycle_body,
+            (0, prev, prev, jnp.array(False)))
     else:
-      num_iter = 0
+      num_recycles = 0
 
-    ret = do_call(prev=prev, recycle_idx=num_iter)
+    ret = do_call(prev=prev, recycle_idx=num_recycles)
+    (ret[0] if compute_loss else ret)['num_recycles'] = num_recycles  # pytype: disable=unsupported-operands
     if compute_loss:
       ret = ret[0], [ret[1]]
 
@@ -541,6 +746,116 @@ def glorot_uniform():
                                          distribution='uniform')
 
 
+def _chunked_attention(q, k, v, mask, bias, chunk_size):
+  """Attention computed over chunks of queries and keys.
+
+  Only the logits of one chunk of queries and one chunk of keys are
+  materialized at a time. The softmax over the keys is accumulated chunk by
+  chunk, rescaling the partial sums whenever the running maximum of the logits
+  changes (Rabe & Staats (2021) "Self-attention Does Not Need O(n^2) Memory").
+
+  Arguments:
+    q: Scaled queries, shape [batch_size, N_queries, num_head, key_dim].
+    k: Keys, shape [batch_size, N_keys, num_head, key_dim].
+    v: Values, shape [batch_size, N_keys, num_head, value_dim].
+    mask: A mask broadcastable to [batch_size, num_head, N_queries, N_keys].
+    bias: A bias broadcastable to [batch_size, num_head, N_queries, N_keys] or
+      None.
+    chunk_size: Maximum number of queries and of keys per chunk.
+
+  Returns:
+    The weighted average of the values, shape
+    [batch_size, N_queries, num_head, value_dim].
+  """
+  num_queries, num_keys = q.shape[1], k.shape[1]
+  query_chunk_size = min(chunk_size, num_queries)
+  key_chunk_size = min(chunk_size, num_keys)
+  num_query_chunks = -(-num_queries // query_chunk_size)
+  num_key_chunks = -(-num_keys // key_chunk_size)
+
+  def pad(x, axis, size):
+    padding = [(0, 0)] * x.ndim
+    padding[axis] = (0, size - x.shape[axis])
+    return jnp.pad(x, padding)
+
+  # Pad the queries and keys to a whole number of chunks. Padded keys are
+  # excluded from the softmax and padded queries are dropped from the output.
+  q = pad(q, 1, num_query_chunks * query_chunk_size)
+  k = pad(k, 1, num_key_chunks * key_chunk_size)
+  v = pad(v, 1, num_key_chunks * key_chunk_size)
+  key_mask = jnp.arange(num_key_chunks * key_chunk_size) < num_keys
+
+  def pad_pairwise(x):
+    x = jnp.broadcast_to(x, (1,) * (4 - x.ndim) + x.shape)
+    if x.shape[2] != 1:
+      x = pad(x, 2, num_query_chunks * query_chunk_size)
+    if x.shape[3] != 1:
+      x = pad(x, 3, num_key_chunks * key_chunk_size)
+    return x
+
+  def slice_pairwise(x, query_start, key_start):
+    if x.shape[2] != 1:
+      x = jax.lax.dynamic_slice_in_dim(x, query_start, query_chunk_size, 2)
+    if x.shape[3] != 1:
+      x = jax.lax.dynamic_slice_in_dim(x, key_start, key_chunk_size, 3)
+    return x
+
+  mask = pad_pairwise(mask)
+  if bias is not None:
+    bias = pad_pairwise(bias)
+
+  def attend_query_chunk(query_start):
+    q_chunk = jax.lax.dynamic_slice_in_dim(q, query_start, query_chunk_size, 1)
+
+    def attend_key_chunk(carry, key_start):
+      weighted_sum, normalizer, max_logit = carry
+      k_chunk = jax.lax.dynamic_slice_in_dim(k, key_start, key_chunk_size, 1)
+      v_chunk = jax.lax.dynamic_slice_in_dim(v, key_start, key_chunk_size, 1)
+      logits = jnp.einsum('bqhc,bkhc->bhqk', q_chunk, k_chunk)
+      if bias is not None:
+        logits += slice_pairwise(bias, query_start, key_start)
+      logits = jnp.where(slice_pairwise(mask, query_start, key_start), logits,
+                         _SOFTMAX_MASK)
+      # The softmax is accumulated in float32, as in utils.stable_softmax.
+      logits = logits.astype(jnp.float32)
+      logits = jnp.where(
+          jax.lax.dynamic_slice_in_dim(key_mask, key_start, key_chunk_size),
+          logits, -jnp.inf)
+
+      # The first chunk always contains a key that is not padding, so the
+      # running maximum is finite after it.
+      new_max_logit = jnp.maximum(max_logit, jnp.max(logits, axis=-1))
+      rescale = jnp.exp(max_logit - new_max_logit)
+      unnormalized_weights = jnp.exp(logits - new_max_logit[..., None])
+      normalizer = normalizer * rescale + jnp.sum(unnormalized_weights, -1)
+      weighted_sum = weighted_sum * rescale[..., None] + jnp.einsum(
+          'bhqk,bkhc->bhqc', unnormalized_weights.astype(v.dtype), v_chunk,
+          preferred_element_type=jnp.float32)
+      return (weighted_sum, normalizer, new_max_logit), None
+
+    batch_size, _, num_head, value_dim = v.shape
+    init = (
+        jnp.zeros((batch_size, num_head, query_chunk_size, value_dim),
+                  jnp.float32),
+        jnp.zeros((batch_size, num_head, query_chunk_size), jnp.float32),
+        jnp.full((batch_size, num_head, query_chunk_size), -jnp.inf,
+                 jnp.float32),
+    )
+    (weighted_sum, normalizer, _), _ = jax.lax.scan(
+        attend_key_chunk, init,
+        jnp.arange(num_key_chunks) * key_chunk_size)
+    weighted_avg = weighted_sum / normalizer[..., None]
+    return jnp.swapaxes(weighted_avg, 1, 2).astype(v.dtype)
+
+  # [num_query_chunks, batch_size, query_chunk_size, num_head, value_dim]
+  weighted_avg = jax.lax.map(
+      attend_query_chunk, jnp.arange(num_query_chunks) * query_chunk_size)
+  weighted_avg = jnp.moveaxis(weighted_avg, 0, 1)
+  weighted_avg = jnp.reshape(
+      weighted_avg, (weighted_avg.shape[0], -1) + weighted_avg.shape[3:])
+  return weighted_avg[:, :num_queries]
+
+
 class Attention(hk.Module):
   """Multihead attention."""
 
@@ -589,12 +904,19 @@ class Attention(hk.Module):
     q = jnp.einsum('bqa,ahc->bqhc', q_data, q_weights) * key_dim**(-0.5)
     k = jnp.einsum('bka,ahc->bkhc', m_data, k_weights)
     v = jnp.einsum('bka,ahc->bkhc', m_data, v_weights)
-    logits = jnp.einsum('bqhc,bkhc->bhqk', q, k)
-    if nonbatched_bias is not None:
-      logits += jnp.expand_dims(nonbatched_bias, axis=0)
-    logits = jnp.where(mask, logits, _SOFTMAX_MASK)
-    weights = utils.stable_softmax(logits)
-    weighted_avg = jnp.einsum('bhqk,bkhc->bqhc', weights, v)
+    if self.global_config.attention_chunk_size:
+      bias = None
+      if nonbatched_bias is not None:
+        bias = jnp.expand_dims(nonbatched_bias, axis=0)
+      weighted_avg = _chunked_attention(
+          q, k, v, mask, bias, self.global_config.attention_chunk_size)
+    else:
+      logits = jnp.einsum('bqhc,bkhc->bhqk', q, k)
+      if nonbatched_bias is not None:
+        logits += jnp.expand_dims(nonbatched_bias, axis=0)
+      logits = jnp.where(mask, logits, _SOFTMAX_MASK)
+      weights = utils.stable_softmax(logits)
+      weighted_avg = jnp.einsum('bhqk,bkhc->bqhc', weights, v)
 
     if self.global_config.zero_init:
       init = hk.initializers.Constant(0.0)
@@ -1274,6 +1596,33 @@ class ExperimentallyResolvedHead(hk.Module):
     return output
 
 
+def pair_chunk_size(global_config, num_rows, row_bytes, default=None):
+  """Number of rows of a pair representation update computed at a time.
+
+  Arguments:
+    global_config: The global config of the model.
+    num_rows: Number of rows of the update.
+    row_bytes: Size in bytes of the intermediate activations per row.
+    default: Chunk size if neither the global chunk size nor a memory budget
+      are set.
+
+  Returns:
+    global_config.pair_chunk_size if set, else the largest chunk size whose
+    intermediate activations fit in global_config.pair_chunk_memory_budget_mb
+    if set, else `default`. None means that all rows are computed at once.
+  """
+  if global_config.pair_chunk_size:
+    chunk_size = global_config.pair_chunk_size
+  elif global_config.pair_chunk_memory_budget_mb:
+    chunk_size = max(
+        1, int(global_config.pair_chunk_memory_budget_mb * 2**20 // row_bytes))
+  else:
+    chunk_size = default
+  if chunk_size is None or chunk_size >= num_rows:
+    return None
+  return chunk_size
+
+
 def _layer_norm(axis=-1, name='layer_norm'):
   return common_modules.LayerNorm(
       axis=axis,
@@ -1332,27 +1681,24 @@ class TriangleMultiplication(hk.Module):
     left_projection = common_modules.Linear(
         c.num_intermediate_channel,
         name='left_projection')
-    left_proj_act = mask * left_projection(act)
-
     right_projection = common_modules.Linear(
         c.num_intermediate_channel,
         name='right_projection')
-    right_proj_act = mask * right_projection(act)
-
-    left_gate_values = jax.nn.sigmoid(common_modules.Linear(
+    left_gate = common_modules.Linear(
         c.num_intermediate_channel,
         bias_init=1.,
         initializer=utils.final_init(gc),
-        name='left_gate')(act))
-
-    right_gate_values = jax.nn.sigmoid(common_modules.Linear(
+        name='left_gate')
+    right_gate = common_modules.Linear(
         c.num_intermediate_channel,
         bias_init=1.,
         initializer=utils.final_init(gc),
-        name='right_gate')(act))
+        name='right_gate')
 
-    left_proj_act *= left_gate_values
-    right_proj_act *= right_gate_values
+    output = self._make_output(int(input_act.shape[-1]))
+
+    def project(projection, gate, act, mask):
+      return mask * projection(act) * jax.nn.sigmoid(gate(act))
 
     # "Outgoing" edges equation: 'ikc,jkc->ijc'
     # "Incoming" edges equation: 'kjc,kic->ijc'
@@ -1360,30 +1706,36 @@ class TriangleMultiplication(hk.Module):
     # For the "outgoing" edges, a = left_proj_act and b = right_proj_act
     # For the "incoming" edges, it's swapped:
     #   b = left_proj_act and a = right_proj_act
-    act = jnp.einsum(c.equation, left_proj_act, right_proj_act)
-
-    act = common_modules.LayerNorm(
-        axis=[-1],
-        create_scale=True,
-        create_offset=True,
-        name='center_layer_norm')(
-            act)
-
-    output_channel = int(input_act.shape[-1])
-
-    act = common_modules.Linear(
-        output_channel,
-        initializer=utils.final_init(gc),
-        name='output_projection')(act)
-
-    gate_values = jax.nn.sigmoid(common_modules.Linear(
-        output_channel,
-        bias_init=1.,
-        initializer=utils.final_init(gc),
-        name='gating_linear')(input_act))
-    act *= gate_values
+    chunk_size = self._chunk_size(left_act)
+    if chunk_size is None:
+      left_proj_act = project(left_projection, left_gate, act, mask)
+      right_proj_act = project(right_projection, right_gate, act, mask)
+      act = jnp.einsum(c.equation, left_proj_act, right_proj_act)
+      return output(act, input_act)
+
+    # Only the projection from which the output rows are computed is chunked,
+    # the other one is needed in full by every chunk.
+    left_axis, right_axis = self._output_row_axes()
+    if left_axis is not None:
+      right_proj_act = project(right_projection, right_gate, act, mask)
+      chunk_axis = left_axis
+    else:
+      left_proj_act = project(left_projection, left_gate, act, mask)
+      chunk_axis = right_axis
+
+    def compute_chunk(act, mask, input_act):
+      if left_axis is not None:
+        act = jnp.einsum(c.equation,
+                         project(left_projection, left_gate, act, mask),
+                         right_proj_act)
+      else:
+        act = jnp.einsum(c.equation, left_proj_act,
+                         project(right_projection, right_gate, act, mask))
+      return output(act, input_act)
 
-    return act
+    return mapping.sharded_apply(
+        compute_chunk, chunk_size, in_axes=(chunk_axis, chunk_axis, 0))(
+            act, mask, input_act)
 
   @hk.transparent
   def _fused_triangle_multiplication(self, left_act, left_mask):
@@ -1409,25 +1761,93 @@ class TriangleMultiplication(hk.Module):
 
     left_proj_act = proj_act[:, :, :c.num_intermediate_channel]
     right_proj_act = proj_act[:, :, c.num_intermediate_channel:]
-    act = jnp.einsum(c.equation, left_proj_act, right_proj_act)
+    output = self._make_fused_output(int(left_act.shape[-1]))
 
-    act = _layer_norm(axis=-1, name='center_norm')(act)
+    chunk_size = self._chunk_size(left_act)
+    if chunk_size is None:
+      act = jnp.einsum(c.equation, left_proj_act, right_proj_act)
+      return output(act, left_act)
 
-    output_channel = int(left_act.shape[-1])
+    # The fused projections are computed in full, as each chunk would
+    # otherwise recompute both of them, and only the products are chunked.
+    left_axis, right_axis = self._output_row_axes()
 
-    act = common_modules.Linear(
+    def compute_chunk(left_proj_act, right_proj_act, input_act):
+      act = jnp.einsum(c.equation, left_proj_act, right_proj_act)
+      return output(act, input_act)
+
+    return mapping.sharded_apply(
+        compute_chunk, chunk_size, in_axes=(left_axis, right_axis, 0))(
+            left_proj_act, right_proj_act, left_act)
+
+  @hk.transparent
+  def _make_output(self, output_channel):
+    """Output projection and gating of _triangle_multiplication."""
+    gc = self.global_config
+
+    center_layer_norm = common_modules.LayerNorm(
+        axis=[-1],
+        create_scale=True,
+        create_offset=True,
+        name='center_layer_norm')
+    output_projection = common_modules.Linear(
+        output_channel,
+        initializer=utils.final_init(gc),
+        name='output_projection')
+    gating_linear = common_modules.Linear(
         output_channel,
+        bias_init=1.,
         initializer=utils.final_init(gc),
-        name='output_projection')(act)
+        name='gating_linear')
 
-    gate_values = common_modules.Linear(
+    def output(act, input_act):
+      act = output_projection(center_layer_norm(act))
+      gate_values = jax.nn.sigmoid(gating_linear(input_act))
+      return act * gate_values
+
+    return output
+
+  @hk.transparent
+  def _make_fused_output(self, output_channel):
+    """Output projection and gating of _fused_triangle_multiplication."""
+    gc = self.global_config
+
+    center_norm = _layer_norm(axis=-1, name='center_norm')
+    output_projection = common_modules.Linear(
+        output_channel,
+        initializer=utils.final_init(gc),
+        name='output_projection')
+    gating_linear = common_modules.Linear(
         output_channel,
         bias_init=1.,
         initializer=utils.final_init(gc),
-        name='gating_linear')(left_act)
-    act *= jax.nn.sigmoid(gate_values)
+        name='gating_linear')
 
-    return act
+    def output(act, input_act):
+      act = output_projection(center_norm(act))
+      return act * jax.nn.sigmoid(gating_linear(input_act))
+
+    return output
+
+  def _output_row_axes(self):
+    """Axes of the left and right projections indexed by the output row.
+
+    Returns:
+      The axis of the output row `i` in the left and in the right operand of
+      the equation, or None for the operand that does not depend on it.
+    """
+    operands = self.config.equation.split('->')[0].split(',')
+    return tuple(
+        operand.index('i') if 'i' in operand else None for operand in operands)
+
+  def _chunk_size(self, left_act):
+    """Number of output rows computed at a time, or None to compute all."""
+    num_res, num_channel = left_act.shape[-2:]
+    # A row of the chunked projection and its gate, of the product and its
+    # layer norm, and of the output and its gate.
+    row_bytes = (4 * self.config.num_intermediate_channel +
+                 2 * num_channel) * num_res * left_act.dtype.itemsize
+    return pair_chunk_size(self.global_config, num_res, row_bytes)
 
 
 class DistogramHead(hk.Module):
@@ -1577,9 +1997,14 @@ class OuterProductMean(hk.Module):
       act = jnp.einsum('dceb,cef->dbf', act, output_w) + output_b
       return jnp.transpose(act, [1, 0, 2])
 
+    num_res = act.shape[1]
+    # A row of the outer products and of their projection.
+    row_bytes = (c.num_outer_channel**2 +
+                 self.num_output_channel) * num_res * act.dtype.itemsize
+    chunk_size = pair_chunk_size(gc, num_res, row_bytes, c.chunk_size)
     act = mapping.inference_subbatch(
         compute_chunk,
-        c.chunk_size,
+        chunk_size,
         batched_args=[left_act],
         nonbatched_args=[],
         low_memory=True,
@@ -1789,33 +2214,65 @@ class EmbeddingsAndEvoformer(hk.Module):
 
   def __call__(self, batch, is_training, safe_key=None):
 
-    c = self.config
     gc = self.global_config
 
     if safe_key is None:
       safe_key = prng.SafeKey(hk.next_rng_key())
 
+    with utils.bfloat16_context():
+      output = self._embed_and_run_evoformer(batch, is_training, safe_key)
+
+    # Convert back to float32 if we're not saving memory.
+    if not gc.bfloat16_output:
+      for k, v in output.items():
+        if v.dtype == jnp.bfloat16:
+          output[k] = v.astype(jnp.float32)
+
+    return output
+
+  @hk.transparent
+  def _embed_and_run_evoformer(self, batch, is_training, safe_key):
+    """Embeds the inputs and runs the Evoformer in the configured precision.
+
+    With `global_config.bfloat16` the activations and parameters are cast to
+    bfloat16, while geometric features are computed in float32 first and layer
+    norms and softmaxes are computed in float32.
+
+    Arguments:
+      batch: Features of a single ensemble member.
+      is_training: Whether the module is in training mode.
+      safe_key: A prng.SafeKey.
+
+    Returns:
+      The MSA, single and pair representations.
+    """
+    c = self.config
+    gc = self.global_config
+    dtype = jnp.bfloat16 if gc.bfloat16 else jnp.float32
+    target_feat = batch['target_feat'].astype(dtype)
+
     # Embed clustered MSA.
     # Jumper et al. (2021) Suppl. Alg. 2 "Inference" line 5
     # Jumper et al. (2021) Suppl. Alg. 3 "InputEmbedder"
     preprocess_1d = common_modules.Linear(
         c.msa_channel, name='preprocess_1d')(
-            batch['target_feat'])
+            target_feat)
 
     preprocess_msa = common_modules.Linear(
         c.msa_channel, name='preprocess_msa')(
-            batch['msa_feat'])
+            batch['msa_feat'].astype(dtype))
 
     msa_activations = jnp.expand_dims(preprocess_1d, axis=0) + preprocess_msa
 
     left_single = common_modules.Linear(
         c.pair_channel, name='left_single')(
-            batch['target_feat'])
+            target_feat)
     right_single = common_modules.Linear(
         c.pair_channel, name='right_single')(
-            batch['target_feat'])
+            target_feat)
     pair_activations = left_single[:, None] + right_single[None]
     mask_2d = batch['seq_mask'][:, None] * batch['seq_mask'][None, :]
+    mask_2d = mask_2d.astype(dtype)
 
     # Inject previous outputs for recycling.
     # Jumper et al. (2021) Suppl. Alg. 2 "Inference" line 6
@@ -1824,6 +2281,7 @@ class EmbeddingsAndEvoformer(hk.Module):
       prev_pseudo_beta = pseudo_beta_fn(
           batch['aatype'], batch['prev_pos'], None)
       dgram = dgram_from_positions(prev_pseudo_beta, **self.config.prev_pos)
+      dgram = dgram.astype(dtype)
       pair_activations += common_modules.Linear(
           c.pair_channel, name='prev_pos_linear')(
               dgram)
@@ -1834,7 +2292,7 @@ class EmbeddingsAndEvoformer(hk.Module):
           create_scale=True,
           create_offset=True,
           name='prev_msa_first_row_norm')(
-              batch['prev_msa_first_row'])
+              batch['prev_msa_first_row']).astype(dtype)
       msa_activations = msa_activations.at[0].add(prev_msa_first_row)
 
       pair_activations += common_modules.LayerNorm(
@@ -1842,7 +2300,7 @@ class EmbeddingsAndEvoformer(hk.Module):
           create_scale=True,
           create_offset=True,
           name='prev_pair_norm')(
-              batch['prev_pair'])
+              batch['prev_pair']).astype(dtype)
 
     # Relative position encoding.
     # Jumper et al. (2021) Suppl. Alg. 4 "relpos"
@@ -1856,14 +2314,20 @@ class EmbeddingsAndEvoformer(hk.Module):
               offset + c.max_relative_feature,
               a_min=0,
               a_max=2 * c.max_relative_feature),
-          2 * c.max_relative_feature + 1)
+          2 * c.max_relative_feature + 1, dtype=dtype)
       pair_activations += common_modules.Linear(
           c.pair_channel, name='pair_activiations')(
               rel_pos)
 
+    # Without templates, for example once features.crop_empty_templates has
+    # removed all empty slots, the template embeddings are skipped statically.
+    # They would be masked out anyway.
+    use_templates = (c.template.enabled and
+                     batch['template_aatype'].shape[0] > 0)
+
     # Embed templates into the pair activations.
     # Jumper et al. (2021) Suppl. Alg. 2 "Inference" lines 9-13
-    if c.template.enabled:
+    if use_templates:
       template_batch = {k: batch[k] for k in batch if k.startswith('template_')}
       template_pair_representation = TemplateEmbedding(c.template, gc)(
           pair_activations,
@@ -1875,11 +2339,9 @@ class EmbeddingsAndEvoformer(hk.Module):
 
     # Embed extra MSA features.
     # Jumper et al. (2021) Suppl. Alg. 2 "Inference" lines 14-16
-    extra_msa_feat = create_extra_msa_feature(batch)
-    extra_msa_activations = common_modules.Linear(
-        c.extra_msa_channel,
-        name='extra_msa_activations')(
-            extra_msa_feat)
+    extra_msa_activations = ExtraMsaEmbedding(c.extra_msa_channel)(
+        batch['extra_msa'], batch['extra_has_deletion'],
+        batch['extra_deletion_value']).astype(dtype)
 
     # Extra MSA Stack.
     # Jumper et al. (2021) Suppl. Alg. 18 "ExtraMsaStack"
@@ -1897,7 +2359,7 @@ class EmbeddingsAndEvoformer(hk.Module):
       extra_evoformer_output = extra_msa_stack_iteration(
           activations=act,
           masks={
-              'msa': batch['extra_msa_mask'],
+              'msa': batch['extra_msa_mask'].astype(dtype),
               'pair': mask_2d
           },
           is_training=is_training,
@@ -1920,11 +2382,12 @@ class EmbeddingsAndEvoformer(hk.Module):
         'pair': pair_activations,
     }
 
-    evoformer_masks = {'msa': batch['msa_mask'], 'pair': mask_2d}
+    evoformer_masks = {'msa': batch['msa_mask'].astype(dtype),
+                       'pair': mask_2d}
 
     # Append num_templ rows to msa_activations with template embeddings.
     # Jumper et al. (2021) Suppl. Alg. 2 "Inference" lines 7-8
-    if c.template.enabled and c.template.embed_torsion_angles:
+    if use_templates and c.template.embed_torsion_angles:
       num_templ, num_res = batch['template_aatype'].shape
 
       # Embed the templates aatypes.
@@ -1951,7 +2414,7 @@ class EmbeddingsAndEvoformer(hk.Module):
           c.msa_channel,
           initializer='relu',
           name='template_single_embedding')(
-              template_features)
+              template_features.astype(dtype))
       template_activations = jax.nn.relu(template_activations)
       template_activations = common_modules.Linear(
           c.msa_channel,
@@ -157,8 +157,18 @@ def make_masked_msa(batch, key, config, epsilon=1e-6):
   return batch
 
 
-def nearest_neighbor_clusters(batch, gap_agreement_weight=0.):
-  """Assign each extra MSA sequence to its nearest neighbor in sampled MSA."""
+def nearest_neighbor_clusters(batch, gap_agreement_weight=0., chunk_size=None):
+  """Assign each extra MSA sequence to its nearest neighbor in sampled MSA.
+
+  Args:
+    batch: Features with the sampled and the extra MSA.
+    gap_agreement_weight: Weight of agreeing on a gap.
+    chunk_size: If set, the number of extra sequences whose one-hot encoding
+      and agreement with the sampled MSA are computed at a time.
+
+  Returns:
+    The cluster profile and the cluster deletion mean.
+  """
 
   # Determine how much weight we assign to each agreement.  In theory, we could
   # use a full blosum matrix here, but right now let's just down-weight gap
@@ -170,33 +180,50 @@ def nearest_neighbor_clusters(batch, gap_agreement_weight=0.):
 
   msa_mask = batch['msa_mask']
   msa_one_hot = jax.nn.one_hot(batch['msa'], 23)
+  msa_one_hot_masked = msa_mask[:, :, None] * msa_one_hot
 
-  extra_mask = batch['extra_msa_mask']
-  extra_one_hot = jax.nn.one_hot(batch['extra_msa'], 23)
+  def cluster_sums(extra_msa, extra_mask, extra_deletion_matrix):
+    extra_one_hot = jax.nn.one_hot(extra_msa, 23)
+    extra_one_hot_masked = extra_mask[:, :, None] * extra_one_hot
 
-  msa_one_hot_masked = msa_mask[:, :, None] * msa_one_hot
-  extra_one_hot_masked = extra_mask[:, :, None] * extra_one_hot
+    agreement = jnp.einsum('mrc, nrc->nm', extra_one_hot_masked,
+                           weights * msa_one_hot_masked)
 
-  agreement = jnp.einsum('mrc, nrc->nm', extra_one_hot_masked,
-                         weights * msa_one_hot_masked)
+    cluster_assignment = jax.nn.softmax(1e3 * agreement, axis=0)
+    cluster_assignment *= jnp.einsum('mr, nr->mn', msa_mask, extra_mask)
 
-  cluster_assignment = jax.nn.softmax(1e3 * agreement, axis=0)
-  cluster_assignment *= jnp.einsum('mr, nr->mn', msa_mask, extra_mask)
+    cluster_count = jnp.sum(cluster_assignment, axis=-1)
+    msa_sum = jnp.einsum('nm, mrc->nrc', cluster_assignment,
+                         extra_one_hot_masked)
+    del_sum = jnp.einsum('nm, mc->nc', cluster_assignment,
+                         extra_mask * extra_deletion_matrix)
+    return cluster_count, msa_sum, del_sum
 
-  cluster_count = jnp.sum(cluster_assignment, axis=-1)
-  cluster_count += 1.  # We always include the sequence itself.
+  extra = (batch['extra_msa'], batch['extra_msa_mask'],
+           batch['extra_deletion_matrix'])
+  num_extra_seq = extra[0].shape[0]
+  if chunk_size is None or chunk_size >= num_extra_seq:
+    cluster_count, msa_sum, del_sum = cluster_sums(*extra)
+  else:
+    # Masked padding rows are not assigned to any cluster.
+    num_chunks = -(-num_extra_seq // chunk_size)
+    extra = [jnp.pad(x, [(0, num_chunks * chunk_size - num_extra_seq), (0, 0)])
+             .reshape(num_chunks, chunk_size, -1) for x in extra]
 
-  msa_sum = jnp.einsum('nm, mrc->nrc', cluster_assignment, extra_one_hot_masked)
-  msa_sum += msa_one_hot_masked
+    def accumulate(sums, chunk):
+      return jax.tree_util.tree_map(jnp.add, sums, cluster_sums(*chunk)), None
 
-  cluster_profile = msa_sum / cluster_count[:, None, None]
+    num_seq, num_res = msa_mask.shape
+    init = (jnp.zeros(num_seq), jnp.zeros((num_seq, num_res, 23)),
+            jnp.zeros((num_seq, num_res)))
+    (cluster_count, msa_sum, del_sum), _ = jax.lax.scan(
+        accumulate, init, extra)
 
-  extra_deletion_matrix = batch['extra_deletion_matrix']
-  deletion_matrix = batch['deletion_matrix']
+  cluster_count += 1.  # We always include the sequence itself.
+  msa_sum += msa_one_hot_masked
+  cluster_profile = msa_sum / cluster_count[:, None, None]
 
-  del_sum = jnp.einsum('nm, mc->nc', cluster_assignment,
-                       extra_mask * extra_deletion_matrix)
-  del_sum += deletion_matrix  # Original sequence.
+  del_sum += batch['deletion_matrix']  # Original sequence.
   cluster_deletion_mean = del_sum / cluster_count[:, None]
 
   return cluster_profile, cluster_deletion_mean
@@ -223,33 +250,6 @@ def create_msa_feat(batch):
   return jnp.concatenate(msa_feat, axis=-1)
 
 
-def create_extra_msa_feature(batch, num_extra_msa):
-  """Expand extra_msa into 1hot and concat with other extra msa features.
-
-  We do this as late as possible as the one_hot extra msa can be very large.
-
-  Args:
-    batch: a dictionary with the following keys:
-     * 'extra_msa': [num_seq, num_res] MSA that wasn't selected as a cluster
-       centre. Note - This isn't one-hotted.
-     * 'extra_deletion_matrix': [num_seq, num_res] Number of deletions at given
-        position.
-    num_extra_msa: Number of extra msa to use.
-
-  Returns:
-    Concatenated tensor of extra MSA features.
-  """
-  # 23 = 20 amino acids + 'X' for unknown + gap + bert mask
-  extra_msa = batch['extra_msa'][:num_extra_msa]
-  deletion_matrix = batch['extra_deletion_matrix'][:num_extra_msa]
-  msa_1hot = jax.nn.one_hot(extra_msa, 23)
-  has_deletion = jnp.clip(deletion_matrix, 0., 1.)[..., None]
-  deletion_value = (jnp.arctan(deletion_matrix / 3.) * (2. / jnp.pi))[..., None]
-  extra_msa_mask = batch['extra_msa_mask'][:num_extra_msa]
-  return jnp.concatenate([msa_1hot, has_deletion, deletion_value],
-                         axis=-1), extra_msa_mask
-
-
 def sample_msa(key, batch, max_seq):
   """Sample MSA randomly, remaining sequences are stored as `extra_*`.
 
@@ -422,8 +422,26 @@ class AlphaFold(hk.Module):
       batch,
       is_training,
       return_representations=False,
-      safe_key=None):
+      safe_key=None,
+      recycle_callback=None):
+    """Runs the AlphaFold-Multimer model.
 
+    Args:
+      batch: Dictionary with inputs to the AlphaFold model. It may contain
+        `prev_pos`, `prev_msa_first_row` and `prev_pair` to start recycling
+        from, see model.recycle_features.
+      is_training: Whether the system is in training or inference mode.
+      return_representations: Whether to also return the intermediate
+        representations.
+      safe_key: Optional random key of the model.
+      recycle_callback: Optional function called on the host after each
+        recycling iteration, see `modules.report_recycle`. Recycling stops
+        early if it returns True.
+
+    Returns:
+      The output of the final recycling iteration and the number of recycling
+      iterations run before it.
+    """
     c = self.config
     impl = AlphaFoldIteration(c, self.global_config)
 
@@ -461,6 +479,11 @@ class AlphaFold(hk.Module):
           [num_res, emb_config.msa_channel])
       prev['prev_pair'] = jnp.zeros(
           [num_res, num_res, emb_config.pair_channel])
+    # Recycling starts from the recycled features in the batch, if any, e.g.
+    # from an earlier prediction of the target.
+    for k in prev:
+      if k in batch:
+        prev[k] = batch[k].astype(prev[k].dtype)
 
     if self.config.num_recycle:
       if 'num_iter_recycling' in batch:
@@ -475,40 +498,35 @@ class AlphaFold(hk.Module):
         # Eval mode or tests: use the maximum number of iterations.
         num_iter = c.num_recycle
 
-      def distances(points):
-        """Compute all pairwise distances for a set of points."""
-        return jnp.sqrt(jnp.sum((points[:, None] - points[None, :])**2,
-                                axis=-1))
-
       def recycle_body(x):
-        i, _, prev, safe_key = x
+        i, _, prev, safe_key, _ = x
         safe_key1, safe_key2 = safe_key.split() if c.resample_msa_in_recycling else safe_key.duplicate()  # pylint: disable=line-too-long
         ret = apply_network(prev=prev, safe_key=safe_key2)
-        return i+1, prev, get_prev(ret), safe_key1
+        next_in = get_prev(ret)
+        if recycle_callback is None or hk.running_init():
+          stop = jnp.array(False)
+        else:
+          stop = modules.report_recycle(recycle_callback, i, ret, prev,
+                                        next_in, batch['seq_mask'])
+        return i+1, prev, next_in, safe_key1, stop
 
       def recycle_cond(x):
-        i, prev, next_in, _ = x
-        ca_idx = residue_constants.atom_order['CA']
-        sq_diff = jnp.square(distances(prev['prev_pos'][:, ca_idx, :]) -
-                             distances(next_in['prev_pos'][:, ca_idx, :]))
-        mask = batch['seq_mask'][:, None] * batch['seq_mask'][None, :]
-        sq_diff = utils.mask_mean(mask, sq_diff)
-        # Early stopping criteria based on criteria used in
-        # AF2Complex: https://www.nature.com/articles/s41467-022-29394-2
-        diff = jnp.sqrt(sq_diff + 1e-8)  # avoid bad numerics giving negatives
-        less_than_max_recycles = (i < num_iter)
+        i, prev, next_in, _, stop = x
+        diff = modules.ca_distance_change(
+            prev['prev_pos'], next_in['prev_pos'], batch['seq_mask'])
+        less_than_max_recycles = (i < num_iter) & ~stop
         has_exceeded_tolerance = (
             (i == 0) | (diff > c.recycle_early_stop_tolerance))
         return less_than_max_recycles & has_exceeded_tolerance
 
       if hk.running_init():
-        num_recycles, _, prev, safe_key = recycle_body(
-            (0, prev, prev, safe_key))
+        num_recycles, _, prev, safe_key, _ = recycle_body(
+            (0, prev, prev, safe_key, False))
       else:
-        num_recycles, _, prev, safe_key = hk.while_loop(
+        num_recycles, _, prev, safe_key, _ = hk.while_loop(
             recycle_cond,
             recycle_body,
-            (0, prev, prev, safe_key))
+            (0, prev, prev, safe_key, jnp.array(False)))
     else:
       # No recycling.
       num_recycles = 0
@@ -633,8 +651,14 @@ class EmbeddingsAndEvoformer(hk.Module):
       batch = sample_msa(sample_key, batch, c.num_msa)
       batch = make_masked_msa(batch, mask_key, c.masked_msa)
 
+      num_msa, num_res = batch['msa'].shape
+      # The one-hot extra MSA, its masked copy and the agreement, cluster
+      # assignment and softmax intermediates of each extra sequence.
+      row_bytes = 4 * (2 * num_res * 23 + 3 * num_msa)
       (batch['cluster_profile'],
-       batch['cluster_deletion_mean']) = nearest_neighbor_clusters(batch)
+       batch['cluster_deletion_mean']) = nearest_neighbor_clusters(
+           batch, chunk_size=modules.extra_msa_chunk_size(
+               gc, batch['extra_msa'].shape[0], row_bytes))
 
       msa_feat = create_msa_feat(batch).astype(dtype)
 
@@ -689,6 +713,8 @@ class EmbeddingsAndEvoformer(hk.Module):
             'template_all_atom_positions': batch['template_all_atom_positions'],
             'template_all_atom_mask': batch['template_all_atom_mask']
         }
+        if 'template_weight' in batch:
+          template_batch['template_weight'] = batch['template_weight']
         # Construct a mask such that only intra-chain template features are
         # computed, since all templates are for each chain individually.
         multichain_mask = batch['asym_id'][:, None] == batch['asym_id'][None, :]
@@ -703,13 +729,13 @@ class EmbeddingsAndEvoformer(hk.Module):
         pair_activations += template_act
 
       # Extra MSA stack.
-      (extra_msa_feat,
-       extra_msa_mask) = create_extra_msa_feature(batch, c.num_extra_msa)
-      extra_msa_activations = common_modules.Linear(
-          c.extra_msa_channel,
-          name='extra_msa_activations')(
-              extra_msa_feat).astype(dtype)
-      extra_msa_mask = extra_msa_mask.astype(dtype)
+      extra_deletion_matrix = (
+          batch['extra_deletion_matrix'][:c.num_extra_msa])
+      extra_msa_activations = modules.ExtraMsaEmbedding(c.extra_msa_channel)(
+          batch['extra_msa'][:c.num_extra_msa],
+          jnp.clip(extra_deletion_matrix, 0., 1.),
+          jnp.arctan(extra_deletion_matrix / 3.) * (2. / jnp.pi)).astype(dtype)
+      extra_msa_mask = batch['extra_msa_mask'][:c.num_extra_msa].astype(dtype)
 
       extra_evoformer_input = {
           'msa': extra_msa_activations,
@@ -839,6 +865,9 @@ class TemplateEmbedding(hk.Module):
           positions for all templates.
         `template_all_atom_mask`: [num_templates, num_res, 37] mask for each
           template.
+        `template_weight`: Optional [num_templates] number of identical
+          templates each one stands for, see
+          features.merge_empty_multimer_templates. Defaults to 1.
       padding_mask_2d: [num_res, num_res] Pair mask for attention operations.
       multichain_mask_2d: [num_res, num_res] Mask indicating which residue pairs
         are intra-chain, used to mask out residue distance based features
@@ -875,18 +904,25 @@ class TemplateEmbedding(hk.Module):
     safe_key, unsafe_key = safe_key.split()
     unsafe_keys = jax.random.split(unsafe_key._key, num_templates)
 
+    dtype = query_embedding.dtype
+    if 'template_weight' in template_batch:
+      template_weight = template_batch['template_weight'].astype(dtype)
+    else:
+      template_weight = jnp.ones(num_templates, dtype=dtype)
+
     def scan_fn(carry, x):
-      return carry + partial_template_embedder(*x), None
+      *x, weight = x
+      return carry + weight * partial_template_embedder(*x), None
 
-    scan_init = jnp.zeros((num_res, num_res, c.num_channels),
-                          dtype=query_embedding.dtype)
+    scan_init = jnp.zeros((num_res, num_res, c.num_channels), dtype=dtype)
     summed_template_embeddings, _ = hk.scan(
         scan_fn, scan_init,
         (template_batch['template_aatype'],
          template_batch['template_all_atom_positions'],
-         template_batch['template_all_atom_mask'], unsafe_keys))
+         template_batch['template_all_atom_mask'], unsafe_keys,
+         template_weight))
 
-    embedding = summed_template_embeddings / num_templates
+    embedding = summed_template_embeddings / jnp.sum(template_weight)
     embedding = jax.nn.relu(embedding)
     embedding = common_modules.Linear(
         query_num_channels,
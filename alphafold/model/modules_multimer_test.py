@@ -0,0 +1,53 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for modules_multimer."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.model import modules_multimer
+import numpy as np
+
+
+def _make_msa_batch(num_res, num_seq, num_extra_seq, seed=0):
+  """Makes a random sampled and extra MSA with some masked entries."""
+  rng = np.random.default_rng(seed)
+  return {
+      'msa': rng.integers(0, 23, (num_seq, num_res)).astype(np.int32),
+      'msa_mask': (rng.random((num_seq, num_res)) > 0.1).astype(np.float32),
+      'deletion_matrix': rng.integers(
+          0, 4, (num_seq, num_res)).astype(np.float32),
+      'extra_msa': rng.integers(
+          0, 23, (num_extra_seq, num_res)).astype(np.int32),
+      'extra_msa_mask': (
+          rng.random((num_extra_seq, num_res)) > 0.1).astype(np.float32),
+      'extra_deletion_matrix': rng.integers(
+          0, 4, (num_extra_seq, num_res)).astype(np.float32),
+  }
+
+
+class NearestNeighborClustersTest(parameterized.TestCase):
+
+  @parameterized.parameters(1, 7, 16)
+  def test_chunked_matches_full(self, chunk_size):
+    batch = _make_msa_batch(num_res=12, num_seq=5, num_extra_seq=30)
+    expected = modules_multimer.nearest_neighbor_clusters(batch)
+    actual = modules_multimer.nearest_neighbor_clusters(
+        batch, chunk_size=chunk_size)
+    for a, e in zip(actual, expected):
+      np.testing.assert_allclose(a, e, rtol=1e-5, atol=1e-5)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,453 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Tests for modules."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.model import common_modules
+from alphafold.model import config
+from alphafold.model import features
+from alphafold.model import model
+from alphafold.model import modules
+import haiku as hk
+import jax
+import jax.numpy as jnp
+import numpy as np
+
+
+def _make_global_config(attention_chunk_size=None, pair_chunk_size=None,
+                        pair_chunk_memory_budget_mb=None):
+  global_config = config.model_config('model_1').model.global_config
+  global_config.attention_chunk_size = attention_chunk_size
+  global_config.pair_chunk_size = pair_chunk_size
+  global_config.pair_chunk_memory_budget_mb = pair_chunk_memory_budget_mb
+  global_config.zero_init = False
+  return global_config
+
+
+def _assert_chunking_matches(forward, chunked_global_config, *args):
+  """Checks that a module gives the same output with the chunked config.
+
+  Args:
+    forward: Function of the global config and `args` applying the module.
+    chunked_global_config: Global config with chunking enabled.
+    *args: Inputs of the module.
+
+  Returns:
+    The parameters of the module.
+  """
+  full = hk.transform(lambda *args: forward(_make_global_config(), *args))
+  chunked = hk.transform(
+      lambda *args: forward(chunked_global_config, *args))
+  params = full.init(jax.random.PRNGKey(0), *args)
+  chunked_params = chunked.init(jax.random.PRNGKey(0), *args)
+  jax.tree.map(lambda x, y: np.testing.assert_equal(x.shape, y.shape),
+               chunked_params, params)
+  expected = full.apply(params, None, *args)
+  actual = chunked.apply(params, None, *args)
+  np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-5)
+  return params
+
+
+class AttentionTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('divisible', 5, 4),
+      ('padded', 7, 3),
+      ('larger_than_input', 64, 5),
+  )
+  def test_chunked_attention_matches_full_attention(self, chunk_size, seed):
+    num_res = 10
+    rng = np.random.default_rng(seed)
+    pair_act = rng.normal(size=(num_res, num_res, 16)).astype(np.float32)
+    pair_mask = (rng.random((num_res, num_res)) > 0.3).astype(np.float32)
+    # A fully masked row, as for padding residues.
+    pair_mask[-1] = 0.
+    evoformer_config = config.model_config(
+        'model_1').model.embeddings_and_evoformer.evoformer
+    attention_config = evoformer_config.triangle_attention_starting_node
+
+    def forward(pair_act, pair_mask, attention_chunk_size):
+      return modules.TriangleAttention(
+          attention_config,
+          _make_global_config(attention_chunk_size=attention_chunk_size))(
+              pair_act, pair_mask)
+
+    full = hk.transform(lambda *args: forward(*args, None))
+    chunked = hk.transform(lambda *args: forward(*args, chunk_size))
+    params = full.init(jax.random.PRNGKey(0), pair_act, pair_mask)
+    expected = full.apply(params, None, pair_act, pair_mask)
+    actual = chunked.apply(params, None, pair_act, pair_mask)
+
+    self.assertEqual(actual.shape, expected.shape)
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-5)
+
+
+class PairChunkingTest(parameterized.TestCase):
+
+  @parameterized.product(
+      name=('triangle_multiplication_outgoing',
+            'triangle_multiplication_incoming'),
+      fuse_projection_weights=(False, True),
+      chunk_size=(4, 7),
+  )
+  def test_chunked_triangle_multiplication(self, name, fuse_projection_weights,
+                                           chunk_size):
+    rng = np.random.default_rng(0)
+    pair_act = rng.normal(size=(10, 10, 16)).astype(np.float32)
+    pair_mask = (rng.random((10, 10)) > 0.2).astype(np.float32)
+    module_config = config.model_config(
+        'model_1').model.embeddings_and_evoformer.evoformer[name]
+    module_config.fuse_projection_weights = fuse_projection_weights
+
+    def forward(global_config, pair_act, pair_mask):
+      return modules.TriangleMultiplication(
+          module_config, global_config, name=name)(pair_act, pair_mask)
+
+    params = _assert_chunking_matches(
+        forward, _make_global_config(pair_chunk_size=chunk_size), pair_act,
+        pair_mask)
+    # The parameter names must match those of the released parameters.
+    self.assertIn(f'{name}/output_projection', params)
+
+  def test_chunked_outer_product_mean(self):
+    rng = np.random.default_rng(0)
+    msa_act = rng.normal(size=(6, 10, 16)).astype(np.float32)
+    msa_mask = (rng.random((6, 10)) > 0.2).astype(np.float32)
+    module_config = config.model_config(
+        'model_1').model.embeddings_and_evoformer.evoformer.outer_product_mean
+
+    def forward(global_config, msa_act, msa_mask):
+      return modules.OuterProductMean(
+          module_config, global_config, num_output_channel=8)(
+              msa_act, msa_mask)
+
+    # Rows of 10 * (32 * 32 + 8) float32 values, so chunks of 3 rows.
+    _assert_chunking_matches(
+        forward, _make_global_config(pair_chunk_memory_budget_mb=0.12),
+        msa_act, msa_mask)
+
+  def test_pair_chunk_size(self):
+    global_config = _make_global_config()
+    self.assertIsNone(modules.pair_chunk_size(global_config, 100, 2**20))
+    self.assertEqual(
+        modules.pair_chunk_size(global_config, 100, 2**20, default=8), 8)
+    global_config.pair_chunk_memory_budget_mb = 10
+    self.assertEqual(modules.pair_chunk_size(global_config, 100, 2**20), 10)
+    self.assertEqual(modules.pair_chunk_size(global_config, 100, 2**30), 1)
+    self.assertIsNone(modules.pair_chunk_size(global_config, 5, 2**20))
+    global_config.pair_chunk_size = 16
+    self.assertEqual(modules.pair_chunk_size(global_config, 100, 2**20), 16)
+
+
+class ExtraMsaEmbeddingTest(absltest.TestCase):
+
+  def test_matches_linear_on_one_hot(self):
+    rng = np.random.default_rng(0)
+    extra_msa = rng.integers(0, 23, (5, 7)).astype(np.int32)
+    has_deletion = (rng.random((5, 7)) > 0.5).astype(np.float32)
+    deletion_value = rng.random((5, 7)).astype(np.float32)
+    extra_msa_feat = np.concatenate([
+        np.eye(23, dtype=np.float32)[extra_msa], has_deletion[..., None],
+        deletion_value[..., None]], axis=-1)
+
+    linear = hk.transform(lambda x: common_modules.Linear(
+        16, name='extra_msa_activations')(x))
+    embedding = hk.transform(
+        lambda *args: modules.ExtraMsaEmbedding(16)(*args))
+    params = linear.init(jax.random.PRNGKey(0), extra_msa_feat)
+    params = jax.tree.map(
+        lambda x: rng.normal(size=x.shape).astype(np.float32), params)
+    jax.tree.map(lambda x, y: np.testing.assert_equal(x.shape, y.shape),
+                 embedding.init(jax.random.PRNGKey(0), extra_msa,
+                                has_deletion, deletion_value), params)
+    np.testing.assert_allclose(
+        embedding.apply(params, None, extra_msa, has_deletion,
+                        deletion_value),
+        linear.apply(params, None, extra_msa_feat), rtol=1e-5, atol=1e-5)
+
+  def test_extra_msa_chunk_size(self):
+    global_config = config.model_config(
+        'model_1_multimer_v3').model.global_config
+    self.assertIsNone(modules.extra_msa_chunk_size(global_config, 100, 2**20))
+    global_config.extra_msa_chunk_memory_budget_mb = 10
+    self.assertEqual(
+        modules.extra_msa_chunk_size(global_config, 100, 2**20), 10)
+    self.assertIsNone(modules.extra_msa_chunk_size(global_config, 5, 2**20))
+
+
+def _make_evoformer_config(templates=True):
+  """Makes the config of a `model_1` Evoformer with a single block per stack."""
+  model_config = config.model_config('model_1').model
+  evoformer_config = model_config.embeddings_and_evoformer
+  evoformer_config.evoformer_num_block = 1
+  evoformer_config.extra_msa_stack_num_block = 1
+  evoformer_config.template.enabled = templates
+  evoformer_config.template.template_pair_stack.num_block = 1
+  return evoformer_config
+
+
+def _make_evoformer_batch(num_res, num_seq, num_extra_seq, num_templates=0,
+                          num_empty_templates=0, seed=0):
+  """Makes random processed features of a single ensemble member."""
+  rng = np.random.default_rng(seed)
+  aatype = rng.integers(0, 20, num_res)
+  # Empty template slots are padded with zeros, as in the input pipeline.
+  template_mask = np.zeros(num_templates + num_empty_templates, np.float32)
+  template_mask[:num_templates] = 1
+  template_atom_mask = template_mask[:, None, None] * np.ones(
+      (1, num_res, 37), np.float32)
+  template_positions = rng.normal(
+      size=(len(template_mask), num_res, 37, 3)).astype(np.float32) * 10
+  return {
+      'template_aatype': (template_mask[:, None] * rng.integers(
+          0, 21, (len(template_mask), num_res))).astype(np.int32),
+      'template_all_atom_positions': (
+          template_atom_mask[..., None] * template_positions),
+      'template_all_atom_masks': template_atom_mask,
+      'template_mask': template_mask,
+      'template_pseudo_beta': template_positions[:, :, 1],
+      'template_pseudo_beta_mask': template_atom_mask[:, :, 1],
+      'aatype': aatype.astype(np.int32),
+      'target_feat': np.eye(22, dtype=np.float32)[aatype + 1],
+      'msa_feat': rng.random((num_seq, num_res, 49)).astype(np.float32),
+      'msa_mask': np.ones((num_seq, num_res), dtype=np.float32),
+      'seq_mask': np.ones(num_res, dtype=np.float32),
+      'residue_index': np.arange(num_res, dtype=np.int32),
+      'extra_msa': rng.integers(0, 23, (num_extra_seq, num_res)).astype(
+          np.int32),
+      'extra_has_deletion': np.zeros((num_extra_seq, num_res), np.float32),
+      'extra_deletion_value': np.zeros((num_extra_seq, num_res), np.float32),
+      'extra_msa_mask': np.ones((num_extra_seq, num_res), dtype=np.float32),
+      'prev_pos': rng.normal(size=(num_res, 37, 3)).astype(np.float32) * 10,
+      'prev_msa_first_row': rng.normal(size=(num_res, 256)).astype(np.float32),
+      'prev_pair': rng.normal(size=(num_res, num_res, 128)).astype(np.float32),
+  }
+
+
+class EmbeddingsAndEvoformerTest(parameterized.TestCase):
+
+  def test_bfloat16(self):
+    evoformer_config = _make_evoformer_config(templates=False)
+    batch = _make_evoformer_batch(num_res=12, num_seq=4, num_extra_seq=8)
+
+    def forward(bfloat16, bfloat16_output, batch):
+      global_config = _make_global_config()
+      global_config.bfloat16 = bfloat16
+      global_config.bfloat16_output = bfloat16_output
+      return modules.EmbeddingsAndEvoformer(evoformer_config, global_config)(
+          batch, is_training=False)
+
+    float32 = hk.transform(lambda batch: forward(False, False, batch))
+    bfloat16 = hk.transform(lambda batch: forward(True, False, batch))
+    params = float32.init(jax.random.PRNGKey(0), batch)
+    # Parameters are stored in float32 and only cast when used.
+    bfloat16_params = jax.eval_shape(
+        bfloat16.init, jax.random.PRNGKey(0), batch)
+    jax.tree.map(lambda x, y: self.assertEqual((x.shape, x.dtype),
+                                               (y.shape, y.dtype)),
+                 bfloat16_params, params)
+
+    expected = jax.jit(float32.apply)(params, jax.random.PRNGKey(1), batch)
+    actual = jax.jit(bfloat16.apply)(params, jax.random.PRNGKey(1), batch)
+    for k, v in actual.items():
+      with self.subTest(k):
+        self.assertEqual(v.dtype, jnp.float32)
+        # Errors relative to the scale of the activations, dominated by the
+        # 8 bit mantissa of bfloat16.
+        scale = np.abs(expected[k]).max()
+        np.testing.assert_allclose(v, expected[k], atol=0.02 * scale)
+
+    bfloat16_output = hk.transform(lambda batch: forward(True, True, batch))
+    output_shapes = jax.eval_shape(
+        bfloat16_output.apply, params, jax.random.PRNGKey(1), batch)
+    for v in output_shapes.values():
+      self.assertEqual(v.dtype, jnp.bfloat16)
+
+  @parameterized.named_parameters(
+      ('with_templates', 2),
+      ('without_templates', 0),
+  )
+  def test_crop_empty_templates(self, num_templates):
+    evoformer_config = _make_evoformer_config()
+    batch = _make_evoformer_batch(
+        num_res=12, num_seq=4, num_extra_seq=8, num_templates=num_templates,
+        num_empty_templates=2)
+    # Cropping works on features with a leading ensemble dimension.
+    cropped_batch = jax.tree.map(
+        lambda x: x[0],
+        features.crop_empty_templates(jax.tree.map(lambda x: x[None], batch)))
+    self.assertLen(cropped_batch['template_mask'], num_templates)
+
+    forward = hk.transform(
+        lambda batch: modules.EmbeddingsAndEvoformer(  # pylint: disable=g-long-lambda
+            evoformer_config, _make_global_config())(batch, is_training=False))
+    params = forward.init(jax.random.PRNGKey(0), batch)
+    expected = forward.apply(params, jax.random.PRNGKey(1), batch)
+    actual = forward.apply(params, jax.random.PRNGKey(1), cropped_batch)
+    for k, v in actual.items():
+      with self.subTest(k):
+        np.testing.assert_allclose(v, expected[k], rtol=1e-4, atol=1e-4)
+
+
+def _make_alphafold_config(num_recycle, recycle_early_stop_tolerance):
+  cfg = config.model_config('model_1')
+  cfg.data.common.use_numpy_pipeline = True
+  cfg.data.common.num_recycle = num_recycle
+  cfg.data.common.max_extra_msa = 8
+  cfg.data.common.reduce_msa_clusters_by_max_templates = False
+  cfg.data.eval.max_msa_clusters = 4
+  cfg.model.num_recycle = num_recycle
+  cfg.model.recycle_early_stop_tolerance = recycle_early_stop_tolerance
+  evoformer_config = cfg.model.embeddings_and_evoformer
+  evoformer_config.evoformer_num_block = 1
+  evoformer_config.extra_msa_stack_num_block = 1
+  evoformer_config.template.enabled = False
+  cfg.model.heads.structure_module.num_layer = 2
+  cfg.model.global_config.zero_init = False
+  return cfg
+
+
+def _make_alphafold_batch(cfg, num_res, num_seq, seed=0):
+  """Makes processed features of a random target without templates."""
+  rng = np.random.default_rng(seed)
+  msa = rng.integers(0, 21, (num_seq, num_res))
+  raw_features = {
+      'aatype': np.eye(21, dtype=np.int32)[msa[0]],
+      'between_segment_residues': np.zeros(num_res, dtype=np.int32),
+      'residue_index': np.arange(num_res, dtype=np.int32),
+      'seq_length': np.full(num_res, num_res, dtype=np.int32),
+      'msa': msa.astype(np.int32),
+      'deletion_matrix_int': np.zeros((num_seq, num_res), dtype=np.int32),
+      'num_alignments': np.full(num_res, num_seq, dtype=np.int32),
+      'template_aatype': np.zeros((0, num_res, 22), np.float32),
+      'template_all_atom_masks': np.zeros((0, num_res, 37), np.float32),
+      'template_all_atom_positions': np.zeros((0, num_res, 37, 3), np.float32),
+      'template_domain_names': np.zeros((0,), dtype=np.object_),
+      'template_sum_probs': np.zeros((0, 1), np.float32),
+  }
+  return features.np_example_to_features(raw_features, cfg, random_seed=seed)
+
+
+class AlphaFoldTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('no_early_stop', -1., 3),
+      # Recycling stops once the structure changes by less than the tolerance,
+      # but not before the first recycling iteration.
+      ('early_stop', 1e6, 1),
+  )
+  def test_recycle_early_stop(self, tolerance, expected_num_recycles):
+    cfg = _make_alphafold_config(
+        num_recycle=3, recycle_early_stop_tolerance=tolerance)
+    batch = _make_alphafold_batch(cfg, num_res=8, num_seq=6)
+    forward = hk.transform(
+        lambda batch: modules.AlphaFold(cfg.model)(  # pylint: disable=g-long-lambda
+            batch, is_training=False))
+    params = forward.init(jax.random.PRNGKey(0), batch)
+    ret = jax.jit(forward.apply)(params, jax.random.PRNGKey(1), batch)
+    self.assertEqual(ret['num_recycles'], expected_num_recycles)
+    self.assertEqual(ret['structure_module']['final_atom_positions'].shape,
+                     (8, 37, 3))
+
+  def test_recycle_callback(self):
+    cfg = _make_alphafold_config(
+        num_recycle=3, recycle_early_stop_tolerance=-1.)
+    batch = _make_alphafold_batch(cfg, num_res=8, num_seq=6)
+    calls = []
+
+    def recycle_callback(recycle_idx, mean_plddt, ca_distance_change):
+      calls.append((recycle_idx, mean_plddt, ca_distance_change))
+      return recycle_idx == 1
+
+    forward = hk.transform(
+        lambda batch: modules.AlphaFold(cfg.model)(  # pylint: disable=g-long-lambda
+            batch, is_training=False, recycle_callback=recycle_callback))
+    params = forward.init(jax.random.PRNGKey(0), batch)
+    self.assertEmpty(calls)
+    ret = jax.jit(forward.apply)(params, jax.random.PRNGKey(1), batch)
+    jax.block_until_ready(ret)
+
+    self.assertEqual(ret['num_recycles'], 2)
+    self.assertEqual([recycle_idx for recycle_idx, _, _ in calls], [0, 1])
+    for _, mean_plddt, ca_distance_change in calls:
+      self.assertBetween(mean_plddt, 0., 100.)
+      self.assertGreater(ca_distance_change, 0.)
+
+  def test_warm_start_continues_recycling(self):
+    cfg = _make_alphafold_config(
+        num_recycle=0, recycle_early_stop_tolerance=-1.)
+    # The iterations see the same MSA, so recycling once from zeros is the
+    # same as starting from the outputs of a prediction without recycling.
+    cfg.data.common.resample_msa_in_recycling = False
+    cfg.model.resample_msa_in_recycling = False
+    batch = _make_alphafold_batch(cfg, num_res=8, num_seq=6)
+
+    def forward(batch):
+      return modules.AlphaFold(cfg.model)(
+          batch, is_training=False, return_representations=True)
+
+    cold = hk.transform(forward)
+    params = cold.init(jax.random.PRNGKey(0), batch)
+    first = jax.jit(cold.apply)(params, jax.random.PRNGKey(1), batch)
+    cfg.model.num_recycle = 1
+    expected = jax.jit(hk.transform(forward).apply)(
+        params, jax.random.PRNGKey(1), batch)
+    cfg.model.num_recycle = 0
+    warm_batch = {**batch, **model.recycle_features(
+        num_res=8, prediction_result=jax.device_get(first))}
+    actual = jax.jit(hk.transform(forward).apply)(
+        params, jax.random.PRNGKey(1), warm_batch)
+
+    self.assertEqual(expected['num_recycles'], 1)
+    np.testing.assert_allclose(
+        actual['structure_module']['final_atom_positions'],
+        expected['structure_module']['final_atom_positions'],
+        rtol=1e-4, atol=1e-4)
+
+  def test_ensemble_batch_size(self):
+    cfg = _make_alphafold_config(
+        num_recycle=0, recycle_early_stop_tolerance=-1.)
+    # Batches of 2 members run before, in and after the loop over batches.
+    cfg.data.eval.num_ensemble = 5
+    batch = _make_alphafold_batch(cfg, num_res=8, num_seq=6)
+
+    def forward(batch):
+      return modules.AlphaFold(cfg.model)(
+          batch, is_training=False, ensemble_representations=True,
+          return_representations=True)
+
+    sequential = hk.transform(forward)
+    params = sequential.init(jax.random.PRNGKey(0), batch)
+    expected = jax.jit(sequential.apply)(params, jax.random.PRNGKey(1), batch)
+    cfg.model.ensemble_batch_size = 2
+    batched = hk.transform(forward)
+    # The vmapped ensemble members share the parameters of the loop.
+    jax.tree.map(lambda x, y: np.testing.assert_equal(x.shape, y.shape),
+                 batched.init(jax.random.PRNGKey(0), batch), params)
+    actual = jax.jit(batched.apply)(params, jax.random.PRNGKey(1), batch)
+    for k in ['pair', 'single', 'msa']:
+      np.testing.assert_allclose(actual['representations'][k],
+                                 expected['representations'][k],
+                                 rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(
+        actual['structure_module']['final_atom_positions'],
+        expected['structure_module']['final_atom_positions'],
+        rtol=1e-4, atol=1e-4)
+
+
+if __name__ == '__main__':
+  absltest.main()
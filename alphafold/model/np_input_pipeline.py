@@ -0,0 +1,570 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""NumPy feature pre-processing input pipeline for AlphaFold.
+
+This is an eval-mode port of alphafold/model/tf/input_pipeline.py and the
+transforms it uses from alphafold/model/tf/data_transforms.py. It produces
+features with the same names, shapes and dtypes without building and running a
+TensorFlow graph; only the MSA cluster assignment runs in JAX. The random
+choices (MSA sampling, BERT-style MSA masking and cropping of the extra MSA) are
+drawn from a NumPy generator, so the output is reproducible for a given seed but
+not sample-for-sample identical to the output of the TensorFlow pipeline for
+the same seed.
+"""
+
+from typing import Dict, Mapping, Sequence
+
+from alphafold.common import residue_constants
+from alphafold.model.tf import shape_placeholders
+import jax
+import jax.numpy as jnp
+import ml_collections
+import numpy as np
+
+NUM_RES = shape_placeholders.NUM_RES
+NUM_MSA_SEQ = shape_placeholders.NUM_MSA_SEQ
+NUM_EXTRA_SEQ = shape_placeholders.NUM_EXTRA_SEQ
+NUM_TEMPLATES = shape_placeholders.NUM_TEMPLATES
+
+FeatureDict = Mapping[str, np.ndarray]
+ProteinDict = Dict[str, np.ndarray]
+
+_MSA_FEATURE_NAMES = [
+    'msa', 'deletion_matrix', 'msa_mask', 'msa_row_mask', 'bert_mask',
+    'true_msa'
+]
+
+_HHBLITS_TO_OUR_AATYPE = np.array(
+    residue_constants.MAP_HHBLITS_AATYPE_TO_OUR_AATYPE, dtype=np.int32)
+
+
+def _one_hot(indices: np.ndarray, depth: int) -> np.ndarray:
+  return np.eye(depth, dtype=np.float32)[indices]
+
+
+def _deletion_value(deletion_matrix: np.ndarray) -> np.ndarray:
+  return np.arctan(deletion_matrix / 3.) * (2. / np.pi)
+
+
+def _make_atom14_tables():
+  """Makes the per-restype lookup tables used by make_atom14_masks."""
+  restype_atom14_to_atom37 = []
+  restype_atom37_to_atom14 = []
+  restype_atom14_mask = []
+  for rt in residue_constants.restypes:
+    atom_names = residue_constants.restype_name_to_atom14_names[
+        residue_constants.restype_1to3[rt]]
+    restype_atom14_to_atom37.append([
+        (residue_constants.atom_order[name] if name else 0)
+        for name in atom_names
+    ])
+    atom_name_to_idx14 = {name: i for i, name in enumerate(atom_names)}
+    restype_atom37_to_atom14.append([
+        (atom_name_to_idx14[name] if name in atom_name_to_idx14 else 0)
+        for name in residue_constants.atom_types
+    ])
+    restype_atom14_mask.append([(1. if name else 0.) for name in atom_names])
+
+  # Add dummy mapping for restype 'UNK'.
+  restype_atom14_to_atom37.append([0] * 14)
+  restype_atom37_to_atom14.append([0] * 37)
+  restype_atom14_mask.append([0.] * 14)
+
+  restype_atom37_mask = np.zeros([21, 37], dtype=np.float32)
+  for restype, restype_letter in enumerate(residue_constants.restypes):
+    restype_name = residue_constants.restype_1to3[restype_letter]
+    for atom_name in residue_constants.residue_atoms[restype_name]:
+      restype_atom37_mask[restype, residue_constants.atom_order[atom_name]] = 1
+
+  return (np.array(restype_atom14_to_atom37, dtype=np.int32),
+          np.array(restype_atom37_to_atom14, dtype=np.int32),
+          np.array(restype_atom14_mask, dtype=np.float32),
+          restype_atom37_mask)
+
+
+(_RESTYPE_ATOM14_TO_ATOM37, _RESTYPE_ATOM37_TO_ATOM14, _RESTYPE_ATOM14_MASK,
+ _RESTYPE_ATOM37_MASK) = _make_atom14_tables()
+
+
+def make_protein_dict(np_example: FeatureDict,
+                      feature_names: Sequence[str]) -> ProteinDict:
+  """Selects, casts and squeezes the raw features like np_to_tensor_dict.
+
+  This covers correct_msa_restypes, cast_64bit_ints and squeeze_features of
+  the TensorFlow pipeline.
+
+  Args:
+    np_example: Features as output by the data pipeline, with a float
+      `deletion_matrix`.
+    feature_names: Names of the features to keep.
+
+  Returns:
+    The selected features with the shapes and dtypes the transforms expect.
+  """
+  feature_names = set(feature_names) | {'aatype', 'sequence', 'seq_length'}
+  protein = {k: np.asarray(v) for k, v in np_example.items()
+             if k in feature_names}
+
+  protein['aatype'] = np.argmax(protein['aatype'], axis=-1).astype(np.int32)
+  protein['seq_length'] = np.int32(protein['seq_length'].reshape(-1)[0])
+  if 'num_alignments' in protein:
+    protein['num_alignments'] = np.int32(
+        protein['num_alignments'].reshape(-1)[0])
+  for k in ('residue_index', 'between_segment_residues'):
+    if k in protein:
+      protein[k] = protein[k].reshape(-1).astype(np.int32)
+  if 'msa' in protein:
+    protein['msa'] = _HHBLITS_TO_OUR_AATYPE[protein['msa']]
+  if 'deletion_matrix' in protein:
+    protein['deletion_matrix'] = protein['deletion_matrix'].astype(np.float32)
+  for k in ('template_aatype', 'template_all_atom_positions',
+            'template_all_atom_masks', 'template_sum_probs'):
+    if k in protein:
+      protein[k] = protein[k].astype(np.float32)
+  if 'template_sum_probs' in protein:
+    protein['template_sum_probs'] = protein['template_sum_probs'].reshape(
+        -1, 1)
+  return protein
+
+
+def add_distillation_flag(protein: ProteinDict) -> ProteinDict:
+  protein['is_distillation'] = np.float32(0.)
+  return protein
+
+
+def make_seq_mask(protein: ProteinDict) -> ProteinDict:
+  protein['seq_mask'] = np.ones(protein['aatype'].shape, dtype=np.float32)
+  return protein
+
+
+def make_msa_mask(protein: ProteinDict) -> ProteinDict:
+  """Mask features are all ones, but will later be zero-padded."""
+  protein['msa_mask'] = np.ones(protein['msa'].shape, dtype=np.float32)
+  protein['msa_row_mask'] = np.ones(protein['msa'].shape[0], dtype=np.float32)
+  return protein
+
+
+def make_hhblits_profile(protein: ProteinDict) -> ProteinDict:
+  """Computes the HHblits MSA profile if not already present."""
+  if 'hhblits_profile' in protein:
+    return protein
+  num_seq, num_res = protein['msa'].shape
+  counts = np.bincount(
+      (np.arange(num_res) * 22 + protein['msa']).ravel(),
+      minlength=num_res * 22)
+  protein['hhblits_profile'] = (
+      counts.reshape(num_res, 22) / num_seq).astype(np.float32)
+  return protein
+
+
+def make_random_crop_to_size_seed(protein: ProteinDict,
+                                  rng: np.random.Generator) -> ProteinDict:
+  int32 = np.iinfo(np.int32)
+  protein['random_crop_to_size_seed'] = rng.integers(
+      int32.min, int32.max, size=2, dtype=np.int32)
+  return protein
+
+
+def fix_templates_aatype(protein: ProteinDict) -> ProteinDict:
+  """Maps one-hot HHblits template aatypes to our aatype indices."""
+  protein['template_aatype'] = _HHBLITS_TO_OUR_AATYPE[
+      np.argmax(protein['template_aatype'], axis=-1)]
+  return protein
+
+
+def make_template_mask(protein: ProteinDict) -> ProteinDict:
+  protein['template_mask'] = np.ones(
+      protein['template_domain_names'].shape, dtype=np.float32)
+  return protein
+
+
+def make_template_pseudo_beta(protein: ProteinDict) -> ProteinDict:
+  """Creates template pseudo-beta (alpha for glycine) positions and masks."""
+  is_gly = protein['template_aatype'] == residue_constants.restype_order['G']
+  ca_idx = residue_constants.atom_order['CA']
+  cb_idx = residue_constants.atom_order['CB']
+  positions = protein['template_all_atom_positions']
+  masks = protein['template_all_atom_masks']
+  protein['template_pseudo_beta'] = np.where(
+      is_gly[..., None], positions[..., ca_idx, :], positions[..., cb_idx, :])
+  protein['template_pseudo_beta_mask'] = np.where(
+      is_gly, masks[..., ca_idx], masks[..., cb_idx]).astype(np.float32)
+  return protein
+
+
+def make_atom14_masks(protein: ProteinDict) -> ProteinDict:
+  """Constructs denser atom positions (14 dimensions instead of 37)."""
+  aatype = protein['aatype']
+  protein['atom14_atom_exists'] = _RESTYPE_ATOM14_MASK[aatype]
+  protein['residx_atom14_to_atom37'] = _RESTYPE_ATOM14_TO_ATOM37[aatype]
+  protein['residx_atom37_to_atom14'] = _RESTYPE_ATOM37_TO_ATOM14[aatype]
+  protein['atom37_atom_exists'] = _RESTYPE_ATOM37_MASK[aatype]
+  return protein
+
+
+def sample_msa(protein: ProteinDict, rng: np.random.Generator, max_seq: int,
+               keep_extra: bool) -> ProteinDict:
+  """Samples the MSA randomly, remaining sequences are stored as `extra_*`."""
+  num_seq = protein['msa'].shape[0]
+  index_order = np.concatenate([[0], rng.permutation(num_seq - 1) + 1])
+  num_sel = min(max_seq, num_seq)
+  sel_seq, not_sel_seq = index_order[:num_sel], index_order[num_sel:]
+
+  for k in _MSA_FEATURE_NAMES:
+    if k in protein:
+      if keep_extra:
+        protein['extra_' + k] = protein[k][not_sel_seq]
+      protein[k] = protein[k][sel_seq]
+  return protein
+
+
+def make_masked_msa(protein: ProteinDict, rng: np.random.Generator,
+                    config: ml_collections.ConfigDict,
+                    replace_fraction: float) -> ProteinDict:
+  """Creates data for BERT on the raw MSA."""
+  msa = protein['msa']
+  mask_position = rng.random(msa.shape) < replace_fraction
+
+  # Only the masked positions are resampled, so the categorical distribution
+  # is only built for them rather than for the whole MSA.
+  _, masked_res = np.nonzero(mask_position)
+  random_aa = np.array([0.05] * 20 + [0., 0.], dtype=np.float32)
+  categorical_probs = (
+      config.uniform_prob * random_aa +
+      config.profile_prob * protein['hhblits_profile'][masked_res] +
+      config.same_prob * _one_hot(msa[mask_position], 22))
+
+  # Put all remaining probability on [MASK] which is a new column.
+  mask_prob = 1. - config.profile_prob - config.same_prob - config.uniform_prob
+  assert mask_prob >= 0.
+  categorical_probs = np.pad(categorical_probs, [(0, 0), (0, 1)],
+                             constant_values=mask_prob)
+  cdf = np.cumsum(categorical_probs, axis=-1)
+  u = rng.random((len(cdf), 1)) * cdf[:, -1:]
+  sampled = np.minimum(np.sum(u >= cdf, axis=-1), 22)
+
+  bert_msa = msa.copy()
+  bert_msa[mask_position] = sampled
+
+  # Mix real and masked MSA.
+  protein['bert_mask'] = mask_position.astype(np.float32)
+  protein['true_msa'] = msa
+  protein['msa'] = bert_msa
+  return protein
+
+
+@jax.jit
+def _nearest_neighbor_clusters(sample_one_hot: jax.Array, extra_msa: jax.Array,
+                               extra_msa_mask: jax.Array) -> jax.Array:
+  extra_one_hot = extra_msa_mask[:, :, None] * jax.nn.one_hot(extra_msa, 23)
+  agreement = jnp.dot(extra_one_hot.reshape(extra_msa.shape[0], -1),
+                      sample_one_hot.reshape(sample_one_hot.shape[0], -1).T)
+  return jnp.argmax(agreement, axis=1).astype(jnp.int32)
+
+
+def nearest_neighbor_clusters(protein: ProteinDict,
+                              gap_agreement_weight: float = 0.,
+                              chunk_size: int = 1024) -> ProteinDict:
+  """Assigns each extra MSA sequence to its nearest neighbor in sampled MSA.
+
+  The agreement matmul dominates the cost of the whole pipeline, so it runs
+  as a jitted JAX computation over fixed-size chunks of the extra MSA.
+
+  Args:
+    protein: Features with the sampled and the extra MSA.
+    gap_agreement_weight: Weight of agreeing on a gap.
+    chunk_size: Number of extra sequences compared with the sampled MSA at a
+      time, which bounds the size of the one-hot and agreement arrays.
+
+  Returns:
+    The features with the cluster of each extra sequence.
+  """
+  # Down-weight gap agreement as it could be spurious and never put weight on
+  # agreeing on the BERT mask.
+  weights = np.concatenate([
+      np.ones(21), gap_agreement_weight * np.ones(1), np.zeros(1)
+  ]).astype(np.float32)
+  sample_one_hot = jax.device_put(protein['msa_mask'][:, :, None] *
+                                  _one_hot(protein['msa'], 23) * weights)
+
+  extra_msa = protein['extra_msa']
+  extra_msa_mask = protein['extra_msa_mask']
+  num_extra_seq = extra_msa.shape[0]
+  # Pad the extra MSA to whole chunks so that all chunks share one compilation.
+  num_chunks = -(-num_extra_seq // chunk_size)
+  padding = [(0, num_chunks * chunk_size - num_extra_seq), (0, 0)]
+  extra_msa = np.pad(extra_msa, padding)
+  extra_msa_mask = np.pad(extra_msa_mask, padding)
+  assignment = [np.zeros(0, dtype=np.int32)]
+  for start in range(0, extra_msa.shape[0], chunk_size):
+    end = start + chunk_size
+    assignment.append(_nearest_neighbor_clusters(
+        sample_one_hot, extra_msa[start:end], extra_msa_mask[start:end]))
+
+  protein['extra_cluster_assignment'] = np.concatenate(
+      [np.asarray(a) for a in assignment])[:num_extra_seq]
+  return protein
+
+
+def summarize_clusters(protein: ProteinDict) -> ProteinDict:
+  """Produces profile and deletion_matrix_mean within each cluster."""
+  num_seq, num_res = protein['msa'].shape
+  # Flat (cluster, residue) index of every extra MSA entry.
+  cluster_res = (protein['extra_cluster_assignment'][:, None] * num_res +
+                 np.arange(num_res)).ravel()
+
+  def csum(indices, weights, depth=1):
+    # Without extra sequences, bincount returns integers.
+    return np.bincount(indices, weights=weights.ravel(),
+                       minlength=num_seq * num_res * depth).astype(np.float64)
+
+  mask = protein['extra_msa_mask']
+  mask_counts = 1e-6 + protein['msa_mask'] + csum(cluster_res, mask).reshape(
+      num_seq, num_res)  # Include center
+
+  msa_sum = csum(cluster_res * 23 + protein['extra_msa'].ravel(), mask,
+                 depth=23).reshape(num_seq, num_res, 23)
+  msa_sum += _one_hot(protein['msa'], 23)  # Original sequence
+  protein['cluster_profile'] = (
+      msa_sum / mask_counts[:, :, None]).astype(np.float32)
+  del msa_sum
+
+  del_sum = csum(cluster_res, mask * protein['extra_deletion_matrix']).reshape(
+      num_seq, num_res)
+  del_sum += protein['deletion_matrix']  # Original sequence
+  protein['cluster_deletion_mean'] = (del_sum / mask_counts).astype(np.float32)
+  return protein
+
+
+def crop_extra_msa(protein: ProteinDict, rng: np.random.Generator,
+                   max_extra_msa: int) -> ProteinDict:
+  """MSA features are cropped so only `max_extra_msa` sequences are kept."""
+  num_seq = protein['extra_msa'].shape[0]
+  select_indices = rng.permutation(num_seq)[:min(max_extra_msa, num_seq)]
+  for k in _MSA_FEATURE_NAMES:
+    if 'extra_' + k in protein:
+      protein['extra_' + k] = protein['extra_' + k][select_indices]
+  return protein
+
+
+def delete_extra_msa(protein: ProteinDict) -> ProteinDict:
+  for k in _MSA_FEATURE_NAMES:
+    if 'extra_' + k in protein:
+      del protein['extra_' + k]
+  return protein
+
+
+def make_msa_feat(protein: ProteinDict) -> ProteinDict:
+  """Creates and concatenates MSA features."""
+  # Whether there is a domain break. Always zero for chains, but keeping
+  # for compatibility with domain datasets.
+  has_break = np.clip(
+      protein['between_segment_residues'].astype(np.float32), 0, 1)
+  target_feat = [
+      has_break[:, None],
+      _one_hot(protein['aatype'], 21),  # Everyone gets the original sequence.
+  ]
+
+  deletion_matrix = protein['deletion_matrix']
+  msa_feat = [
+      _one_hot(protein['msa'], 23),
+      np.clip(deletion_matrix, 0., 1.)[..., None],
+      _deletion_value(deletion_matrix)[..., None],
+  ]
+  if 'cluster_profile' in protein:
+    msa_feat.extend([
+        protein['cluster_profile'],
+        _deletion_value(protein['cluster_deletion_mean'])[..., None],
+    ])
+
+  if 'extra_deletion_matrix' in protein:
+    protein['extra_has_deletion'] = np.clip(
+        protein['extra_deletion_matrix'], 0., 1.)
+    protein['extra_deletion_value'] = _deletion_value(
+        protein['extra_deletion_matrix'])
+
+  protein['msa_feat'] = np.concatenate(msa_feat, axis=-1).astype(np.float32)
+  protein['target_feat'] = np.concatenate(
+      target_feat, axis=-1).astype(np.float32)
+  return protein
+
+
+def select_feat(protein: ProteinDict,
+                feature_list: Sequence[str]) -> ProteinDict:
+  return {k: v for k, v in protein.items() if k in feature_list}
+
+
+def crop_templates(protein: ProteinDict, max_templates: int) -> ProteinDict:
+  for k, v in protein.items():
+    if k.startswith('template_'):
+      protein[k] = v[:max_templates]
+  return protein
+
+
+def crop_to_size(protein: ProteinDict, crop_size: int,
+                 max_templates: int) -> ProteinDict:
+  """Eval-mode random_crop_to_size, which keeps the top templates.
+
+  make_data_config sets the eval crop size to the number of residues, so
+  residues are never cropped in eval mode and only the number of templates is
+  limited.
+
+  Args:
+    protein: Features to crop.
+    crop_size: Number of residues to crop to.
+    max_templates: Maximum number of templates to keep.
+
+  Returns:
+    The cropped features.
+  """
+  if protein['seq_length'] > crop_size:
+    raise ValueError(f'Cannot crop {protein["seq_length"]} residues to '
+                     f'{crop_size} in eval mode.')
+  protein = crop_templates(protein, max_templates)
+  protein['seq_length'] = np.int32(protein['seq_length'])
+  return protein
+
+
+def make_fixed_size(protein: ProteinDict,
+                    shape_schema: Mapping[str, Sequence[object]],
+                    msa_cluster_size: int,
+                    extra_msa_size: int,
+                    num_res: int,
+                    num_templates: int = 0) -> ProteinDict:
+  """Pads the MSA, residue and template dimensions to fixed sizes."""
+  pad_size_map = {
+      NUM_RES: num_res,
+      NUM_MSA_SEQ: msa_cluster_size,
+      NUM_EXTRA_SEQ: extra_msa_size,
+      NUM_TEMPLATES: num_templates,
+  }
+
+  for k, v in protein.items():
+    # Don't transfer this to the accelerator.
+    if k == 'extra_cluster_assignment':
+      continue
+    shape = v.shape
+    schema = shape_schema[k]
+    assert len(shape) == len(schema), (
+        f'Rank mismatch between shape and shape schema for {k}: '
+        f'{shape} vs {schema}')
+    pad_size = [
+        pad_size_map.get(s2, None) or s1 for (s1, s2) in zip(shape, schema)
+    ]
+    padding = [(0, p - s) for p, s in zip(pad_size, shape)]
+    if padding:
+      protein[k] = np.pad(v, padding)
+  return protein
+
+
+def nonensembled_transforms(protein: ProteinDict,
+                            data_config: ml_collections.ConfigDict,
+                            rng: np.random.Generator) -> ProteinDict:
+  """Input pipeline transforms which are not ensembled."""
+  protein = add_distillation_flag(protein)
+  protein = make_seq_mask(protein)
+  protein = make_msa_mask(protein)
+  # Compute the HHblits profile if it's not set. This has to be run before
+  # sampling the MSA.
+  protein = make_hhblits_profile(protein)
+  protein = make_random_crop_to_size_seed(protein, rng)
+  if data_config.common.use_templates:
+    protein = fix_templates_aatype(protein)
+    protein = make_template_mask(protein)
+    protein = make_template_pseudo_beta(protein)
+  protein = make_atom14_masks(protein)
+  return protein
+
+
+def ensembled_transforms(protein: ProteinDict,
+                         data_config: ml_collections.ConfigDict,
+                         rng: np.random.Generator) -> ProteinDict:
+  """Input pipeline transforms that can be ensembled and averaged."""
+  common_cfg = data_config.common
+  eval_cfg = data_config.eval
+
+  if common_cfg.reduce_msa_clusters_by_max_templates:
+    pad_msa_clusters = eval_cfg.max_msa_clusters - eval_cfg.max_templates
+  else:
+    pad_msa_clusters = eval_cfg.max_msa_clusters
+  max_extra_msa = common_cfg.max_extra_msa
+
+  protein = sample_msa(protein, rng, pad_msa_clusters, keep_extra=True)
+
+  if 'masked_msa' in common_cfg:
+    # Masked MSA should come *before* MSA clustering so that
+    # the clustering and full MSA profile do not leak information about
+    # the masked locations and secret corrupted locations.
+    protein = make_masked_msa(protein, rng, common_cfg.masked_msa,
+                              eval_cfg.masked_msa_replace_fraction)
+
+  if common_cfg.msa_cluster_features:
+    protein = nearest_neighbor_clusters(
+        protein, chunk_size=common_cfg.cluster_assignment_chunk_size)
+    protein = summarize_clusters(protein)
+
+  # Crop after creating the cluster profiles.
+  if max_extra_msa:
+    protein = crop_extra_msa(protein, rng, max_extra_msa)
+  else:
+    protein = delete_extra_msa(protein)
+
+  protein = make_msa_feat(protein)
+
+  crop_feats = dict(eval_cfg.feat)
+  if eval_cfg.fixed_size:
+    if eval_cfg.subsample_templates:
+      raise NotImplementedError(
+          'Template subsampling is not supported by the NumPy pipeline.')
+    protein = select_feat(protein, list(crop_feats))
+    protein = crop_to_size(protein, eval_cfg.crop_size, eval_cfg.max_templates)
+    protein = make_fixed_size(protein, crop_feats, pad_msa_clusters,
+                              common_cfg.max_extra_msa, eval_cfg.crop_size,
+                              eval_cfg.max_templates)
+  else:
+    protein = crop_templates(protein, eval_cfg.max_templates)
+  return protein
+
+
+def process_np_example(np_example: FeatureDict,
+                       data_config: ml_collections.ConfigDict,
+                       feature_names: Sequence[str],
+                       random_seed: int = 0) -> FeatureDict:
+  """Processes features like input_pipeline.process_tensors_from_config.
+
+  Args:
+    np_example: Features as output by the data pipeline, with a float
+      `deletion_matrix`.
+    data_config: The data config as made by features.make_data_config.
+    feature_names: Names of the raw features to use, as made by
+      features.make_data_config.
+    random_seed: Seed of all the random choices of the pipeline.
+
+  Returns:
+    The processed features, with a leading ensemble dimension.
+  """
+  rng = np.random.default_rng(random_seed)
+  protein = make_protein_dict(np_example, feature_names)
+  protein = nonensembled_transforms(protein, data_config, rng)
+
+  num_ensemble = data_config.eval.num_ensemble
+  if data_config.common.resample_msa_in_recycling:
+    # Separate batch per ensembling & recycling step.
+    num_ensemble *= data_config.common.num_recycle + 1
+
+  ensembles = [ensembled_transforms(dict(protein), data_config, rng)
+               for _ in range(num_ensemble)]
+  return {k: np.stack([e[k] for e in ensembles]) for k in ensembles[0]
+          if ensembles[0][k].dtype != np.object_}
@@ -0,0 +1,187 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for np_input_pipeline."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.common import residue_constants
+from alphafold.model import config
+from alphafold.model import features
+import numpy as np
+
+
+def _make_raw_features(num_res, num_seq, num_templates, repeated_msa_rows,
+                       seed=0):
+  """Makes random features in the format output by the data pipeline."""
+  rng = np.random.default_rng(seed)
+  sequence = rng.integers(0, 20, num_res)
+  if repeated_msa_rows:
+    # All rows but the query are the same, so that the random MSA sampling
+    # does not change the processed features.
+    msa = np.stack([sequence] + [rng.integers(0, 22, num_res)] * (num_seq - 1))
+    deletion_matrix = np.stack(
+        [np.zeros(num_res)] + [rng.integers(0, 4, num_res)] * (num_seq - 1))
+  else:
+    msa = np.concatenate(
+        [sequence[None], rng.integers(0, 22, (num_seq - 1, num_res))])
+    deletion_matrix = rng.integers(0, 4, (num_seq, num_res))
+  return {
+      'aatype': np.eye(21, dtype=np.int32)[sequence],
+      'between_segment_residues': np.zeros(num_res, dtype=np.int32),
+      'domain_name': np.array([b'test'], dtype=np.object_),
+      'residue_index': np.arange(num_res, dtype=np.int32),
+      'seq_length': np.full(num_res, num_res, dtype=np.int32),
+      'sequence': np.array([b'A' * num_res], dtype=np.object_),
+      'msa': msa.astype(np.int32),
+      'deletion_matrix_int': deletion_matrix.astype(np.int32),
+      'num_alignments': np.full(num_res, num_seq, dtype=np.int32),
+      'template_aatype': np.eye(22, dtype=np.float32)[
+          rng.integers(0, 22, (num_templates, num_res))],
+      'template_all_atom_masks': rng.integers(
+          0, 2, (num_templates, num_res, 37)).astype(np.float32),
+      'template_all_atom_positions': rng.normal(
+          size=(num_templates, num_res, 37, 3)).astype(np.float32),
+      'template_domain_names': np.array(
+          [b'template'] * num_templates, dtype=np.object_),
+      'template_sum_probs': rng.random((num_templates, 1)).astype(np.float32),
+  }
+
+
+def _make_config(use_numpy_pipeline, masked_msa_replace_fraction=0.15):
+  cfg = config.model_config('model_1')
+  cfg.data.eval.max_msa_clusters = 12
+  cfg.data.common.max_extra_msa = 32
+  cfg.data.common.num_recycle = 1
+  cfg.data.eval.masked_msa_replace_fraction = masked_msa_replace_fraction
+  cfg.data.common.use_numpy_pipeline = use_numpy_pipeline
+  return cfg
+
+
+class NpInputPipelineTest(parameterized.TestCase):
+
+  @parameterized.named_parameters(
+      ('with_templates', 2),
+      ('without_templates', 0),
+  )
+  def test_matches_tf_pipeline(self, num_templates):
+    # Without masking and with identical MSA rows, the processed features do
+    # not depend on the random choices of either pipeline.
+    raw_features = _make_raw_features(
+        num_res=30, num_seq=40, num_templates=num_templates,
+        repeated_msa_rows=True)
+    tf_features = features.np_example_to_features(
+        raw_features,
+        _make_config(use_numpy_pipeline=False, masked_msa_replace_fraction=0.),
+        random_seed=1)
+    np_features = features.np_example_to_features(
+        raw_features,
+        _make_config(use_numpy_pipeline=True, masked_msa_replace_fraction=0.),
+        random_seed=1)
+
+    self.assertSameElements(np_features.keys(), tf_features.keys())
+    for k, tf_feature in tf_features.items():
+      with self.subTest(k):
+        self.assertEqual(np_features[k].dtype, tf_feature.dtype)
+        self.assertEqual(np_features[k].shape, tf_feature.shape)
+        if k != 'random_crop_to_size_seed':
+          np.testing.assert_allclose(np_features[k], tf_feature, atol=1e-6)
+
+  def test_sampling_keeps_all_sequences(self):
+    raw_features = _make_raw_features(
+        num_res=20, num_seq=30, num_templates=0, repeated_msa_rows=False)
+    processed = features.np_example_to_features(
+        raw_features,
+        _make_config(use_numpy_pipeline=True, masked_msa_replace_fraction=0.),
+        random_seed=3)
+
+    raw_msa = np.array(residue_constants.MAP_HHBLITS_AATYPE_TO_OUR_AATYPE)[
+        raw_features['msa']]
+    expected_rows = sorted(map(tuple, raw_msa))
+    for i in range(processed['msa_feat'].shape[0]):
+      msa = np.argmax(processed['msa_feat'][i, :, :, :23], axis=-1)
+      msa = msa[processed['msa_row_mask'][i] > 0]
+      extra_msa = processed['extra_msa'][i][
+          processed['extra_msa_row_mask'][i] > 0]
+      # The query stays first and every sequence is sampled exactly once.
+      np.testing.assert_array_equal(msa[0], raw_msa[0])
+      self.assertEqual(
+          sorted(map(tuple, np.concatenate([msa, extra_msa]))), expected_rows)
+
+  @parameterized.named_parameters(
+      ('numpy', True),
+      ('tf', False),
+  )
+  def test_cluster_assignment_chunk_size(self, use_numpy_pipeline):
+    raw_features = _make_raw_features(
+        num_res=20, num_seq=40, num_templates=0, repeated_msa_rows=False)
+    cfg = _make_config(use_numpy_pipeline=use_numpy_pipeline)
+    expected = features.np_example_to_features(raw_features, cfg, 3)
+    cfg.data.common.cluster_assignment_chunk_size = 7
+    actual = features.np_example_to_features(raw_features, cfg, 3)
+    for k in ['msa_feat', 'extra_msa']:
+      np.testing.assert_allclose(actual[k], expected[k], rtol=1e-6)
+
+  def test_random_seed(self):
+    raw_features = _make_raw_features(
+        num_res=20, num_seq=30, num_templates=0, repeated_msa_rows=False)
+    cfg = _make_config(use_numpy_pipeline=True)
+    processed = features.np_example_to_features(raw_features, cfg, 3)
+    same_seed = features.np_example_to_features(raw_features, cfg, 3)
+    other_seed = features.np_example_to_features(raw_features, cfg, 4)
+
+    for k in processed:
+      np.testing.assert_array_equal(processed[k], same_seed[k])
+    self.assertFalse(
+        np.array_equal(processed['msa_feat'], other_seed['msa_feat']))
+    self.assertGreater(processed['bert_mask'].sum(), 0)
+    # Every ensemble and recycling iteration samples the MSA independently.
+    self.assertFalse(
+        np.array_equal(processed['msa_feat'][0], processed['msa_feat'][1]))
+
+  @parameterized.named_parameters(
+      ('shallow_numpy', 20, True, 32, 8),
+      # model_1 leaves 4 of the 64 clusters for templates.
+      ('deep_numpy', 100, True, 60, 64),
+      ('shallow_tf', 20, False, 32, 8),
+  )
+  def test_msa_depth_buckets(self, num_seq, use_numpy_pipeline,
+                             expected_clusters, expected_extra):
+    raw_features = _make_raw_features(
+        num_res=20, num_seq=num_seq, num_templates=0, repeated_msa_rows=False)
+    cfg = _make_config(use_numpy_pipeline=use_numpy_pipeline)
+    cfg.data.eval.max_msa_clusters = 64
+    cfg.data.common.max_extra_msa = 128
+    cfg.data.common.msa_depth_buckets = []
+    unbucketed = features.np_example_to_features(raw_features, cfg, 3)
+    cfg.data.common.msa_depth_buckets = [8, 16, 32, 64]
+    bucketed = features.np_example_to_features(raw_features, cfg, 3)
+
+    self.assertEqual(bucketed['msa_feat'].shape[1], expected_clusters)
+    self.assertEqual(bucketed['extra_msa'].shape[1], expected_extra)
+    # The same sequences are sampled, only the padding is shorter.
+    for k, feature in bucketed.items():
+      if k == 'random_crop_to_size_seed':
+        continue
+      with self.subTest(k):
+        np.testing.assert_array_equal(
+            feature, unbucketed[k][tuple(slice(n) for n in feature.shape)])
+    self.assertEqual(unbucketed['msa_row_mask'].sum(),
+                     bucketed['msa_row_mask'].sum())
+    self.assertEqual(unbucketed['extra_msa_row_mask'].sum(),
+                     bucketed['extra_msa_row_mask'].sum())
+
+
+if __name__ == '__main__':
+  absltest.main()
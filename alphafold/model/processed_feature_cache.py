@@ -0,0 +1,124 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory cache of processed features shared between model runners."""
+
+import collections
+import hashlib
+from typing import Any, Mapping, Optional, Tuple
+
+from absl import logging
+from alphafold.model import features
+from alphafold.model import model
+import jax
+import numpy as np
+
+
+def fingerprint_features(raw_features: features.FeatureDict) -> str:
+  """Returns a hash of the names, dtypes, shapes and values of the features."""
+  h = hashlib.sha256()
+  for name in sorted(raw_features):
+    value = np.asarray(raw_features[name])
+    h.update(f'{name}:{value.dtype.str}:{value.shape}'.encode('utf-8'))
+    if value.dtype == np.object_:
+      h.update(repr(value.tolist()).encode('utf-8'))
+    else:
+      h.update(np.ascontiguousarray(value).data)
+  return h.hexdigest()
+
+
+def data_config_key(model_runner: model.RunModel) -> Optional[str]:
+  """Returns a hash of the config the runner processes features with.
+
+  Args:
+    model_runner: The runner whose feature processing is described.
+
+  Returns:
+    For multimer runners, whose feature processing does not depend on the data
+    config or the seed, only whether they merge empty templates.
+  """
+  crop_empty_templates = (
+      model_runner.config.model.global_config.crop_empty_templates)
+  if model_runner.multimer_mode:
+    return f'multimer,crop_empty_templates={crop_empty_templates}'
+  data_config = model_runner.config.data.to_json_best_effort(sort_keys=True)
+  data_config += f',crop_empty_templates={crop_empty_templates}'
+  return hashlib.sha256(data_config.encode('utf-8')).hexdigest()
+
+
+class ProcessedFeatureCache:
+  """Reuses processed features between runners with the same data config.
+
+  Features processed by RunModel.process_features only depend on the data
+  config, the random seed and the raw features, so runners that agree on all
+  three get the same host arrays, and the same device arrays, instead of
+  processing and transferring identical features again. For multimer runners
+  the seed is ignored since their features are not processed.
+
+  Only the most recently used entries are kept, which is enough when runners
+  with the same data config run one after the other.
+  """
+
+  def __init__(self, max_entries: int = 1):
+    """Initializes the cache.
+
+    Args:
+      max_entries: Maximum number of processed feature dicts to keep, together
+        with their device copies.
+    """
+    self._max_entries = max_entries
+    self._entries = collections.OrderedDict()
+    # Fingerprint of the last raw features, which are usually passed again.
+    self._last_raw_features = None
+    self._last_fingerprint = None
+
+  def _fingerprint(self, raw_features: features.FeatureDict) -> str:
+    if raw_features is not self._last_raw_features:
+      self._last_fingerprint = fingerprint_features(raw_features)
+      self._last_raw_features = raw_features
+    return self._last_fingerprint
+
+  def process_features(
+      self, model_runner: model.RunModel, raw_features: features.FeatureDict,
+      random_seed: int) -> Tuple[features.FeatureDict, Mapping[str, Any]]:
+    """Processes features with the runner unless a matching entry is cached.
+
+    Args:
+      model_runner: The runner to process the features with.
+      raw_features: The output of the data pipeline.
+      random_seed: The random seed to process the features with.
+
+    Returns:
+      The processed features as NumPy arrays and as device arrays, to be
+      passed to RunModel.predict.
+    """
+    config_key = data_config_key(model_runner)
+    key = (config_key, None if model_runner.multimer_mode else random_seed,
+           self._fingerprint(raw_features))
+    if key in self._entries:
+      logging.info('Reusing processed features')
+      self._entries.move_to_end(key)
+      return self._entries[key]
+
+    host_features = model_runner.process_features(
+        raw_features, random_seed=random_seed)
+    self._entries[key] = (host_features, jax.device_put(host_features))
+    while len(self._entries) > self._max_entries:
+      self._entries.popitem(last=False)
+    return self._entries[key]
+
+  def clear(self) -> None:
+    self._entries.clear()
+    self._last_raw_features = None
+    self._last_fingerprint = None
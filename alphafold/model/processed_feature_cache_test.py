@@ -0,0 +1,83 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for processed_feature_cache."""
+
+from unittest import mock
+
+from absl.testing import absltest
+from alphafold.model import config
+from alphafold.model import model
+from alphafold.model import processed_feature_cache
+import numpy as np
+
+
+def _mock_runner(model_name):
+  runner = mock.create_autospec(model.RunModel, instance=True)
+  runner.config = config.model_config(model_name)
+  runner.multimer_mode = 'multimer' in model_name
+  runner.process_features.side_effect = lambda feat, random_seed: {
+      'msa_feat': feat['msa'] + random_seed}
+  return runner
+
+
+class ProcessedFeatureCacheTest(absltest.TestCase):
+
+  def test_reuses_features_of_same_data_config_and_seed(self):
+    cache = processed_feature_cache.ProcessedFeatureCache()
+    raw_features = {'msa': np.zeros((3, 4), dtype=np.int32)}
+    model_3 = _mock_runner('model_3')
+    model_4 = _mock_runner('model_4_ptm')
+
+    host_3, device_3 = cache.process_features(model_3, raw_features, 7)
+    host_4, device_4 = cache.process_features(model_4, raw_features, 7)
+
+    model_4.process_features.assert_not_called()
+    self.assertIs(host_4, host_3)
+    self.assertIs(device_4, device_3)
+    np.testing.assert_array_equal(device_3['msa_feat'], host_3['msa_feat'])
+
+    # A copy of the raw features gets the same entry.
+    host_copy, _ = cache.process_features(model_4, dict(raw_features), 7)
+    self.assertIs(host_copy, host_3)
+
+  def test_processes_again_on_mismatch(self):
+    cache = processed_feature_cache.ProcessedFeatureCache()
+    raw_features = {'msa': np.zeros((3, 4), dtype=np.int32)}
+    model_1 = _mock_runner('model_1')
+    model_5 = _mock_runner('model_5')
+
+    cache.process_features(model_1, raw_features, 7)
+    cache.process_features(model_1, raw_features, 8)
+    cache.process_features(model_5, raw_features, 8)
+    cache.process_features(
+        model_5, {'msa': np.ones((3, 4), dtype=np.int32)}, 8)
+
+    self.assertEqual(model_1.process_features.call_count, 2)
+    self.assertEqual(model_5.process_features.call_count, 2)
+
+  def test_multimer_ignores_seed(self):
+    cache = processed_feature_cache.ProcessedFeatureCache()
+    raw_features = {'msa': np.zeros((3, 4), dtype=np.int32)}
+    runner = _mock_runner('model_1_multimer_v3')
+
+    _, device_0 = cache.process_features(runner, raw_features, 0)
+    _, device_1 = cache.process_features(runner, raw_features, 1)
+
+    self.assertIs(device_0, device_1)
+    runner.process_features.assert_called_once()
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,87 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sharding of the Evoformer activations across devices along residues.
+
+The MSA and pair representations are laid out across the devices of a mesh
+along their second residue axis, the one before the channel axis. XLA's SPMD
+partitioner then splits the work of every module over the devices and only
+inserts communication where a module needs activations of other residues,
+such as the triangle multiplications, the triangle and row attention and the
+outer product mean. The triangle updates gather the full [N_res, N_res, c_z]
+pair representation on every device, so only the activations between modules
+are split across the devices, not the peak memory of every module.
+"""
+
+import contextlib
+from typing import Iterator, Optional, Sequence
+
+import jax
+import numpy as np
+
+# Name of the mesh axis over which the residues are sharded.
+RESIDUE_AXIS = 'residues'
+
+
+def make_mesh(
+    devices: Optional[Sequence[jax.Device]] = None) -> jax.sharding.Mesh:
+  """Makes a one dimensional mesh over which residues are sharded.
+
+  Args:
+    devices: Devices of the mesh. Defaults to all local devices.
+
+  Returns:
+    The mesh, with the single axis RESIDUE_AXIS.
+  """
+  if devices is None:
+    devices = jax.local_devices()
+  return jax.sharding.Mesh(np.array(devices), (RESIDUE_AXIS,))
+
+
+@contextlib.contextmanager
+def residue_sharding(mesh: Optional[jax.sharding.Mesh]) -> Iterator[None]:
+  """Shards the activations of models traced in this context over `mesh`.
+
+  Args:
+    mesh: Mesh made by make_mesh, or None to trace for a single device.
+
+  Yields:
+    Nothing, the context is active while the models are traced.
+  """
+  if mesh is None:
+    yield
+  else:
+    with mesh:
+      yield
+
+
+def shard_residues(act: jax.Array, global_config) -> jax.Array:
+  """Constrains MSA or pair activations to be sharded along residues.
+
+  Args:
+    act: Activations of shape [..., N_res, channels], such as the MSA
+      activations [N_seq, N_res, c_m] or the pair activations
+      [N_res, N_res, c_z].
+    global_config: Global config of the model. Nothing is done unless its
+      `shard_residues` is set, in which case the model must be traced in a
+      residue_sharding context.
+
+  Returns:
+    The activations, with a sharding constraint if enabled.
+  """
+  if not global_config.shard_residues:
+    return act
+  spec = jax.sharding.PartitionSpec(
+      *([None] * (act.ndim - 2)), RESIDUE_AXIS, None)
+  return jax.lax.with_sharding_constraint(act, spec)
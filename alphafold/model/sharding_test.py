@@ -0,0 +1,77 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for sharding."""
+
+import os
+
+# Simulate several devices on CPU. This only takes effect if JAX has not
+# initialized its backends yet, otherwise the tests are skipped.
+os.environ['XLA_FLAGS'] = (os.environ.get('XLA_FLAGS', '') +
+                           ' --xla_force_host_platform_device_count=4')
+
+# pylint: disable=g-import-not-at-top,wrong-import-position
+from absl.testing import absltest
+from absl.testing import parameterized
+from alphafold.model import config
+from alphafold.model import modules
+from alphafold.model import modules_test
+from alphafold.model import sharding
+import haiku as hk
+import jax
+import numpy as np
+# pylint: enable=g-import-not-at-top,wrong-import-position
+
+
+class ShardingTest(parameterized.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    if jax.local_device_count() < 2:
+      self.skipTest('JAX was initialized with a single device.')
+
+  @parameterized.named_parameters(
+      ('divisible', 16),
+      # Residues that do not divide evenly over the devices are padded.
+      ('not_divisible', 13),
+  )
+  def test_matches_single_device(self, num_res):
+    evoformer_config = modules_test._make_evoformer_config()
+    batch = modules_test._make_evoformer_batch(
+        num_res=num_res, num_seq=4, num_extra_seq=8, num_templates=2)
+
+    def forward(shard_residues, batch):
+      global_config = config.model_config('model_1').model.global_config
+      global_config.shard_residues = shard_residues
+      global_config.zero_init = False
+      return modules.EmbeddingsAndEvoformer(evoformer_config, global_config)(
+          batch, is_training=False)
+
+    single_device = hk.transform(lambda batch: forward(False, batch))
+    sharded = hk.transform(lambda batch: forward(True, batch))
+    params = single_device.init(jax.random.PRNGKey(0), batch)
+    expected = jax.jit(single_device.apply)(
+        params, jax.random.PRNGKey(1), batch)
+    mesh = sharding.make_mesh()
+    with sharding.residue_sharding(mesh):
+      actual = jax.jit(sharded.apply)(params, jax.random.PRNGKey(1), batch)
+
+    self.assertLen(actual['pair'].sharding.device_set, mesh.size)
+    for k, v in actual.items():
+      with self.subTest(k):
+        np.testing.assert_allclose(v, expected[k], rtol=1e-4, atol=1e-4)
+
+
+if __name__ == '__main__':
+  absltest.main()
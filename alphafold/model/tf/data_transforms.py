@@ -249,8 +249,13 @@ def block_delete_msa(protein, config):
 
 
 @curry1
-def nearest_neighbor_clusters(protein, gap_agreement_weight=0.):
-  """Assign each extra MSA sequence to its nearest neighbor in sampled MSA."""
+def nearest_neighbor_clusters(protein, gap_agreement_weight=0.,
+                              chunk_size=1024):
+  """Assign each extra MSA sequence to its nearest neighbor in sampled MSA.
+
+  The extra MSA is compared with the sampled MSA `chunk_size` sequences at a
+  time, which bounds the size of the one-hot and agreement tensors.
+  """
 
   # Determine how much weight we assign to each agreement.  In theory, we could
   # use a full blosum matrix here, but right now let's just down-weight gap
@@ -264,22 +269,36 @@ def nearest_neighbor_clusters(protein, gap_agreement_weight=0.):
   # Make agreement score as weighted Hamming distance
   sample_one_hot = (protein['msa_mask'][:, :, None] *
                     tf.one_hot(protein['msa'], 23))
-  extra_one_hot = (protein['extra_msa_mask'][:, :, None] *
-                   tf.one_hot(protein['extra_msa'], 23))
-
   num_seq, num_res, _ = shape_helpers.shape_list(sample_one_hot)
-  extra_num_seq, _, _ = shape_helpers.shape_list(extra_one_hot)
-
-  # Compute tf.einsum('mrc,nrc,c->mn', sample_one_hot, extra_one_hot, weights)
-  # in an optimized fashion to avoid possible memory or computation blowup.
-  agreement = tf.matmul(
-      tf.reshape(extra_one_hot, [extra_num_seq, num_res * 23]),
-      tf.reshape(sample_one_hot * weights, [num_seq, num_res * 23]),
-      transpose_b=True)
-
-  # Assign each sequence in the extra sequences to the closest MSA sample
-  protein['extra_cluster_assignment'] = tf.argmax(
-      agreement, axis=1, output_type=tf.int32)
+  sample_one_hot = tf.reshape(sample_one_hot * weights, [num_seq, num_res * 23])
+
+  # Pad the extra MSA to whole chunks, the padding is cropped off below.
+  extra_num_seq = shape_helpers.shape_list(protein['extra_msa'])[0]
+  num_chunks = (extra_num_seq + chunk_size - 1) // chunk_size
+  padding = [[0, num_chunks * chunk_size - extra_num_seq], [0, 0]]
+  extra_msa = tf.reshape(tf.pad(protein['extra_msa'], padding),
+                         [num_chunks, chunk_size, num_res])
+  extra_mask = tf.reshape(tf.pad(protein['extra_msa_mask'], padding),
+                          [num_chunks, chunk_size, num_res])
+
+  def assign_chunk(chunk):
+    chunk_msa, chunk_mask = chunk
+    extra_one_hot = chunk_mask[:, :, None] * tf.one_hot(chunk_msa, 23)
+    # Compute tf.einsum('mrc,nrc,c->mn', sample_one_hot, extra_one_hot,
+    # weights) in an optimized fashion to avoid possible memory or computation
+    # blowup.
+    agreement = tf.matmul(
+        tf.reshape(extra_one_hot, [chunk_size, num_res * 23]),
+        sample_one_hot,
+        transpose_b=True)
+    # Assign each sequence in the extra sequences to the closest MSA sample
+    return tf.argmax(agreement, axis=1, output_type=tf.int32)
+
+  assignment = tf.map_fn(
+      assign_chunk, (extra_msa, extra_mask), fn_output_signature=tf.int32,
+      parallel_iterations=1)
+  protein['extra_cluster_assignment'] = tf.reshape(
+      assignment, [-1])[:extra_num_seq]
 
   return protein
 
@@ -287,7 +306,7 @@ def nearest_neighbor_clusters(protein, gap_agreement_weight=0.):
 @curry1
 def summarize_clusters(protein):
   """Produce profile and deletion_matrix_mean within each cluster."""
-  num_seq = shape_helpers.shape_list(protein['msa'])[0]
+  num_seq, num_res = shape_helpers.shape_list(protein['msa'])
   def csum(x):
     return tf.math.unsorted_segment_sum(
         x, protein['extra_cluster_assignment'], num_seq)
@@ -295,7 +314,16 @@ def summarize_clusters(protein):
   mask = protein['extra_msa_mask']
   mask_counts = 1e-6 + protein['msa_mask'] + csum(mask)  # Include center
 
-  msa_sum = csum(mask[:, :, None] * tf.one_hot(protein['extra_msa'], 23))
+  # Sum the masks by cluster, residue and amino acid rather than summing a
+  # one-hot of the whole extra MSA.
+  cluster_res_aa = (
+      (protein['extra_cluster_assignment'][:, None] * num_res +
+       tf.range(num_res)[None]) * 23 + protein['extra_msa'])
+  msa_sum = tf.reshape(
+      tf.math.unsorted_segment_sum(
+          tf.reshape(mask, [-1]), tf.reshape(cluster_res_aa, [-1]),
+          num_seq * num_res * 23),
+      [num_seq, num_res, 23])
   msa_sum += tf.one_hot(protein['msa'], 23)  # Original sequence
   protein['cluster_profile'] = msa_sum / mask_counts[:, :, None]
 
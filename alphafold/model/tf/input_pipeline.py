@@ -90,7 +90,8 @@ def ensembled_map_fns(data_config):
                                         eval_cfg.masked_msa_replace_fraction))
 
   if common_cfg.msa_cluster_features:
-    map_fns.append(data_transforms.nearest_neighbor_clusters())
+    map_fns.append(data_transforms.nearest_neighbor_clusters(
+        chunk_size=common_cfg.cluster_assignment_chunk_size))
     map_fns.append(data_transforms.summarize_clusters())
 
   # Crop after creating the cluster profiles.
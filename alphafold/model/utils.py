@@ -18,6 +18,7 @@ import collections
 import contextlib
 import functools
 import numbers
+import os
 from typing import Mapping
 
 import haiku as hk
@@ -106,14 +107,34 @@ def mask_mean(mask, value, axis=None, drop_mask_channel=False, eps=1e-10):
           (jnp.sum(mask, axis=axis) * broadcast_factor + eps))
 
 
-def flat_params_to_haiku(params: Mapping[str, np.ndarray]) -> hk.Params:
-  """Convert a dictionary of NumPy arrays to Haiku parameters."""
+def host_rss_mib() -> float:
+  """Returns the resident memory of this process in MiB, or NaN if unknown."""
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+  except (OSError, ValueError):
+    return float('nan')
+
+
+def flat_params_to_haiku(params: Mapping[str, np.ndarray],
+                         copy_to_jax: bool = True) -> hk.Params:
+  """Convert a dictionary of NumPy arrays to Haiku parameters.
+
+  Args:
+    params: Flat mapping from `scope//name` to the parameter array.
+    copy_to_jax: Whether to copy the arrays to JAX arrays. If False, the NumPy
+      arrays are used as they are, e.g. to keep memory-mapped arrays shared
+      with other processes until they are transferred to the device.
+
+  Returns:
+    The nested Haiku parameters.
+  """
   hk_params = {}
   for path, array in params.items():
     scope, name = path.split('//')
     if scope not in hk_params:
       hk_params[scope] = {}
-    hk_params[scope][name] = jnp.array(array)
+    hk_params[scope][name] = jnp.array(array) if copy_to_jax else array
 
   return hk_params
 
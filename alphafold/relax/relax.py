@@ -15,7 +15,6 @@
 """Amber relaxation."""
 from typing import Any, Dict, Sequence, Tuple
 from alphafold.common import protein
-from alphafold.relax import amber_minimize
 from alphafold.relax import utils
 import numpy as np
 
@@ -59,6 +58,9 @@ class AmberRelaxation(object):
               prot: protein.Protein
               ) -> Tuple[str, Dict[str, Any], Sequence[float]]:
     """Runs Amber relax on a prediction, adds hydrogens, returns PDB string."""
+    # OpenMM and pdbfixer are imported on first use, as they are slow to import
+    # and not needed by runs that do not relax.
+    from alphafold.relax import amber_minimize  # pylint: disable=g-import-not-at-top
     out = amber_minimize.run_pipeline(
         prot=prot, max_iterations=self._max_iterations,
         tolerance=self._tolerance, stiffness=self._stiffness,
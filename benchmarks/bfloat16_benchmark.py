@@ -0,0 +1,174 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Benchmarks the bfloat16 Evoformer of the monomer model against float32.
+
+Predicts each target of a regression set with the float32 and the bfloat16
+Evoformer and reports the runtime and peak memory of each, and the differences
+between their predictions: the mean and maximum absolute pLDDT difference, and
+the CA RMSD after superposition. The regression set is given as features.pkl
+files written by run_alphafold.py. Without one, random targets of --num_res
+residues are predicted, and without --data_dir the model parameters are random,
+which only exercises the code and does not measure accuracy. Peak memory is
+read from /proc and requires Linux.
+
+Example:
+  python benchmarks/bfloat16_benchmark.py --data_dir=/path/to/data \
+      --features_paths=/path/to/T1050/features.pkl,/path/to/T1024/features.pkl
+"""
+
+import pickle
+import time
+from typing import Any, Dict, Mapping
+
+from absl import app
+from absl import flags
+from alphafold.common import residue_constants
+from alphafold.data import parsers
+from alphafold.data import pipeline
+from alphafold.data import templates
+from alphafold.model import config
+from alphafold.model import data
+from alphafold.model import model
+import numpy as np
+
+flags.DEFINE_string('data_dir', None, 'Path to the AlphaFold data directory. '
+                    'If not set, the parameters are random.')
+flags.DEFINE_string('model_name', 'model_1', 'Name of the monomer model.')
+flags.DEFINE_list('features_paths', [], 'Paths to the features.pkl files of '
+                  'the regression set.')
+flags.DEFINE_list('num_res', ['64', '128'], 'Lengths of the random targets '
+                  'used if --features_paths is not set.')
+flags.DEFINE_integer('num_seq', 64, 'Number of MSA rows of random targets.')
+flags.DEFINE_integer('random_seed', 0, 'Random seed of the predictions.')
+
+FLAGS = flags.FLAGS
+
+
+def _peak_memory_mib() -> float:
+  with open('/proc/self/status') as f:
+    for line in f:
+      if line.startswith('VmHWM:'):
+        return int(line.split()[1]) / 1024
+  raise ValueError('VmHWM not found in /proc/self/status.')
+
+
+def _reset_peak_memory() -> None:
+  with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+
+
+def _make_random_features(num_res: int, num_seq: int,
+                          rng: np.random.Generator) -> Dict[str, np.ndarray]:
+  """Makes the raw features of a random target without templates."""
+  restypes = np.array(list(residue_constants.restypes))
+  sequence = ''.join(rng.choice(restypes, num_res))
+  msa = [sequence] + [''.join(rng.choice(restypes, num_res))
+                      for _ in range(num_seq - 1)]
+  features = {
+      **pipeline.make_sequence_features(sequence, 'random', num_res),
+      **pipeline.make_msa_features([parsers.Msa(
+          sequences=msa, deletion_matrix=[[0] * num_res] * num_seq,
+          descriptions=[''] * num_seq)]),
+  }
+  for name, dtype in templates.TEMPLATE_FEATURES.items():
+    features[name] = np.zeros((0,), dtype=dtype)
+  features['template_aatype'] = np.zeros((0, num_res, 22), np.float32)
+  features['template_all_atom_masks'] = np.zeros((0, num_res, 37), np.float32)
+  features['template_all_atom_positions'] = np.zeros(
+      (0, num_res, 37, 3), np.float32)
+  return features
+
+
+def _ca_rmsd(x: np.ndarray, y: np.ndarray, mask: np.ndarray) -> float:
+  """CA RMSD of two structures after optimal superposition."""
+  ca = residue_constants.atom_order['CA']
+  mask = mask[:, ca] > 0
+  x, y = x[mask, ca], y[mask, ca]
+  x, y = x - x.mean(axis=0), y - y.mean(axis=0)
+  u, _, vt = np.linalg.svd(x.T @ y)
+  # Avoid reflections.
+  d = np.sign(np.linalg.det(u @ vt))
+  rotation = u @ np.diag([1., 1., d]) @ vt
+  return float(np.sqrt(np.mean(np.sum((x @ rotation - y)**2, axis=-1))))
+
+
+def _predict(model_runner: model.RunModel, processed_features,
+             random_seed: int) -> Mapping[str, Any]:
+  """Predicts once compiled and adds the runtime and peak memory."""
+  model_runner.predict(processed_features, random_seed=random_seed)
+  _reset_peak_memory()
+  t_0 = time.perf_counter()
+  result = dict(model_runner.predict(processed_features,
+                                     random_seed=random_seed))
+  result['seconds'] = time.perf_counter() - t_0
+  result['peak_mib'] = _peak_memory_mib()
+  return result
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if FLAGS.features_paths:
+    targets = {}
+    for path in FLAGS.features_paths:
+      with open(path, 'rb') as f:
+        targets[path] = pickle.load(f)
+  else:
+    rng = np.random.default_rng(FLAGS.random_seed)
+    targets = {f'random_{num_res}': _make_random_features(
+        int(num_res), FLAGS.num_seq, rng) for num_res in FLAGS.num_res}
+
+  params = None
+  if FLAGS.data_dir:
+    params = data.get_model_haiku_params(FLAGS.model_name, FLAGS.data_dir)
+  model_runners = {}
+  for bfloat16 in (False, True):
+    model_config = config.model_config(FLAGS.model_name)
+    model_config.model.global_config.bfloat16 = bfloat16
+    if params is None:
+      # Zero initialized output layers would predict constant outputs.
+      model_config.model.global_config.zero_init = False
+    model_runners[bfloat16] = model.RunModel(model_config, params)
+
+  print(f'{"target":<24} {"float32":>16} {"bfloat16":>16} '
+        f'{"mean dpLDDT":>12} {"max dpLDDT":>11} {"CA RMSD":>8}')
+  for name, raw_features in targets.items():
+    processed_features = model_runners[False].process_features(
+        raw_features, random_seed=FLAGS.random_seed)
+    model_runners[False].init_params(processed_features)
+    # Random parameters are shared by both precisions.
+    model_runners[True].params = model_runners[False].params
+    results = {
+        bfloat16: _predict(model_runner, processed_features,
+                           FLAGS.random_seed)
+        for bfloat16, model_runner in model_runners.items()}
+
+    plddt_diff = np.abs(results[True]['plddt'] - results[False]['plddt'])
+    ca_rmsd = _ca_rmsd(
+        np.asarray(results[True]['structure_module']['final_atom_positions']),
+        np.asarray(results[False]['structure_module']['final_atom_positions']),
+        np.asarray(results[False]['structure_module']['final_atom_mask']))
+    runtimes = {
+        bfloat16: f'{r["seconds"]:.2f}s {r["peak_mib"]:>5.0f} MiB'
+        for bfloat16, r in results.items()}
+    print(f'{name[-24:]:<24} {runtimes[False]:>16} {runtimes[True]:>16} '
+          f'{plddt_diff.mean():>12.3f} {plddt_diff.max():>11.3f} '
+          f'{ca_rmsd:>7.3f}A')
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,168 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Benchmarks the peak memory and speed of chunked Evoformer modules.
+
+Runs a module of the monomer Evoformer on random activations for each sequence
+length and chunk size, each in a fresh interpreter, and reports the runtime and
+the growth of the peak resident memory while applying the module. The chunk
+size is the attention chunk size of the attention modules and the pair chunk
+size of the triangle multiplication and the outer product mean. A chunk size
+of 0 runs the module unchunked. Peak memory is read from /proc and requires
+Linux.
+
+Some CPU builds of jaxlib rewrite the attention logits into a oneDNN matmul
+that falls back to a slow reference kernel. If the runtimes are dominated by
+it, which XLA logs as "MatMul reference implementation being executed", run
+with XLA_FLAGS=--xla_disable_hlo_passes=onednn-matmul-rewriter.
+
+Example:
+  python benchmarks/evoformer_chunking_benchmark.py --num_res=256,512,1024 \
+      --chunk_sizes=0,256,64
+"""
+
+import json
+import subprocess
+import sys
+import time
+from typing import Dict
+
+from absl import app
+from absl import flags
+from alphafold.model import config
+from alphafold.model import modules
+import haiku as hk
+import jax
+import numpy as np
+
+flags.DEFINE_list('num_res', ['256', '512', '768'], 'Sequence lengths.')
+flags.DEFINE_list('chunk_sizes', ['0', '256', '64'], 'Chunk sizes, where 0 '
+                  'runs the module unchunked.')
+flags.DEFINE_enum('module', 'triangle_attention',
+                  ['triangle_attention', 'msa_row_attention',
+                   'triangle_multiplication', 'outer_product_mean'],
+                  'Evoformer module to run.')
+flags.DEFINE_integer('num_seq', 128, 'Number of MSA rows for the MSA row '
+                     'attention and the outer product mean.')
+flags.DEFINE_integer('subbatch_size', None, 'Number of rows attended to at a '
+                     'time. By default, the subbatch size of the model config.')
+flags.DEFINE_integer('repeats', 3, 'Number of timed runs, of which the fastest '
+                     'is reported.')
+flags.DEFINE_boolean('measure_in_process', False, 'Whether to measure a single '
+                     'length and chunk size in this process. Used internally.')
+
+FLAGS = flags.FLAGS
+
+
+def _memory_mib() -> Dict[str, float]:
+  usage = {}
+  with open('/proc/self/status') as f:
+    for line in f:
+      if line.startswith(('VmRSS:', 'VmHWM:')):
+        name, value = line.split()[:2]
+        usage[name] = int(value) / 1024
+  return usage
+
+
+def _reset_peak_rss() -> None:
+  # Resets VmHWM to the current resident memory, discarding the peak reached
+  # while compiling.
+  with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+
+
+def _measure_in_process(num_res: int, chunk_size: int) -> Dict[str, float]:
+  """Applies the module once compiled and measures it."""
+  model_config = config.model_config('model_1').model
+  global_config = model_config.global_config
+  global_config.attention_chunk_size = chunk_size or None
+  global_config.pair_chunk_size = chunk_size or None
+  if FLAGS.subbatch_size:
+    global_config.subbatch_size = FLAGS.subbatch_size
+  evoformer_config = model_config.embeddings_and_evoformer.evoformer
+  rng = np.random.default_rng(0)
+  pair_act = rng.normal(size=(num_res, num_res, 128)).astype(np.float32)
+  pair_mask = np.ones((num_res, num_res), dtype=np.float32)
+
+  msa_act = rng.normal(size=(FLAGS.num_seq, num_res, 256)).astype(np.float32)
+  msa_mask = np.ones((FLAGS.num_seq, num_res), dtype=np.float32)
+
+  if FLAGS.module == 'triangle_attention':
+    args = (pair_act, pair_mask)
+    forward = lambda *args: modules.TriangleAttention(
+        evoformer_config.triangle_attention_starting_node, global_config)(
+            *args)
+  elif FLAGS.module == 'msa_row_attention':
+    args = (msa_act, msa_mask, pair_act)
+    forward = lambda *args: modules.MSARowAttentionWithPairBias(
+        evoformer_config.msa_row_attention_with_pair_bias, global_config)(
+            *args)
+  elif FLAGS.module == 'triangle_multiplication':
+    args = (pair_act, pair_mask)
+    forward = lambda *args: modules.TriangleMultiplication(
+        evoformer_config.triangle_multiplication_outgoing, global_config)(
+            *args)
+  else:
+    # The outer product mean is chunked by default, so 0 computes all rows
+    # at once.
+    evoformer_config.outer_product_mean.chunk_size = None
+    args = (msa_act, msa_mask)
+    forward = lambda *args: modules.OuterProductMean(
+        evoformer_config.outer_product_mean, global_config,
+        num_output_channel=128)(*args)
+
+  forward = hk.transform(forward)
+  params = forward.init(jax.random.PRNGKey(0), *args)
+  apply = jax.jit(forward.apply).lower(params, None, *args).compile()
+  _reset_peak_rss()
+  rss = _memory_mib()['VmRSS:']
+  seconds = []
+  for _ in range(FLAGS.repeats):
+    t_0 = time.perf_counter()
+    jax.block_until_ready(apply(params, None, *args))
+    seconds.append(time.perf_counter() - t_0)
+  return {'seconds': min(seconds), 'peak_mib': _memory_mib()['VmHWM:'] - rss}
+
+
+def _measure(num_res: int, chunk_size: int) -> Dict[str, float]:
+  result = subprocess.run(
+      [sys.executable, __file__, '--measure_in_process',
+       f'--num_res={num_res}', f'--chunk_sizes={chunk_size}',
+       f'--module={FLAGS.module}', f'--num_seq={FLAGS.num_seq}',
+       f'--subbatch_size={FLAGS.subbatch_size or 0}',
+       f'--repeats={FLAGS.repeats}'],
+      stdout=subprocess.PIPE, text=True, check=True)
+  return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if FLAGS.measure_in_process:
+    (num_res,), (chunk_size,) = FLAGS.num_res, FLAGS.chunk_sizes
+    print(json.dumps(_measure_in_process(int(num_res), int(chunk_size))))
+    return
+
+  print(f'{"num_res":>7} {"chunk":>6} {"time (s)":>9} {"peak (MiB)":>11}')
+  for num_res in map(int, FLAGS.num_res):
+    for chunk_size in map(int, FLAGS.chunk_sizes):
+      result = _measure(num_res, chunk_size)
+      print(f'{num_res:>7} {chunk_size or "-":>6} {result["seconds"]:>9.2f} '
+            f'{result["peak_mib"]:>11.0f}')
+
+
+if __name__ == '__main__':
+  app.run(main)
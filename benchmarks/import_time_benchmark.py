@@ -0,0 +1,105 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the import time of the AlphaFold entry points.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+reports its total import time and the slowest packages it pulls in.
+Fails if any module imports one of --forbidden_modules, which are heavy
+dependencies that must only be imported on first use.
+
+Example:
+  python benchmarks/import_time_benchmark.py --modules=run_alphafold
+"""
+
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, Tuple
+
+from absl import app
+from absl import flags
+
+flags.DEFINE_list('modules', ['run_alphafold', 'run_alphafold_screen',
+                              'run_alphafold_variants'],
+                  'Modules whose import time is measured.')
+flags.DEFINE_list('forbidden_modules', ['tensorflow', 'openmm', 'pdbfixer'],
+                  'Top-level packages the modules must not import.')
+flags.DEFINE_integer('num_slowest', 8,
+                     'Number of slowest packages to report.')
+flags.DEFINE_integer('repeats', 3, 'Number of imports per module, of which the '
+                     'fastest is reported.')
+
+FLAGS = flags.FLAGS
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$')
+
+
+def measure_import(module: str) -> Tuple[float, Dict[str, float]]:
+  """Imports `module` in a new interpreter.
+
+  Args:
+    module: Name of the module to import.
+
+  Returns:
+    The total import time of the module in seconds and the cumulative import
+    time in seconds of every top-level package it imports.
+  """
+  repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+      [repo_dir] + os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+  result = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+      cwd=repo_dir, env=env, stderr=subprocess.PIPE, text=True, check=True)
+
+  total = 0.
+  packages = {}
+  for line in result.stderr.splitlines():
+    match = _IMPORTTIME_LINE.match(line)
+    if not match:
+      continue
+    cumulative, name = int(match.group(2)) / 1e6, match.group(3)
+    if name == module:
+      total = cumulative
+    else:
+      package = name.split('.')[0]
+      packages[package] = max(packages.get(package, 0.), cumulative)
+  return total, packages
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  failures = []
+  for module in FLAGS.modules:
+    runs = [measure_import(module) for _ in range(FLAGS.repeats)]
+    total, packages = min(runs, key=lambda run: run[0])
+    print(f'{module}: {total:.2f}s')
+    for name, seconds in sorted(
+        packages.items(), key=lambda item: -item[1])[:FLAGS.num_slowest]:
+      print(f'  {name:<24} {seconds:>6.2f}s')
+
+    imported = set().union(*(run[1] for run in runs))
+    forbidden = sorted(imported & set(FLAGS.forbidden_modules))
+    if forbidden:
+      failures.append(f'{module} imports {", ".join(forbidden)}')
+
+  if failures:
+    sys.exit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+  app.run(main)
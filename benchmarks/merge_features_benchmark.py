@@ -0,0 +1,119 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks peak host memory of multimer feature pairing and merging.
+
+Builds synthetic heteromeric assemblies with the per-chain features produced by
+pipeline_multimer.DataPipeline and reports the time and the peak memory traced
+while running feature_processing.pair_and_merge and pipeline_multimer.pad_msa.
+
+Example:
+  python benchmarks/merge_features_benchmark.py --num_chains=2,6,12
+"""
+
+import time
+import tracemalloc
+
+from absl import app
+from absl import flags
+from alphafold.common import residue_constants
+from alphafold.data import feature_processing
+from alphafold.data import pipeline_multimer
+import numpy as np
+
+flags.DEFINE_list('num_chains', ['2', '6', '12'],
+                  'Numbers of distinct chains in the synthetic assemblies.')
+flags.DEFINE_integer('num_res', 300, 'Number of residues per chain.')
+flags.DEFINE_integer('num_seq', 4000, 'Number of unpaired MSA rows per chain.')
+flags.DEFINE_integer('num_seq_all_seq', 2000,
+                     'Number of uniprot MSA rows per chain used for pairing.')
+flags.DEFINE_integer('num_species', 500,
+                     'Number of distinct species among uniprot MSA rows.')
+flags.DEFINE_integer('seed', 0, 'Random seed for the synthetic features.')
+
+FLAGS = flags.FLAGS
+
+
+def _make_chain_features(rng: np.random.Generator,
+                         num_res: int,
+                         num_seq: int,
+                         num_seq_all_seq: int,
+                         num_species: int):
+  """Makes per-chain features as output by convert_monomer_features."""
+  aatype = rng.integers(0, 20, num_res).astype(np.int32)
+  sequence = ''.join(residue_constants.restypes[i] for i in aatype)
+  species = [b''] + [
+      b'SPECIES%d' % i
+      for i in rng.integers(0, num_species, num_seq_all_seq - 1)]
+  return {
+      'aatype': aatype,
+      'sequence': np.asarray(sequence.encode(), dtype=np.object_),
+      'residue_index': np.arange(num_res, dtype=np.int32),
+      'seq_length': np.asarray(num_res, dtype=np.int32),
+      'num_alignments': np.asarray(num_seq, dtype=np.int32),
+      'msa': rng.integers(0, 22, (num_seq, num_res)).astype(np.int32),
+      'deletion_matrix_int': np.zeros((num_seq, num_res), dtype=np.int32),
+      'msa_all_seq': rng.integers(
+          0, 22, (num_seq_all_seq, num_res)).astype(np.int32),
+      'deletion_matrix_int_all_seq': np.zeros(
+          (num_seq_all_seq, num_res), dtype=np.int32),
+      'msa_species_identifiers_all_seq': np.array(species, dtype=np.object_),
+      'template_aatype': np.zeros((4, num_res), dtype=np.int32),
+      'template_all_atom_mask': np.zeros((4, num_res, 37), dtype=np.float32),
+      'template_all_atom_positions': np.zeros(
+          (4, num_res, 37, 3), dtype=np.float32),
+  }
+
+
+def _nbytes(np_example) -> int:
+  return sum(v.nbytes for v in np_example.values()
+             if isinstance(v, np.ndarray))
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  print(f'{"chains":>6} {"msa rows":>9} {"time (s)":>9} '
+        f'{"output (MB)":>12} {"peak (MB)":>10} {"peak/output":>12}')
+  for num_chains in map(int, FLAGS.num_chains):
+    rng = np.random.default_rng(FLAGS.seed)
+    all_chain_features = {
+        chain_id: _make_chain_features(
+            rng, FLAGS.num_res, FLAGS.num_seq, FLAGS.num_seq_all_seq,
+            FLAGS.num_species)
+        for chain_id in map(pipeline_multimer.int_id_to_str_id,
+                            range(1, num_chains + 1))}
+    all_chain_features = pipeline_multimer.add_assembly_features(
+        all_chain_features)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    t_0 = time.time()
+    np_example = feature_processing.pair_and_merge(all_chain_features)
+    np_example = pipeline_multimer.pad_msa(np_example, 512)
+    t_diff = time.time() - t_0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    output_mb = _nbytes(np_example) / 2**20
+    peak_mb = (peak - baseline) / 2**20
+    print(f'{num_chains:>6} {np_example["msa"].shape[0]:>9} {t_diff:>9.2f} '
+          f'{output_mb:>12.1f} {peak_mb:>10.1f} {peak_mb / output_mb:>12.2f}')
+    del np_example, all_chain_features
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,117 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Benchmarks loading the AlphaFold parameters.
+
+Loads the parameters of each model in a fresh interpreter, once from the
+`.npz` files and once from the memory-mappable files written by
+scripts/convert_params_to_memmap.py, and reports the load time and the growth
+of the resident and anonymous memory of the process. Memory-mapped parameters
+are resident as file-backed page cache that all workers share, while the
+anonymous memory holds a copy per worker.
+
+Example:
+  python benchmarks/params_loading_benchmark.py --data_dir=/path/to/data
+"""
+
+import json
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from absl import app
+from absl import flags
+from alphafold.model import data
+
+flags.DEFINE_string('data_dir', None, 'Path to the AlphaFold data directory, '
+                    'containing the `params` directory.')
+flags.DEFINE_list('model_names', ['model_1', 'model_2', 'model_3', 'model_4',
+                                  'model_5'],
+                  'Models whose parameters are loaded.')
+
+FLAGS = flags.FLAGS
+
+# Loads parameters and prints the load time and memory growth as JSON. Run in
+# a fresh interpreter so that neither the page tables nor the allocator are
+# shared between measurements.
+_LOAD_SCRIPT = """
+import json, sys, time
+import jax
+import numpy as np
+from alphafold.model import data
+
+def memory_mib():
+  usage = {}
+  with open('/proc/self/smaps_rollup') as f:
+    for line in f.readlines()[1:]:
+      name, value = line.split()[:2]
+      usage[name] = int(value) / 1024
+  return usage['Rss:'], usage['Anonymous:']
+
+path = sys.argv[1]
+jax.numpy.zeros(()).block_until_ready()
+rss_0, anonymous_0 = memory_mib()
+t_0 = time.perf_counter()
+params = data.load_haiku_params(path)
+# Touch every array, as the first forward pass would.
+checksum = sum(float(np.asarray(v).sum())
+               for p in params.values() for v in p.values())
+seconds = time.perf_counter() - t_0
+rss_1, anonymous_1 = memory_mib()
+print(json.dumps({'seconds': seconds, 'rss_mib': rss_1 - rss_0,
+                  'anonymous_mib': anonymous_1 - anonymous_0}))
+"""
+
+
+def measure_load(path: str) -> Dict[str, float]:
+  """Loads the parameters at `path` in a new interpreter.
+
+  Args:
+    path: Path of the parameters.
+
+  Returns:
+    The load time in seconds and the growth of the resident and anonymous
+    memory in MiB.
+  """
+  repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+      [repo_dir] + os.environ.get('PYTHONPATH', '').split(os.pathsep)))
+  result = subprocess.run(
+      [sys.executable, '-c', _LOAD_SCRIPT, path],
+      cwd=repo_dir, env=env, stdout=subprocess.PIPE, text=True, check=True)
+  return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  print(f'{"model":<24} {"format":<7} {"load":>7} {"RSS":>10} {"anonymous":>10}')
+  for model_name in FLAGS.model_names:
+    prefix = os.path.join(FLAGS.data_dir, 'params', f'params_{model_name}')
+    paths = {'npz': prefix + '.npz',
+             'memmap': prefix + data.MEMMAP_PARAMS_SUFFIX}
+    for params_format, path in paths.items():
+      if not os.path.exists(path):
+        continue
+      result = measure_load(path)
+      print(f'{model_name:<24} {params_format:<7} {result["seconds"]:>6.2f}s '
+            f'{result["rss_mib"]:>6.0f} MiB {result["anonymous_mib"]:>6.0f} MiB')
+
+
+if __name__ == '__main__':
+  flags.mark_flags_as_required(['data_dir'])
+  app.run(main)
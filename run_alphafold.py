@@ -22,7 +22,7 @@ import random
 import shutil
 import sys
 import time
-from typing import Any, Dict, Union
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 from absl import app
 from absl import flags
@@ -30,6 +30,8 @@ from absl import logging
 from alphafold.common import confidence
 from alphafold.common import protein
 from alphafold.common import residue_constants
+from alphafold.data import feature_cache
+from alphafold.data import parsers
 from alphafold.data import pipeline
 from alphafold.data import pipeline_multimer
 from alphafold.data import templates
@@ -38,6 +40,7 @@ from alphafold.data.tools import hmmsearch
 from alphafold.model import config
 from alphafold.model import data
 from alphafold.model import model
+from alphafold.model import processed_feature_cache
 from alphafold.relax import relax
 import jax.numpy as jnp
 import numpy as np
@@ -129,6 +132,134 @@ flags.DEFINE_boolean('use_precomputed_msas', False, 'Whether to read MSAs that '
                      'runs that are to reuse the MSAs. WARNING: This will not '
                      'check if the sequence, database or configuration have '
                      'changed.')
+flags.DEFINE_string('uniprot_feature_cache_dir', None, 'Path to a directory '
+                    'in which the processed uniprot MSA features used for '
+                    'multimer MSA pairing are cached per chain sequence, so '
+                    'they are reused across targets and runs without '
+                    'rerunning the uniprot search. The directory can be shared '
+                    'between concurrent runs. By default, no cache is used.')
+flags.DEFINE_float('uniprot_feature_cache_max_gb', None, 'Maximum size in GB '
+                   'of --uniprot_feature_cache_dir. Least recently used entries '
+                   'are evicted beyond this size. By default, the cache is '
+                   'unbounded.')
+flags.DEFINE_boolean('use_numpy_feature_pipeline', False, 'Whether to process '
+                     'monomer features with the NumPy implementation of the '
+                     'feature pipeline instead of the TensorFlow one. It is '
+                     'faster and produces the same features, but the random '
+                     'MSA sampling differs from the TensorFlow pipeline for '
+                     'the same seed. Has no effect on multimer models.')
+flags.DEFINE_boolean('share_feature_seed', False, 'Whether to process the '
+                     'features of every monomer model with the same random '
+                     'seed instead of a seed per model. Models with the same '
+                     'data config, such as model_3 and model_4, then reuse the '
+                     'processed features on the host and on the device instead '
+                     'of processing and transferring them again. The seed of '
+                     'the model itself still differs per model.')
+flags.DEFINE_integer('attention_chunk_size', None, 'If set, the Evoformer '
+                     'attention is computed over chunks of at most this many '
+                     'queries and keys instead of materializing all attention '
+                     'weights at once. This reduces the peak memory for long '
+                     'sequences at some cost in speed. By default, attention '
+                     'is not chunked.', lower_bound=1)
+flags.DEFINE_float('pair_chunk_memory_budget_mb', None, 'If set, the triangle '
+                   'multiplication and outer product mean updates of the pair '
+                   'representation are computed over chunks of rows whose '
+                   'intermediate activations fit in this many MiB. '
+                   'This reduces the peak memory for long sequences at some '
+                   'cost in speed. By default, the triangle multiplication is '
+                   'not chunked and the outer product mean uses the chunk '
+                   'size of the model config.', lower_bound=0)
+flags.DEFINE_float('extra_msa_chunk_memory_budget_mb', None, 'If set, '
+                   'multimer models assign the extra MSA sequences to MSA '
+                   'clusters over chunks of sequences whose one-hot encodings '
+                   'and agreements fit in this many MiB. This reduces the '
+                   'peak memory for deep MSAs of long targets. By default, '
+                   'all extra sequences are assigned at once.', lower_bound=0)
+flags.DEFINE_integer('ensemble_batch_size', 1, 'Number of ensemble members of '
+                     'the monomer_casp14 preset whose representations are '
+                     'computed at once. Larger values are faster if the '
+                     'device memory fits that many times the Evoformer '
+                     'activations. The representations are averaged over all '
+                     'ensemble members either way.', lower_bound=1)
+flags.DEFINE_boolean('use_bfloat16', False, 'Whether to run the Evoformer of '
+                     'monomer models in bfloat16, which halves the memory of '
+                     'its activations and is faster on accelerators with '
+                     'bfloat16 support. Layer norms, softmaxes, the structure '
+                     'module and the heads still run in float32. Multimer '
+                     'models always run their Evoformer in bfloat16.')
+flags.DEFINE_boolean('shard_residues', False, 'Whether to shard the MSA and '
+                     'pair representations of a single target across all '
+                     'local devices along residues, so that targets too long '
+                     'for the memory of one device can use several of them.')
+flags.DEFINE_list('msa_depth_buckets', None, 'If set, the sizes to which the '
+                  'MSA clusters and extra MSA sequences of monomer models are '
+                  'padded instead of the sizes in the model config. The '
+                  'smallest size that fits the MSA of a target is used, so '
+                  'that targets with shallow MSAs run faster and each size '
+                  'compiles once. An empty value always pads to the maximum '
+                  'numbers of MSA clusters and extra MSA sequences.')
+flags.DEFINE_integer('num_recycle', None, 'If set, the maximum number of '
+                     'recycling iterations of every model instead of the '
+                     'number in its config. Combined with '
+                     '--recycle_early_stop_tolerance, this is a ceiling that '
+                     'easy targets do not reach.', lower_bound=0)
+flags.DEFINE_float('recycle_early_stop_tolerance', None, 'If set, recycling '
+                   'stops once the pairwise CA distances of consecutive '
+                   'recycling iterations differ by less than this many '
+                   'Angstroms (root mean square), and a negative value always '
+                   'runs all recycling iterations. By default, monomer models '
+                   'run all recycling iterations and multimer models stop at '
+                   '0.5.')
+flags.DEFINE_float('recycle_abort_plddt', None, 'If set, recycling stops as '
+                   'soon as the mean pLDDT of a recycling iteration is below '
+                   'this value, which cuts short hopeless predictions. The '
+                   'structure of that iteration is refined once more and '
+                   'written out as usual.')
+flags.DEFINE_boolean('log_recycling', False, 'Whether to log the mean pLDDT '
+                     'and CA distance change of every recycling iteration. '
+                     'Like --recycle_abort_plddt, this calls back to the host '
+                     'from within the model, which is compiled separately and '
+                     'not ahead of time for --compile_shape_buckets.')
+flags.DEFINE_list('initial_structure_paths', None, 'Paths to PDB files of '
+                  'existing structures of the targets in --fasta_paths, in the '
+                  'same order, e.g. earlier models or models from the '
+                  'AlphaFold Database, with the residues of the target in '
+                  'order. If set, recycling starts from the atom positions of '
+                  'these structures instead of from zeros, so that with '
+                  '--recycle_early_stop_tolerance fewer recycling iterations '
+                  'are needed. Targets with an empty path start from zeros. '
+                  'Targets are not batched if this is set.')
+flags.DEFINE_integer('predict_batch_size', 1, 'Maximum number of monomer '
+                     'targets predicted together in one model call. Targets '
+                     'of at most --predict_batch_max_length residues are '
+                     'grouped by their length padded to a multiple of 32, so '
+                     'that each padded length compiles once. This makes '
+                     'better use of accelerators when screening many short '
+                     'targets. '
+                     '--recycle_abort_plddt does not apply to batched '
+                     'targets.', lower_bound=1)
+flags.DEFINE_integer('predict_batch_max_length', 300, 'Targets longer than '
+                     'this many residues are not batched with other targets.')
+flags.DEFINE_list('model_outputs', None, 'If set, the model outputs kept in '
+                  'result_model_*.pkl in addition to those the other outputs '
+                  'are written from, as dot-separated paths such as '
+                  '`distogram` or `structure_module.sidechains`. The model '
+                  'heads that no kept output depends on are not computed and '
+                  'nothing else is copied from the device. By default, all '
+                  'outputs are kept.')
+flags.DEFINE_list('compile_shape_buckets', None, 'If set, the shapes that '
+                  'every monomer model is compiled for ahead of time when it '
+                  'is loaded, as num_res:num_msa:num_templates, e.g. '
+                  '256:1024:4. A target runs on the executable of the fewest '
+                  'residues that fits it, with its residues padded, if its '
+                  'MSA depth and number of templates give the same shapes, '
+                  'see --msa_depth_buckets. Other targets, and all targets '
+                  'with --recycle_abort_plddt or --log_recycling, compile as '
+                  'usual.')
+flags.DEFINE_string('executables_dir', None, 'If set, a directory to which the '
+                    'models compiled for --compile_shape_buckets are saved, '
+                    'and from which later runs on the same JAX version and '
+                    'devices load them instead of compiling them again.')
 flags.DEFINE_enum_class('models_to_relax', ModelsToRelax.BEST, ModelsToRelax,
                         'The models to run the final relaxation step on. '
                         'If `all`, all models are relaxed, which may be time '
@@ -151,6 +282,17 @@ RELAX_ENERGY_TOLERANCE = 2.39
 RELAX_STIFFNESS = 10.0
 RELAX_EXCLUDE_RESIDUES = []
 RELAX_MAX_OUTER_ITERATIONS = 3
+# Batched targets are padded to a multiple of this many residues.
+BATCH_NUM_RES_MULTIPLE = 32
+# Model outputs that the structures and confidence files are written from.
+REQUIRED_MODEL_OUTPUTS = ('plddt', 'ranking_confidence', 'num_recycles',
+                          'structure_module.final_atom_mask',
+                          'structure_module.final_atom_positions')
+PAE_MODEL_OUTPUTS = ('ptm', 'predicted_aligned_error',
+                     'max_predicted_aligned_error')
+# Multimer confidence metrics of every pair of chains, see
+# jax_confidence.chain_pair_metrics.
+CHAIN_PAIR_METRICS = ('chain_pair_iptm', 'chain_pair_pae')
 
 
 def _check_flag(flag_name: str,
@@ -229,6 +371,42 @@ def _save_pae_json_file(
     f.write(pae_json)
 
 
+def _make_recycle_callback(
+    model_name: str,
+    fasta_name: str,
+    recycle_abort_plddt: Optional[float],
+    log_recycling: bool = False) -> Optional[model.RecycleCallback]:
+  """Makes a callback that follows the progress of recycling, if needed.
+
+  Args:
+    model_name: Name of the model, used in logs.
+    fasta_name: Name of the prediction target, used in logs.
+    recycle_abort_plddt: If set, the callback stops recycling once the mean
+      pLDDT of an iteration is below this value.
+    log_recycling: Whether the callback logs every iteration.
+
+  Returns:
+    The callback, to be passed to RunModel.predict, or None if it would do
+    nothing. Without a callback, the model runs without calling back to the
+    host and can use the executables compiled ahead of time.
+  """
+  if recycle_abort_plddt is None and not log_recycling:
+    return None
+
+  def recycle_callback(recycle_idx, mean_plddt, ca_distance_change):
+    if log_recycling:
+      logging.info('Model %s on %s recycling iteration %d: mean pLDDT %.2f, '
+                   'CA distance change %.2fA', model_name, fasta_name,
+                   recycle_idx, mean_plddt, ca_distance_change)
+    if recycle_abort_plddt is not None and mean_plddt < recycle_abort_plddt:
+      logging.warning('Stopping recycling of model %s on %s: mean pLDDT %.2f '
+                      'is below %.2f', model_name, fasta_name, mean_plddt,
+                      recycle_abort_plddt)
+      return True
+    return False
+  return recycle_callback
+
+
 def predict_structure(
     fasta_path: str,
     fasta_name: str,
@@ -240,7 +418,11 @@ def predict_structure(
     random_seed: int,
     models_to_relax: ModelsToRelax,
     model_type: str,
-):
+    share_feature_seed: bool = False,
+    recycle_abort_plddt: Optional[float] = None,
+    initial_structure: Optional[protein.Protein] = None,
+    log_recycling: bool = False,
+) -> Dict[str, Dict[str, float]]:
   """Predicts structure using AlphaFold for the given sequence."""
   logging.info('Predicting %s', fasta_name)
   timings = {}
@@ -258,50 +440,167 @@ def predict_structure(
       msa_output_dir=msa_output_dir)
   timings['features'] = time.time() - t_0
 
+  return predict_structure_from_features(
+      feature_dict=feature_dict,
+      fasta_name=fasta_name,
+      output_dir=output_dir,
+      model_runners=model_runners,
+      amber_relaxer=amber_relaxer,
+      benchmark=benchmark,
+      random_seed=random_seed,
+      models_to_relax=models_to_relax,
+      model_type=model_type,
+      timings=timings,
+      share_feature_seed=share_feature_seed,
+      recycle_abort_plddt=recycle_abort_plddt,
+      initial_structure=initial_structure,
+      log_recycling=log_recycling)
+
+
+def predict_structure_from_features(
+    feature_dict: pipeline.FeatureDict,
+    fasta_name: str,
+    output_dir: str,
+    model_runners: Dict[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: ModelsToRelax,
+    model_type: str,
+    timings: Optional[Dict[str, float]] = None,
+    save_features: bool = True,
+    share_feature_seed: bool = False,
+    recycle_abort_plddt: Optional[float] = None,
+    predictions: Optional[Mapping[str, Tuple[
+        pipeline.FeatureDict, Mapping[str, Any]]]] = None,
+    initial_structure: Optional[protein.Protein] = None,
+    log_recycling: bool = False,
+) -> Dict[str, Dict[str, float]]:
+  """Runs the models on already computed features and writes the outputs.
+
+  Args:
+    feature_dict: Features as output by the data pipeline.
+    fasta_name: Name of the prediction target, used in logs.
+    output_dir: Directory to which the outputs are written.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed, offset by the index of each model.
+    models_to_relax: Which models to relax.
+    model_type: Monomer or multimer.
+    timings: Timings collected so far, written out together with the new ones.
+    save_features: Whether to write `feature_dict` to features.pkl.
+    share_feature_seed: Whether to process the features of every model with
+      the same random seed, so that models with the same data config reuse
+      the processed features.
+    recycle_abort_plddt: If set, recycling stops once the mean pLDDT of a
+      recycling iteration is below this value.
+    predictions: The processed features and the prediction of the models that
+      already ran, by model name, as made by predict_structures_batched. The
+      other models are run here.
+    initial_structure: If set, an existing structure of the target with the
+      same residues that every model starts recycling from, see
+      model.recycle_features.
+    log_recycling: Whether to log the progress of every recycling iteration.
+
+  Returns:
+    A mapping from model name to the confidence metrics of its prediction:
+    `ranking_confidence`, `mean_plddt` and, if predicted, `ptm` and `iptm`, as
+    well as the chain pair matrices `chain_pair_iptm` and `chain_pair_pae` of
+    multimer models as nested lists.
+  """
+  timings = dict(timings or {})
+  if not os.path.exists(output_dir):
+    os.makedirs(output_dir)
+  if (initial_structure is not None and
+      initial_structure.aatype.shape[0] != feature_dict['aatype'].shape[0]):
+    raise ValueError(
+        f'The initial structure of {fasta_name} has '
+        f'{initial_structure.aatype.shape[0]} residues but the target has '
+        f'{feature_dict["aatype"].shape[0]}.')
+
   # Write out features as a pickled dictionary.
-  features_output_path = os.path.join(output_dir, 'features.pkl')
-  with open(features_output_path, 'wb') as f:
-    pickle.dump(feature_dict, f, protocol=4)
+  if save_features:
+    features_output_path = os.path.join(output_dir, 'features.pkl')
+    with open(features_output_path, 'wb') as f:
+      pickle.dump(feature_dict, f, protocol=4)
 
   unrelaxed_pdbs = {}
   unrelaxed_proteins = {}
   relaxed_pdbs = {}
   relax_metrics = {}
   ranking_confidences = {}
+  model_confidences = {}
 
   # Run the models.
   num_models = len(model_runners)
+  feature_dict_cache = processed_feature_cache.ProcessedFeatureCache()
   for model_index, (model_name, model_runner) in enumerate(
       model_runners.items()):
-    logging.info('Running model %s on %s', model_name, fasta_name)
-    t_0 = time.time()
-    model_random_seed = model_index + random_seed * num_models
-    processed_feature_dict = model_runner.process_features(
-        feature_dict, random_seed=model_random_seed)
-    timings[f'process_features_{model_name}'] = time.time() - t_0
-
-    t_0 = time.time()
-    prediction_result = model_runner.predict(processed_feature_dict,
-                                             random_seed=model_random_seed)
-    t_diff = time.time() - t_0
-    timings[f'predict_and_compile_{model_name}'] = t_diff
-    logging.info(
-        'Total JAX model %s on %s predict time (includes compilation time, see --benchmark): %.1fs',
-        model_name, fasta_name, t_diff)
-
-    if benchmark:
+    if predictions and model_name in predictions:
+      processed_feature_dict, prediction_result = predictions[model_name]
+    else:
+      logging.info('Running model %s on %s', model_name, fasta_name)
+      t_0 = time.time()
+      model_random_seed = model_index + random_seed * num_models
+      feature_random_seed = (random_seed * num_models if share_feature_seed
+                             else model_random_seed)
+      processed_feature_dict, device_feature_dict = (
+          feature_dict_cache.process_features(
+              model_runner, feature_dict, random_seed=feature_random_seed))
+      timings[f'process_features_{model_name}'] = time.time() - t_0
+      if initial_structure is not None:
+        device_feature_dict = {
+            **device_feature_dict,
+            **model.recycle_features(
+                num_res=processed_feature_dict['aatype'].shape[-1],
+                prot=initial_structure)}
+
+      recycle_callback = _make_recycle_callback(
+          model_name, fasta_name, recycle_abort_plddt, log_recycling)
       t_0 = time.time()
-      model_runner.predict(processed_feature_dict,
-                           random_seed=model_random_seed)
+      prediction_result = model_runner.predict(
+          device_feature_dict,
+          random_seed=model_random_seed,
+          recycle_callback=recycle_callback)
       t_diff = time.time() - t_0
-      timings[f'predict_benchmark_{model_name}'] = t_diff
+      timings[f'predict_and_compile_{model_name}'] = t_diff
       logging.info(
-          'Total JAX model %s on %s predict time (excludes compilation time): %.1fs',
+          'Total JAX model %s on %s predict time (includes compilation time, see --benchmark): %.1fs',
           model_name, fasta_name, t_diff)
+      if benchmark:
+        t_0 = time.time()
+        model_runner.predict(device_feature_dict,
+                             random_seed=model_random_seed,
+                             recycle_callback=recycle_callback)
+        t_diff = time.time() - t_0
+        timings[f'predict_benchmark_{model_name}'] = t_diff
+        logging.info(
+            'Total JAX model %s on %s predict time (excludes compilation time): %.1fs',
+            model_name, fasta_name, t_diff)
+
+    if 'num_recycles' in prediction_result:
+      num_recycles = int(prediction_result['num_recycles'])
+      timings[f'num_recycles_{model_name}'] = num_recycles
+      logging.info('Model %s on %s ran %d recycling iterations', model_name,
+                   fasta_name, num_recycles)
 
     plddt = prediction_result['plddt']
     _save_confidence_json_file(plddt, output_dir, model_name)
-    ranking_confidences[model_name] = prediction_result['ranking_confidence']
+    ranking_confidences[model_name] = float(
+        prediction_result['ranking_confidence'])
+    model_confidences[model_name] = {
+        'ranking_confidence': float(prediction_result['ranking_confidence']),
+        'mean_plddt': float(np.mean(plddt)),
+    }
+    for metric in ('ptm', 'iptm'):
+      if metric in prediction_result:
+        model_confidences[model_name][metric] = float(
+            prediction_result[metric])
+    for metric in CHAIN_PAIR_METRICS:
+      if metric in prediction_result:
+        model_confidences[model_name][metric] = np.round(
+            prediction_result[metric].astype(np.float64), 4).tolist()
 
     if (
         'predicted_aligned_error' in prediction_result
@@ -408,8 +707,13 @@ def predict_structure(
   ranking_output_path = os.path.join(output_dir, 'ranking_debug.json')
   with open(ranking_output_path, 'w') as f:
     label = 'iptm+ptm' if 'iptm' in prediction_result else 'plddts'
-    f.write(json.dumps(
-        {label: ranking_confidences, 'order': ranked_order}, indent=4))
+    ranking_debug = {label: ranking_confidences, 'order': ranked_order}
+    for metric in CHAIN_PAIR_METRICS:
+      if metric in prediction_result:
+        ranking_debug[metric] = {
+            name: confidences[metric]
+            for name, confidences in model_confidences.items()}
+    f.write(json.dumps(ranking_debug, indent=4))
 
   logging.info('Final timings for %s: %s', fasta_name, timings)
 
@@ -421,11 +725,219 @@ def predict_structure(
     with open(relax_metrics_path, 'w') as f:
       f.write(json.dumps(relax_metrics, indent=4))
 
+  return model_confidences
 
-def main(argv):
-  if len(argv) > 1:
-    raise app.UsageError('Too many command-line arguments.')
 
+def group_targets(fasta_paths: Sequence[str], batch_size: int,
+                  max_length: int) -> List[List[int]]:
+  """Groups short single-chain targets of the same padded length into batches.
+
+  Args:
+    fasta_paths: Paths of the FASTA file of each target.
+    batch_size: Maximum number of targets in a batch.
+    max_length: Targets longer than this are alone in their batch, as are
+      targets with several chains.
+
+  Returns:
+    The indices of the targets of each batch, ordered by their first target.
+  """
+  batches = []
+  open_batches = {}
+  for i, fasta_path in enumerate(fasta_paths):
+    with open(fasta_path) as f:
+      sequences, _ = parsers.parse_fasta(f.read())
+    if (batch_size <= 1 or len(sequences) != 1 or
+        len(sequences[0]) > max_length):
+      batches.append([i])
+      continue
+    num_res = _padded_num_res(len(sequences[0]))
+    batch = open_batches.get(num_res)
+    if batch is None or len(batch) == batch_size:
+      batch = open_batches[num_res] = []
+      batches.append(batch)
+    batch.append(i)
+  return batches
+
+
+def _padded_num_res(num_res: int) -> int:
+  return -(-num_res // BATCH_NUM_RES_MULTIPLE) * BATCH_NUM_RES_MULTIPLE
+
+
+def predict_structures_batched(
+    fasta_paths: Sequence[str],
+    fasta_names: Sequence[str],
+    output_dir_base: str,
+    data_pipeline: pipeline.DataPipeline,
+    model_runners: Mapping[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: ModelsToRelax,
+    model_type: str,
+    share_feature_seed: bool = False,
+) -> List[Dict[str, Dict[str, float]]]:
+  """Predicts several single-chain targets with one model call per model.
+
+  The targets are padded to the same length and run with
+  RunModel.predict_batch, with the same random seeds as predict_structure
+  would use. Their outputs are written as by predict_structure.
+
+  Args:
+    fasta_paths: Paths of the FASTA file of each target.
+    fasta_names: Name of each target, which names its output directory.
+    output_dir_base: Directory in which a subdirectory per target is made.
+    data_pipeline: The monomer data pipeline.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed, offset by the index of each model.
+    models_to_relax: Which models to relax.
+    model_type: Monomer or multimer.
+    share_feature_seed: Whether to process the features of every model with
+      the same random seed.
+
+  Returns:
+    The confidence metrics of every target, see
+    predict_structure_from_features.
+  """
+  feature_dicts = []
+  all_timings = []
+  for fasta_path, fasta_name in zip(fasta_paths, fasta_names):
+    logging.info('Predicting %s', fasta_name)
+    msa_output_dir = os.path.join(output_dir_base, fasta_name, 'msas')
+    os.makedirs(msa_output_dir, exist_ok=True)
+    t_0 = time.time()
+    feature_dicts.append(data_pipeline.process(
+        input_fasta_path=fasta_path, msa_output_dir=msa_output_dir))
+    all_timings.append({'features': time.time() - t_0})
+
+  return predict_structures_batched_from_features(
+      feature_dicts=feature_dicts,
+      fasta_names=fasta_names,
+      output_dirs=[os.path.join(output_dir_base, fasta_name)
+                   for fasta_name in fasta_names],
+      model_runners=model_runners,
+      amber_relaxer=amber_relaxer,
+      benchmark=benchmark,
+      random_seed=random_seed,
+      models_to_relax=models_to_relax,
+      model_type=model_type,
+      all_timings=all_timings,
+      share_feature_seed=share_feature_seed)
+
+
+def predict_structures_batched_from_features(
+    feature_dicts: Sequence[pipeline.FeatureDict],
+    fasta_names: Sequence[str],
+    output_dirs: Sequence[str],
+    model_runners: Mapping[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: ModelsToRelax,
+    model_type: str,
+    all_timings: Optional[Sequence[Dict[str, float]]] = None,
+    save_features: bool = True,
+    share_feature_seed: bool = False,
+) -> List[Dict[str, Dict[str, float]]]:
+  """Predicts several single-chain targets from their features in batches.
+
+  See predict_structures_batched, which computes the features.
+
+  Args:
+    feature_dicts: Features of each target as output by the data pipeline.
+    fasta_names: Name of each target, used in logs.
+    output_dirs: Directory to which the outputs of each target are written.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed, offset by the index of each model.
+    models_to_relax: Which models to relax.
+    model_type: Monomer or multimer.
+    all_timings: Timings of each target collected so far.
+    save_features: Whether to write the features of each target to
+      features.pkl.
+    share_feature_seed: Whether to process the features of every model with
+      the same random seed.
+
+  Returns:
+    The confidence metrics of every target, see
+    predict_structure_from_features.
+  """
+  all_timings = [dict(timings) for timings in
+                 all_timings or [{} for _ in feature_dicts]]
+
+  num_res = _padded_num_res(
+      max(int(f['seq_length'][0]) for f in feature_dicts))
+  batch_name = ', '.join(fasta_names)
+  num_models = len(model_runners)
+  feature_dict_caches = [processed_feature_cache.ProcessedFeatureCache()
+                         for _ in feature_dicts]
+  predictions = [{} for _ in feature_dicts]
+  for model_index, (model_name, model_runner) in enumerate(
+      model_runners.items()):
+    logging.info('Running model %s on %s', model_name, batch_name)
+    model_random_seed = model_index + random_seed * num_models
+    feature_random_seed = (random_seed * num_models if share_feature_seed
+                           else model_random_seed)
+    processed_feature_dicts = []
+    for feature_dict, cache, timings in zip(
+        feature_dicts, feature_dict_caches, all_timings):
+      t_0 = time.time()
+      processed_feature_dict, _ = cache.process_features(
+          model_runner, feature_dict, random_seed=feature_random_seed)
+      processed_feature_dicts.append(processed_feature_dict)
+      timings[f'process_features_{model_name}'] = time.time() - t_0
+
+    random_seeds = [model_random_seed] * len(feature_dicts)
+    t_0 = time.time()
+    prediction_results = model_runner.predict_batch(
+        processed_feature_dicts, random_seeds, num_res=num_res)
+    t_diff = time.time() - t_0
+    logging.info(
+        'Total JAX model %s on %s predict time (includes compilation time, see --benchmark): %.1fs',
+        model_name, batch_name, t_diff)
+    for timings in all_timings:
+      timings[f'predict_and_compile_{model_name}'] = t_diff
+
+    if benchmark:
+      t_0 = time.time()
+      model_runner.predict_batch(
+          processed_feature_dicts, random_seeds, num_res=num_res)
+      t_diff = time.time() - t_0
+      logging.info(
+          'Total JAX model %s on %s predict time (excludes compilation time): %.1fs',
+          model_name, batch_name, t_diff)
+      for timings in all_timings:
+        timings[f'predict_benchmark_{model_name}'] = t_diff
+
+    for target_predictions, processed_feature_dict, prediction_result in zip(
+        predictions, processed_feature_dicts, prediction_results):
+      target_predictions[model_name] = (
+          processed_feature_dict, prediction_result)
+
+  return [
+      predict_structure_from_features(
+          feature_dict=feature_dict,
+          fasta_name=fasta_name,
+          output_dir=output_dir,
+          model_runners=model_runners,
+          amber_relaxer=amber_relaxer,
+          benchmark=benchmark,
+          random_seed=random_seed,
+          models_to_relax=models_to_relax,
+          model_type=model_type,
+          timings=timings,
+          save_features=save_features,
+          share_feature_seed=share_feature_seed,
+          predictions=target_predictions)
+      for feature_dict, fasta_name, output_dir, timings, target_predictions
+      in zip(feature_dicts, fasta_names, output_dirs, all_timings, predictions)
+  ]
+
+
+def check_flags(run_multimer_system: bool):
+  """Checks that the binary and database flags match the selected presets."""
   for tool_name in (
       'jackhmmer', 'hhblits', 'hhsearch', 'hmmsearch', 'hmmbuild', 'kalign'):
     if not FLAGS[f'{tool_name}_binary_path'].value:
@@ -440,8 +952,6 @@ def main(argv):
   _check_flag('uniref30_database_path', 'db_preset',
               should_be_set=not use_small_bfd)
 
-  run_multimer_system = 'multimer' in FLAGS.model_preset
-  model_type = 'Multimer' if run_multimer_system else 'Monomer'
   _check_flag('pdb70_database_path', 'model_preset',
               should_be_set=not run_multimer_system)
   _check_flag('pdb_seqres_database_path', 'model_preset',
@@ -449,16 +959,12 @@ def main(argv):
   _check_flag('uniprot_database_path', 'model_preset',
               should_be_set=run_multimer_system)
 
-  if FLAGS.model_preset == 'monomer_casp14':
-    num_ensemble = 8
-  else:
-    num_ensemble = 1
-
-  # Check for duplicate FASTA file names.
-  fasta_names = [pathlib.Path(p).stem for p in FLAGS.fasta_paths]
-  if len(fasta_names) != len(set(fasta_names)):
-    raise ValueError('All FASTA paths must have a unique basename.')
 
+def make_data_pipeline(
+    run_multimer_system: bool
+) -> Union[pipeline.DataPipeline, pipeline_multimer.DataPipeline]:
+  """Builds the data pipeline configured by the flags."""
+  use_small_bfd = FLAGS.db_preset == 'reduced_dbs'
   if run_multimer_system:
     template_searcher = hmmsearch.Hmmsearch(
         binary_path=FLAGS.hmmsearch_binary_path,
@@ -496,35 +1002,169 @@ def main(argv):
       use_small_bfd=use_small_bfd,
       use_precomputed_msas=FLAGS.use_precomputed_msas)
 
-  if run_multimer_system:
-    num_predictions_per_model = FLAGS.num_multimer_predictions_per_model
-    data_pipeline = pipeline_multimer.DataPipeline(
-        monomer_data_pipeline=monomer_data_pipeline,
-        jackhmmer_binary_path=FLAGS.jackhmmer_binary_path,
-        uniprot_database_path=FLAGS.uniprot_database_path,
-        use_precomputed_msas=FLAGS.use_precomputed_msas)
+  if not run_multimer_system:
+    return monomer_data_pipeline
+
+  all_seq_feature_cache = None
+  if FLAGS.uniprot_feature_cache_dir:
+    max_size_bytes = None
+    if FLAGS.uniprot_feature_cache_max_gb is not None:
+      max_size_bytes = int(FLAGS.uniprot_feature_cache_max_gb * 2**30)
+    all_seq_feature_cache = feature_cache.FeatureCache(
+        cache_dir=FLAGS.uniprot_feature_cache_dir,
+        max_size_bytes=max_size_bytes)
+  return pipeline_multimer.DataPipeline(
+      monomer_data_pipeline=monomer_data_pipeline,
+      jackhmmer_binary_path=FLAGS.jackhmmer_binary_path,
+      uniprot_database_path=FLAGS.uniprot_database_path,
+      use_precomputed_msas=FLAGS.use_precomputed_msas,
+      all_seq_feature_cache=all_seq_feature_cache)
+
+
+def make_model_runner(model_name: str, model_preset: str) -> model.RunModel:
+  """Builds the runner of a model of the preset and loads its parameters."""
+  if model_preset == 'monomer_casp14':
+    num_ensemble = 8
   else:
-    num_predictions_per_model = 1
-    data_pipeline = monomer_data_pipeline
+    num_ensemble = 1
 
-  model_runners = {}
-  model_names = config.MODEL_PRESETS[FLAGS.model_preset]
-  for model_name in model_names:
-    model_config = config.model_config(model_name)
-    if run_multimer_system:
-      model_config.model.num_ensemble_eval = num_ensemble
-    else:
-      model_config.data.eval.num_ensemble = num_ensemble
-    model_params = data.get_model_haiku_params(
-        model_name=model_name, data_dir=FLAGS.data_dir)
-    model_runner = model.RunModel(model_config, model_params)
-    for i in range(num_predictions_per_model):
-      model_runners[f'{model_name}_pred_{i}'] = model_runner
+  model_config = config.model_config(model_name)
+  if 'multimer' in model_preset:
+    model_config.model.num_ensemble_eval = num_ensemble
+    model_config.model.global_config.extra_msa_chunk_memory_budget_mb = (
+        FLAGS.extra_msa_chunk_memory_budget_mb)
+  else:
+    model_config.data.eval.num_ensemble = num_ensemble
+    model_config.model.ensemble_batch_size = FLAGS.ensemble_batch_size
+    model_config.data.common.use_numpy_pipeline = (
+        FLAGS.use_numpy_feature_pipeline)
+    model_config.model.global_config.bfloat16 = FLAGS.use_bfloat16
+    if FLAGS.msa_depth_buckets is not None:
+      model_config.data.common.msa_depth_buckets = [
+          int(size) for size in FLAGS.msa_depth_buckets]
+    if FLAGS.num_recycle is not None:
+      # The monomer data pipeline samples the MSA once per recycling iteration.
+      model_config.data.common.num_recycle = FLAGS.num_recycle
+  if FLAGS.num_recycle is not None:
+    model_config.model.num_recycle = FLAGS.num_recycle
+  if FLAGS.recycle_early_stop_tolerance is not None:
+    model_config.model.recycle_early_stop_tolerance = (
+        FLAGS.recycle_early_stop_tolerance)
+  model_config.model.global_config.attention_chunk_size = (
+      FLAGS.attention_chunk_size)
+  model_config.model.global_config.pair_chunk_memory_budget_mb = (
+      FLAGS.pair_chunk_memory_budget_mb)
+  model_config.model.global_config.shard_residues = FLAGS.shard_residues
+  if FLAGS.model_outputs is not None:
+    outputs = set(FLAGS.model_outputs) | set(REQUIRED_MODEL_OUTPUTS)
+    if model_config.model.heads.predicted_aligned_error.weight:
+      outputs.update(PAE_MODEL_OUTPUTS)
+    if 'multimer' in model_preset:
+      outputs.add('iptm')
+      outputs.update(CHAIN_PAIR_METRICS)
+    model_config.model.outputs = sorted(outputs)
+  model_params = data.get_model_haiku_params(
+      model_name=model_name, data_dir=FLAGS.data_dir)
+  model_runner = model.RunModel(model_config, model_params)
+  if FLAGS.compile_shape_buckets:
+    compile_model_runner(
+        model_runner, model_name,
+        parse_shape_buckets(FLAGS.compile_shape_buckets),
+        FLAGS.executables_dir)
+  return model_runner
+
+
+def parse_shape_buckets(
+    shape_buckets: Sequence[str]) -> List[Tuple[int, int, int]]:
+  """Parses shape buckets given as num_res:num_msa:num_templates."""
+  parsed = []
+  for shape_bucket in shape_buckets:
+    sizes = shape_bucket.split(':')
+    if len(sizes) != 3 or not all(size.isdigit() for size in sizes):
+      raise ValueError(f'Invalid shape bucket {shape_bucket}, expected '
+                       'num_res:num_msa:num_templates.')
+    parsed.append(tuple(int(size) for size in sizes))
+  return parsed
+
+
+def compile_model_runner(
+    model_runner: model.RunModel,
+    model_name: str,
+    shape_buckets: Sequence[Tuple[int, int, int]],
+    executables_dir: Optional[str] = None) -> None:
+  """Compiles a monomer model for the shape buckets ahead of time.
+
+  Args:
+    model_runner: The runner of the model.
+    model_name: Name of the model, which names its saved executables.
+    shape_buckets: The number of residues, MSA sequences and templates of
+      each shape to compile the model for.
+    executables_dir: If set, executables saved here by earlier runs are loaded
+      instead of compiled, and the newly compiled ones are saved.
+  """
+  executables_path = None
+  if executables_dir:
+    os.makedirs(executables_dir, exist_ok=True)
+    executables_path = os.path.join(executables_dir,
+                                    f'{model_name}_executables.pkl')
+    if os.path.exists(executables_path):
+      model_runner.load_executables(executables_path)
+
+  compiled = False
+  for num_res, num_msa, num_templates in shape_buckets:
+    compiled |= model_runner.compile(
+        model_runner.abstract_features(num_res, num_msa, num_templates))
+  if executables_path and compiled:
+    model_runner.save_executables(executables_path)
+
+
+class LazyModelRunners(Mapping[str, model.RunModel]):
+  """Model runners that are only built when their model first runs.
+
+  Loading the parameters of all models up front takes a while and holds them
+  in memory for the whole data pipeline, which is wasted if it fails.
+  """
 
+  def __init__(self, model_preset: str, num_predictions_per_model: int):
+    self._model_preset = model_preset
+    self._model_names = {}
+    for model_name in config.MODEL_PRESETS[model_preset]:
+      # Fail now rather than once the data pipeline has finished.
+      params_path = data.get_model_params_path(model_name, FLAGS.data_dir)
+      if not os.path.exists(params_path):
+        raise ValueError(f'Could not find the parameters of model {model_name} '
+                         f'at {params_path}.')
+      for i in range(num_predictions_per_model):
+        self._model_names[f'{model_name}_pred_{i}'] = model_name
+    self._model_runners = {}
+
+  def __getitem__(self, key: str) -> model.RunModel:
+    model_name = self._model_names[key]
+    if model_name not in self._model_runners:
+      logging.info('Loading model %s', model_name)
+      self._model_runners[model_name] = make_model_runner(
+          model_name, self._model_preset)
+    return self._model_runners[model_name]
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._model_names)
+
+  def __len__(self) -> int:
+    return len(self._model_names)
+
+
+def make_model_runners(
+    model_preset: str,
+    num_predictions_per_model: int) -> Mapping[str, model.RunModel]:
+  """Makes a runner per model of the preset, repeated for each prediction."""
+  model_runners = LazyModelRunners(model_preset, num_predictions_per_model)
   logging.info('Have %d models: %s', len(model_runners),
                list(model_runners.keys()))
+  return model_runners
 
-  amber_relaxer = relax.AmberRelaxation(
+
+def make_amber_relaxer() -> relax.AmberRelaxation:
+  return relax.AmberRelaxation(
       max_iterations=RELAX_MAX_ITERATIONS,
       tolerance=RELAX_ENERGY_TOLERANCE,
       stiffness=RELAX_STIFFNESS,
@@ -532,14 +1172,76 @@ def main(argv):
       max_outer_iterations=RELAX_MAX_OUTER_ITERATIONS,
       use_gpu=FLAGS.use_gpu_relax)
 
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  run_multimer_system = 'multimer' in FLAGS.model_preset
+  model_type = 'Multimer' if run_multimer_system else 'Monomer'
+  check_flags(run_multimer_system)
+  if FLAGS.compile_shape_buckets:
+    if run_multimer_system:
+      raise ValueError('--compile_shape_buckets requires a monomer '
+                       '--model_preset.')
+    # Fail now rather than once the first model is loaded.
+    parse_shape_buckets(FLAGS.compile_shape_buckets)
+
+  # Check for duplicate FASTA file names.
+  fasta_names = [pathlib.Path(p).stem for p in FLAGS.fasta_paths]
+  if len(fasta_names) != len(set(fasta_names)):
+    raise ValueError('All FASTA paths must have a unique basename.')
+
+  data_pipeline = make_data_pipeline(run_multimer_system)
+
+  if run_multimer_system:
+    num_predictions_per_model = FLAGS.num_multimer_predictions_per_model
+  else:
+    num_predictions_per_model = 1
+  model_runners = make_model_runners(
+      FLAGS.model_preset, num_predictions_per_model)
+
+  amber_relaxer = make_amber_relaxer()
+
   random_seed = FLAGS.random_seed
   if random_seed is None:
     random_seed = random.randrange(sys.maxsize // len(model_runners))
   logging.info('Using random seed %d for the data pipeline', random_seed)
 
-  # Predict structure for each of the sequences.
-  for i, fasta_path in enumerate(FLAGS.fasta_paths):
-    fasta_name = fasta_names[i]
+  initial_structure_paths = (
+      FLAGS.initial_structure_paths or [''] * len(FLAGS.fasta_paths))
+  if len(initial_structure_paths) != len(FLAGS.fasta_paths):
+    raise ValueError('--initial_structure_paths must have one path per FASTA '
+                     'path.')
+
+  # Predict structure for each of the sequences, in batches of short
+  # sequences if requested.
+  predict_batch_size = FLAGS.predict_batch_size
+  if run_multimer_system or FLAGS.initial_structure_paths:
+    predict_batch_size = 1
+  for batch in group_targets(FLAGS.fasta_paths, predict_batch_size,
+                             FLAGS.predict_batch_max_length):
+    if len(batch) > 1:
+      predict_structures_batched(
+          fasta_paths=[FLAGS.fasta_paths[i] for i in batch],
+          fasta_names=[fasta_names[i] for i in batch],
+          output_dir_base=FLAGS.output_dir,
+          data_pipeline=data_pipeline,
+          model_runners=model_runners,
+          amber_relaxer=amber_relaxer,
+          benchmark=FLAGS.benchmark,
+          random_seed=random_seed,
+          models_to_relax=FLAGS.models_to_relax,
+          model_type=model_type,
+          share_feature_seed=FLAGS.share_feature_seed,
+      )
+      continue
+    fasta_path = FLAGS.fasta_paths[batch[0]]
+    fasta_name = fasta_names[batch[0]]
+    initial_structure = None
+    if initial_structure_paths[batch[0]]:
+      with open(initial_structure_paths[batch[0]]) as f:
+        initial_structure = protein.from_pdb_string(f.read())
     predict_structure(
         fasta_path=fasta_path,
         fasta_name=fasta_name,
@@ -551,6 +1253,10 @@ def main(argv):
         random_seed=random_seed,
         models_to_relax=FLAGS.models_to_relax,
         model_type=model_type,
+        share_feature_seed=FLAGS.share_feature_seed,
+        recycle_abort_plddt=FLAGS.recycle_abort_plddt,
+        initial_structure=initial_structure,
+        log_recycling=FLAGS.log_recycling,
     )
 
 
@@ -0,0 +1,261 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Screens one bait protein against a list of partners with AlphaFold-Multimer.
+
+Each unique chain goes through the data pipeline (MSA search, uniprot search for
+pairing and template search) exactly once. The bait's features are then paired
+and merged with the features of every partner in turn, and each complex is
+predicted as soon as its features are ready. The pairs are ranked by ipTM in
+`screen_summary.tsv` in the output directory, which is rewritten after every
+pair.
+
+All flags of run_alphafold.py apply, except --fasta_paths which is replaced by
+--bait_fasta_path and --partners_fasta_path.
+"""
+import collections
+import copy
+import json
+import os
+import random
+import re
+import sys
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+from absl import app
+from absl import flags
+from absl import logging
+from alphafold.data import parsers
+from alphafold.data import pipeline
+from alphafold.data import pipeline_multimer
+from alphafold.model import model
+from alphafold.relax import relax
+import pandas as pd
+import run_alphafold
+
+flags.DEFINE_string('bait_fasta_path', None, 'Path to a FASTA file with the '
+                    'single bait sequence.')
+flags.DEFINE_string('partners_fasta_path', None, 'Path to a FASTA file with '
+                    'one record per partner to pair with the bait. The first '
+                    'word of each description names the output directory of '
+                    'that pair, so it must be unique.')
+
+FLAGS = flags.FLAGS
+
+BAIT_CHAIN_ID = 'A'
+PARTNER_CHAIN_ID = 'B'
+SUMMARY_COLUMNS = ('pair', 'partner_description', 'partner_length', 'iptm',
+                   'ptm', 'interface_pae', 'ranking_confidence', 'mean_plddt',
+                   'best_model')
+
+
+def _read_fasta(fasta_path: str) -> Tuple[Sequence[str], Sequence[str]]:
+  with open(fasta_path) as f:
+    return parsers.parse_fasta(f.read())
+
+
+def _pair_name(bait_description: str, partner_description: str) -> str:
+  names = []
+  for description in (bait_description, partner_description):
+    name = description.split()[0] if description.strip() else 'unnamed'
+    names.append(re.sub(r'[^A-Za-z0-9_.-]', '_', name))
+  return '_'.join(names)
+
+
+def _without_pairing_features(
+    chain_features: pipeline.FeatureDict) -> pipeline.FeatureDict:
+  return {k: v for k, v in chain_features.items() if '_all_seq' not in k}
+
+
+def _write_summary(rows: List[Mapping[str, object]], output_dir: str):
+  summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+  summary = summary.sort_values('iptm', ascending=False)
+  summary.to_csv(os.path.join(output_dir, 'screen_summary.tsv'), sep='\t',
+                 index=False, float_format='%.4f')
+
+
+def screen_partners(
+    bait_sequence: str,
+    bait_description: str,
+    partner_sequences: Sequence[str],
+    partner_descriptions: Sequence[str],
+    output_dir_base: str,
+    data_pipeline: pipeline_multimer.DataPipeline,
+    model_runners: Dict[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: run_alphafold.ModelsToRelax,
+) -> List[Mapping[str, object]]:
+  """Predicts the complex of the bait with each partner.
+
+  Args:
+    bait_sequence: Amino acid sequence of the bait.
+    bait_description: FASTA description of the bait.
+    partner_sequences: Amino acid sequences of the partners.
+    partner_descriptions: FASTA descriptions of the partners.
+    output_dir_base: Directory in which a subdirectory per pair is made.
+    data_pipeline: The multimer data pipeline.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed used for every pair.
+    models_to_relax: Which models to relax.
+
+  Returns:
+    One summary row per pair, in the order of the partners.
+  """
+  pair_names = [_pair_name(bait_description, d) for d in partner_descriptions]
+  if len(pair_names) != len(set(pair_names)):
+    raise ValueError('The first word of every partner description must be '
+                     'unique.')
+
+  logging.info('Processing bait %s', bait_description)
+  bait_msa_output_dir = os.path.join(output_dir_base, 'bait_msas')
+  os.makedirs(bait_msa_output_dir, exist_ok=True)
+  bait_features = data_pipeline.process_chain(
+      chain_id=BAIT_CHAIN_ID,
+      sequence=bait_sequence,
+      description=bait_description,
+      msa_output_dir=bait_msa_output_dir,
+      is_homomer_or_monomer=False)
+
+  # Partners listed more than once are only processed the first time.
+  partner_counts = collections.Counter(partner_sequences)
+  repeated_partner_features = {}
+
+  rows = []
+  for pair_name, partner_sequence, partner_description in zip(
+      pair_names, partner_sequences, partner_descriptions):
+    output_dir = os.path.join(output_dir_base, pair_name)
+    msa_output_dir = os.path.join(output_dir, 'msas')
+    os.makedirs(msa_output_dir, exist_ok=True)
+    chain_id_map = {
+        BAIT_CHAIN_ID: {'sequence': bait_sequence,
+                        'description': bait_description},
+        PARTNER_CHAIN_ID: {'sequence': partner_sequence,
+                           'description': partner_description}}
+    with open(os.path.join(msa_output_dir, 'chain_id_map.json'), 'w') as f:
+      json.dump(chain_id_map, f, indent=4, sort_keys=True)
+
+    if partner_sequence == bait_sequence:
+      # A homodimer has no MSA pairing, and the bait's features can be reused.
+      all_chain_features = {
+          BAIT_CHAIN_ID: _without_pairing_features(bait_features),
+          PARTNER_CHAIN_ID: _without_pairing_features(bait_features)}
+    else:
+      if partner_sequence in repeated_partner_features:
+        partner_features = repeated_partner_features[partner_sequence]
+      else:
+        partner_features = data_pipeline.process_chain(
+            chain_id=PARTNER_CHAIN_ID,
+            sequence=partner_sequence,
+            description=partner_description,
+            msa_output_dir=msa_output_dir,
+            is_homomer_or_monomer=False)
+        if partner_counts[partner_sequence] > 1:
+          repeated_partner_features[partner_sequence] = partner_features
+      all_chain_features = {BAIT_CHAIN_ID: bait_features,
+                            PARTNER_CHAIN_ID: partner_features}
+    feature_dict = pipeline_multimer.assemble_features(
+        copy.deepcopy(all_chain_features))
+
+    logging.info('Predicting %s', pair_name)
+    model_confidences = run_alphafold.predict_structure_from_features(
+        feature_dict=feature_dict,
+        fasta_name=pair_name,
+        output_dir=output_dir,
+        model_runners=model_runners,
+        amber_relaxer=amber_relaxer,
+        benchmark=benchmark,
+        random_seed=random_seed,
+        models_to_relax=models_to_relax,
+        model_type='Multimer')
+
+    best_model = max(model_confidences,
+                     key=lambda m: model_confidences[m]['ranking_confidence'])
+    best = model_confidences[best_model]
+    rows.append({
+        'pair': pair_name,
+        'partner_description': partner_description,
+        'partner_length': len(partner_sequence),
+        'iptm': best['iptm'],
+        'ptm': best['ptm'],
+        # Mean PAE between the bait and the partner in both directions.
+        'interface_pae': (best['chain_pair_pae'][0][1] +
+                          best['chain_pair_pae'][1][0]) / 2,
+        'ranking_confidence': best['ranking_confidence'],
+        'mean_plddt': best['mean_plddt'],
+        'best_model': best_model,
+    })
+    _write_summary(rows, output_dir_base)
+  return rows
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if FLAGS.model_preset != 'multimer':
+    raise ValueError('Screening requires --model_preset=multimer.')
+  run_alphafold.check_flags(run_multimer_system=True)
+
+  bait_sequences, bait_descriptions = _read_fasta(FLAGS.bait_fasta_path)
+  if len(bait_sequences) != 1:
+    raise ValueError('The bait FASTA file must contain exactly one sequence, '
+                     f'got {len(bait_sequences)}.')
+  partner_sequences, partner_descriptions = _read_fasta(
+      FLAGS.partners_fasta_path)
+  if not partner_sequences:
+    raise ValueError('The partners FASTA file contains no sequences.')
+
+  data_pipeline = run_alphafold.make_data_pipeline(run_multimer_system=True)
+  model_runners = run_alphafold.make_model_runners(
+      FLAGS.model_preset, FLAGS.num_multimer_predictions_per_model)
+  amber_relaxer = run_alphafold.make_amber_relaxer()
+
+  random_seed = FLAGS.random_seed
+  if random_seed is None:
+    random_seed = random.randrange(sys.maxsize // len(model_runners))
+  logging.info('Using random seed %d for the data pipeline', random_seed)
+
+  screen_partners(
+      bait_sequence=bait_sequences[0],
+      bait_description=bait_descriptions[0],
+      partner_sequences=partner_sequences,
+      partner_descriptions=partner_descriptions,
+      output_dir_base=FLAGS.output_dir,
+      data_pipeline=data_pipeline,
+      model_runners=model_runners,
+      amber_relaxer=amber_relaxer,
+      benchmark=FLAGS.benchmark,
+      random_seed=random_seed,
+      models_to_relax=FLAGS.models_to_relax)
+
+
+if __name__ == '__main__':
+  flags.mark_flags_as_required([
+      'bait_fasta_path',
+      'partners_fasta_path',
+      'output_dir',
+      'data_dir',
+      'uniref90_database_path',
+      'mgnify_database_path',
+      'template_mmcif_dir',
+      'max_template_date',
+      'obsolete_pdbs_path',
+      'use_gpu_relax',
+  ])
+
+  app.run(main)
@@ -0,0 +1,82 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for run_alphafold_screen."""
+
+import os
+import tempfile
+
+from absl.testing import absltest
+from alphafold.data import pipeline_multimer
+import mock
+import numpy as np
+import pandas as pd
+import run_alphafold
+import run_alphafold_screen
+
+
+class RunAlphafoldScreenTest(absltest.TestCase):
+
+  def test_screen_partners_processes_each_chain_once(self):
+    data_pipeline_mock = mock.Mock()
+    data_pipeline_mock.process_chain.side_effect = (
+        lambda sequence, **_: {'sequence': np.asarray(sequence),
+                               'msa_all_seq': np.zeros((1, len(sequence)))})
+    iptms = iter([0.3, 0.9, 0.6, 0.5])
+
+    def fake_predict(feature_dict, **_):
+      iptm = next(iptms)
+      return {'model_1': {'iptm': iptm, 'ptm': 0.5, 'mean_plddt': 80.0,
+                          'ranking_confidence': 0.8 * iptm + 0.1,
+                          'chain_pair_pae': [[1.0, 10 * iptm], [6.0, 1.0]]}}
+
+    out_dir = self.enter_context(tempfile.TemporaryDirectory())
+    with mock.patch.object(pipeline_multimer, 'assemble_features',
+                           side_effect=lambda x: x) as assemble_mock, \
+         mock.patch.object(run_alphafold, 'predict_structure_from_features',
+                           side_effect=fake_predict):
+      rows = run_alphafold_screen.screen_partners(
+          bait_sequence='MKV',
+          bait_description='bait protein',
+          partner_sequences=['GGGG', 'MKV', 'AAAAA', 'GGGG'],
+          partner_descriptions=['p1', 'self', 'p2 second', 'p1_again'],
+          output_dir_base=out_dir,
+          data_pipeline=data_pipeline_mock,
+          model_runners={'model_1': mock.Mock()},
+          amber_relaxer=mock.Mock(),
+          benchmark=False,
+          random_seed=0,
+          models_to_relax=run_alphafold.ModelsToRelax.NONE)
+
+    processed = [c.kwargs['sequence']
+                 for c in data_pipeline_mock.process_chain.call_args_list]
+    self.assertEqual(processed, ['MKV', 'GGGG', 'AAAAA'])
+    # The homodimer is assembled without the uniprot pairing features.
+    homodimer_chains = assemble_mock.call_args_list[1].args[0]
+    for chain_features in homodimer_chains.values():
+      self.assertNotIn('msa_all_seq', chain_features)
+    self.assertLen(rows, 4)
+
+    summary = pd.read_csv(os.path.join(out_dir, 'screen_summary.tsv'),
+                          sep='\t')
+    self.assertEqual(list(summary['pair']),
+                     ['bait_self', 'bait_p2', 'bait_p1_again', 'bait_p1'])
+    np.testing.assert_allclose(summary['interface_pae'], [7.5, 6., 5.5, 4.5])
+    for pair in summary['pair']:
+      self.assertTrue(os.path.exists(
+          os.path.join(out_dir, pair, 'msas', 'chain_id_map.json')))
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -16,9 +16,17 @@
 
 import json
 import os
+import subprocess
+import sys
 
 from absl.testing import absltest
 from absl.testing import parameterized
+from alphafold.common import protein
+from alphafold.model import config
+from alphafold.model import features
+from alphafold.model import model
+from alphafold.model import model_test
+import jax
 import run_alphafold
 import mock
 import numpy as np
@@ -58,8 +66,10 @@ class RunAlphafoldTest(parameterized.TestCase):
         'aligned_confidence_probs': np.zeros((10, 10, 50)),
         'predicted_aligned_error': np.zeros((10, 10)),
         'max_predicted_aligned_error': np.array(0.),
+        'num_recycles': np.array(2),
     }
     model_runner_mock.multimer_mode = False
+    model_runner_mock.config = config.model_config('model_1')
 
     with open(
         os.path.join(
@@ -121,12 +131,211 @@ class RunAlphafoldTest(parameterized.TestCase):
                            relax_metrics)
     self.assertCountEqual(expected_files, target_output_files)
 
+    with open(os.path.join(out_dir, 'test', 'timings.json')) as f:
+      self.assertEqual(json.load(f)['num_recycles_model1'], 2)
+
     # Check that pLDDT is set in the B-factor column.
     with open(os.path.join(out_dir, 'test', 'unrelaxed_model1.pdb')) as f:
       for line in f:
         if line.startswith('ATOM'):
           self.assertEqual(line[61:66], '42.00')
 
+  def test_end_to_end_batched(self):
+    data_pipeline_mock = mock.Mock()
+    model_runner_mock = mock.Mock()
+    amber_relaxer_mock = mock.Mock()
+
+    data_pipeline_mock.process.side_effect = [
+        {'seq_length': np.full(10, 10)}, {'seq_length': np.full(40, 40)}]
+    model_runner_mock.process_features.side_effect = [
+        {'aatype': np.zeros((12, 10), dtype=np.int32),
+         'residue_index': np.tile(np.arange(10, dtype=np.int32)[None],
+                                  (12, 1))},
+        {'aatype': np.zeros((12, 40), dtype=np.int32),
+         'residue_index': np.tile(np.arange(40, dtype=np.int32)[None],
+                                  (12, 1))},
+    ]
+
+    def predict_batch(feats, random_seeds, num_res):
+      self.assertLen(random_seeds, 2)
+      self.assertEqual(num_res, 64)
+      return [{
+          'structure_module': {
+              'final_atom_positions': np.zeros((n, 37, 3)),
+              'final_atom_mask': np.ones((n, 37)),
+          },
+          'plddt': np.ones(n) * 42,
+          'ranking_confidence': 90,
+      } for n in (f['aatype'].shape[1] for f in feats)]
+
+    model_runner_mock.predict_batch.side_effect = predict_batch
+    model_runner_mock.multimer_mode = False
+    model_runner_mock.config = config.model_config('model_1')
+
+    out_dir = self.create_tempdir().full_path
+    confidences = run_alphafold.predict_structures_batched(
+        fasta_paths=['short.fasta', 'long.fasta'],
+        fasta_names=['short', 'long'],
+        output_dir_base=out_dir,
+        data_pipeline=data_pipeline_mock,
+        model_runners={'model1': model_runner_mock},
+        amber_relaxer=amber_relaxer_mock,
+        benchmark=False,
+        random_seed=0,
+        models_to_relax=run_alphafold.ModelsToRelax.NONE,
+        model_type='Monomer',
+    )
+
+    self.assertLen(confidences, 2)
+    model_runner_mock.predict.assert_not_called()
+    model_runner_mock.predict_batch.assert_called_once()
+    for fasta_name, num_res in [('short', 10), ('long', 40)]:
+      self.assertIn('ranked_0.pdb',
+                    os.listdir(os.path.join(out_dir, fasta_name)))
+      with open(os.path.join(
+          out_dir, fasta_name, 'confidence_model1.json')) as f:
+        self.assertLen(json.load(f)['confidenceScore'], num_res)
+
+  def test_group_targets(self):
+    out_dir = self.create_tempdir().full_path
+    fasta_paths = []
+    for i, fasta in enumerate(['>A\n' + 'A' * 10, '>A\n' + 'A' * 30,
+                               '>A\n' + 'A' * 40, '>A\nAA\n>B\nAA',
+                               '>A\n' + 'A' * 400, '>A\n' + 'A' * 20,
+                               '>A\n' + 'A' * 5]):
+      fasta_paths.append(os.path.join(out_dir, f'{i}.fasta'))
+      with open(fasta_paths[-1], 'wt') as f:
+        f.write(fasta)
+
+    self.assertEqual(
+        run_alphafold.group_targets(fasta_paths, batch_size=2,
+                                    max_length=300),
+        [[0, 1], [2], [3], [4], [5, 6]])
+    self.assertEqual(
+        run_alphafold.group_targets(fasta_paths, batch_size=1,
+                                    max_length=300),
+        [[i] for i in range(7)])
+
+  def test_recycling_starts_from_initial_structure(self):
+    with open(os.path.join(absltest.get_default_test_srcdir(), TEST_DATA_DIR,
+                           'glucagon.pdb')) as f:
+      initial_structure = protein.from_pdb_string(f.read())
+    num_res = initial_structure.aatype.shape[0]
+    model_runner_mock = mock.Mock()
+    model_runner_mock.process_features.return_value = {
+        'aatype': np.zeros((4, num_res), dtype=np.int32),
+        'residue_index': np.tile(np.arange(num_res)[None], (4, 1)),
+    }
+    model_runner_mock.predict.return_value = {
+        'structure_module': {
+            'final_atom_positions': np.zeros((num_res, 37, 3)),
+            'final_atom_mask': np.ones((num_res, 37)),
+        },
+        'plddt': np.ones(num_res) * 42,
+        'ranking_confidence': 42,
+    }
+    model_runner_mock.multimer_mode = False
+    model_runner_mock.config = config.model_config('model_1')
+
+    kwargs = dict(
+        fasta_name='test',
+        output_dir=self.create_tempdir().full_path,
+        model_runners={'model1': model_runner_mock},
+        amber_relaxer=mock.Mock(),
+        benchmark=False,
+        random_seed=0,
+        models_to_relax=run_alphafold.ModelsToRelax.NONE,
+        model_type='Monomer',
+        initial_structure=initial_structure)
+    run_alphafold.predict_structure_from_features(
+        feature_dict={'aatype': np.zeros((num_res, 21), dtype=np.int32)},
+        **kwargs)
+
+    feat = model_runner_mock.predict.call_args[0][0]
+    np.testing.assert_allclose(
+        feat['prev_pos'],
+        initial_structure.atom_positions *
+        initial_structure.atom_mask[..., None])
+    with self.assertRaisesRegex(ValueError, 'initial structure'):
+      run_alphafold.predict_structure_from_features(
+          feature_dict={'aatype': np.zeros((num_res + 1, 21), dtype=np.int32)},
+          **kwargs)
+
+  def test_compile_model_runner_saves_and_loads_executables(self):
+    shape_buckets = run_alphafold.parse_shape_buckets(['128:256:4', '64:32:0'])
+    self.assertEqual(shape_buckets, [(128, 256, 4), (64, 32, 0)])
+    with self.assertRaisesRegex(ValueError, 'Invalid shape bucket'):
+      run_alphafold.parse_shape_buckets(['128:256'])
+
+    executables_dir = self.create_tempdir().full_path
+    model_runner_mock = mock.Mock()
+    model_runner_mock.compile.return_value = True
+    model_runner_mock.save_executables.side_effect = (
+        lambda path: open(path, 'w').close())
+    run_alphafold.compile_model_runner(
+        model_runner_mock, 'model_1', shape_buckets, executables_dir)
+    model_runner_mock.abstract_features.assert_has_calls(
+        [mock.call(128, 256, 4), mock.call(64, 32, 0)])
+    model_runner_mock.load_executables.assert_not_called()
+    executables_path = os.path.join(executables_dir,
+                                    'model_1_executables.pkl')
+    model_runner_mock.save_executables.assert_called_once_with(
+        executables_path)
+
+    # A later run loads the executables and has nothing new to save.
+    model_runner_mock.reset_mock()
+    model_runner_mock.compile.return_value = False
+    run_alphafold.compile_model_runner(
+        model_runner_mock, 'model_1', shape_buckets, executables_dir)
+    model_runner_mock.load_executables.assert_called_once_with(
+        executables_path)
+    model_runner_mock.save_executables.assert_not_called()
+
+  def test_predictions_run_executables_compiled_ahead_of_time(self):
+    model_runner = model.RunModel(model_test._make_model_config())
+    abstract_feat = model_runner.abstract_features(num_res=16, num_msa=7)
+    # Parameters are loaded before the models run.
+    model_runner.params = jax.tree.map(
+        lambda x: np.zeros(x.shape, x.dtype),
+        jax.eval_shape(model_runner.init, jax.random.PRNGKey(0),
+                       abstract_feat))
+    model_runner.compile(abstract_feat)
+
+    with mock.patch.object(model_runner, 'apply',
+                           side_effect=AssertionError), \
+         mock.patch.object(model_runner, '_apply_with_recycle_callback',
+                           side_effect=AssertionError):
+      run_alphafold.predict_structure_from_features(
+          feature_dict=features.placeholder_features(num_res=12, num_msa=6),
+          fasta_name='test',
+          output_dir=self.create_tempdir().full_path,
+          model_runners={'model1': model_runner},
+          amber_relaxer=mock.Mock(),
+          benchmark=False,
+          random_seed=0,
+          models_to_relax=run_alphafold.ModelsToRelax.NONE,
+          model_type='Monomer')
+
+  def test_heavy_dependencies_are_imported_lazily(self):
+    script = ('import sys, run_alphafold; print(",".join(m for m in ('
+              '"tensorflow", "openmm", "pdbfixer") if m in sys.modules))')
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=os.path.dirname(os.path.abspath(run_alphafold.__file__)),
+        stdout=subprocess.PIPE, text=True, check=True)
+    self.assertEqual(result.stdout.strip(), '')
+
+  def test_recycle_callback_aborts_below_plddt(self):
+    recycle_callback = run_alphafold._make_recycle_callback(
+        'model1', 'test', recycle_abort_plddt=30.)
+    self.assertFalse(recycle_callback(0, 45., 10.))
+    self.assertTrue(recycle_callback(1, 25., 3.))
+    self.assertIsNone(run_alphafold._make_recycle_callback(
+        'model1', 'test', recycle_abort_plddt=None))
+    self.assertFalse(run_alphafold._make_recycle_callback(
+        'model1', 'test', recycle_abort_plddt=None, log_recycling=True)(
+            1, 25., 3.))
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -0,0 +1,272 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Predicts single chains too long for the device as overlapping windows.
+
+The data pipeline runs once for the full chain and its features are saved as
+`features.pkl`. The chain is split into windows of at most --tile_size
+residues that overlap by --tile_overlap residues, either at a fixed stride or,
+given the PAE of an existing model of the chain, between its domains. Every
+window is predicted like a target of run_alphafold.py in its own subdirectory,
+from the features of the full chain cropped to the window. Once all windows
+are predicted, their best models are superposed on their overlaps and written
+as `stitched.pdb` and `stitched.cif`, with the pLDDT in the B-factors, and the
+windows and the CA RMSD of each overlap are written to `tiling.json`.
+
+Several workers sharing the output directory can predict the windows of a
+target in parallel with --num_tile_workers and --tile_worker_index. Each
+worker skips the windows that are already predicted, and the worker that
+completes the last window stitches the chain. To avoid running the data
+pipeline in every worker, run it first with a single worker and
+--tile_worker_index=-1, which only writes the features.
+
+All flags of run_alphafold.py apply, except that --model_preset must be a
+monomer preset.
+"""
+import json
+import os
+import pathlib
+import pickle
+import random
+import sys
+from typing import Dict, List, Optional
+
+from absl import app
+from absl import flags
+from absl import logging
+from alphafold.common import protein
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+from alphafold.data import tiling
+from alphafold.model import model
+from alphafold.relax import relax
+import numpy as np
+import run_alphafold
+
+flags.DEFINE_integer('tile_size', 1200, 'Maximum number of residues of a '
+                     'window. Chains up to this length are predicted at once.',
+                     lower_bound=1)
+flags.DEFINE_integer('tile_overlap', 200, 'Number of residues shared by '
+                     'consecutive windows, on which they are superposed.',
+                     lower_bound=tiling.MIN_OVERLAP)
+flags.DEFINE_list('tile_pae_paths', None, 'Paths to the PAE JSON files, in '
+                  'the format of the AlphaFold Database, of existing models '
+                  'of the targets in --fasta_paths, in the same order. If '
+                  'set, windows end between domains instead of at a fixed '
+                  'stride.')
+flags.DEFINE_integer('num_tile_workers', 1, 'Number of workers predicting '
+                     'the windows of each target in parallel.', lower_bound=1)
+flags.DEFINE_integer('tile_worker_index', 0, 'Index of this worker, from 0 to '
+                     '--num_tile_workers - 1. Worker i predicts the windows i, '
+                     'i + --num_tile_workers and so on. -1 only runs the data '
+                     'pipeline.', lower_bound=-1)
+
+FLAGS = flags.FLAGS
+
+# Written last by run_alphafold for a target, so marks a predicted window.
+_WINDOW_DONE_FILE = 'ranking_debug.json'
+
+
+def load_pae_json(pae_path: str) -> np.ndarray:
+  """Reads the PAE matrix from a JSON file as written by confidence.pae_json."""
+  with open(pae_path) as f:
+    return np.array(json.load(f)[0]['predicted_aligned_error'])
+
+
+def _window_dir(output_dir: str, window: tiling.Window) -> str:
+  return os.path.join(output_dir, f'window_{window[0] + 1}-{window[1]}')
+
+
+def _get_features(fasta_path: str, output_dir: str,
+                  data_pipeline: pipeline.DataPipeline
+                  ) -> pipeline.FeatureDict:
+  """Loads the features of the full chain, or computes and saves them."""
+  features_path = os.path.join(output_dir, 'features.pkl')
+  if os.path.exists(features_path):
+    with open(features_path, 'rb') as f:
+      return pickle.load(f)
+  msa_output_dir = os.path.join(output_dir, 'msas')
+  os.makedirs(msa_output_dir, exist_ok=True)
+  feature_dict = data_pipeline.process(
+      input_fasta_path=fasta_path, msa_output_dir=msa_output_dir)
+  # Written to a temporary file first, so other workers never load partial
+  # features.
+  with open(features_path + '.tmp', 'wb') as f:
+    pickle.dump(feature_dict, f, protocol=4)
+  os.replace(features_path + '.tmp', features_path)
+  return feature_dict
+
+
+def predict_tiled(
+    fasta_path: str,
+    fasta_name: str,
+    output_dir_base: str,
+    data_pipeline: pipeline.DataPipeline,
+    model_runners: Dict[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: run_alphafold.ModelsToRelax,
+    tile_size: int,
+    tile_overlap: int,
+    pae: Optional[np.ndarray] = None,
+    num_workers: int = 1,
+    worker_index: int = 0,
+) -> Optional[List[float]]:
+  """Predicts the windows of a chain assigned to this worker and stitches them.
+
+  Args:
+    fasta_path: Path to the FASTA file of the chain.
+    fasta_name: Name of the chain, which names its output directory.
+    output_dir_base: Directory in which the directory of the chain is made.
+    data_pipeline: The monomer data pipeline.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed used for every window.
+    models_to_relax: Which models to relax.
+    tile_size: Maximum number of residues of a window.
+    tile_overlap: Number of residues shared by consecutive windows.
+    pae: Optional PAE of an existing model of the chain, to end the windows
+      between its domains.
+    num_workers: Number of workers predicting the windows in parallel.
+    worker_index: Index of this worker, or -1 to only compute the features.
+
+  Returns:
+    The CA RMSD of every overlap if the chain was stitched, else None because
+    other windows are not predicted yet.
+  """
+  output_dir = os.path.join(output_dir_base, fasta_name)
+  os.makedirs(output_dir, exist_ok=True)
+  feature_dict = _get_features(fasta_path, output_dir, data_pipeline)
+  num_res = int(feature_dict['seq_length'][0])
+  if pae is not None:
+    if pae.shape != (num_res, num_res):
+      raise ValueError(f'The PAE of {fasta_name} has shape {pae.shape} but the '
+                       f'chain has {num_res} residues.')
+    windows = tiling.domain_windows(pae, tile_size, tile_overlap)
+  else:
+    windows = tiling.fixed_stride_windows(num_res, tile_size, tile_overlap)
+  logging.info('Predicting %s as %d windows: %s', fasta_name, len(windows),
+               windows)
+  if worker_index < 0:
+    return None
+
+  for window in windows[worker_index::num_workers]:
+    window_dir = _window_dir(output_dir, window)
+    if os.path.exists(os.path.join(window_dir, _WINDOW_DONE_FILE)):
+      logging.info('Window %s of %s is already predicted', window, fasta_name)
+      continue
+    os.makedirs(window_dir, exist_ok=True)
+    run_alphafold.predict_structure_from_features(
+        feature_dict=tiling.crop_features(feature_dict, window),
+        fasta_name=f'{fasta_name} window {window[0] + 1}-{window[1]}',
+        output_dir=window_dir,
+        model_runners=model_runners,
+        amber_relaxer=amber_relaxer,
+        benchmark=benchmark,
+        random_seed=random_seed,
+        models_to_relax=models_to_relax,
+        model_type='Monomer',
+        save_features=False)
+
+  if not all(os.path.exists(os.path.join(_window_dir(output_dir, w),
+                                         _WINDOW_DONE_FILE))
+             for w in windows):
+    logging.info('Not stitching %s until all its windows are predicted',
+                 fasta_name)
+    return None
+
+  predictions = []
+  for window in windows:
+    window_dir = _window_dir(output_dir, window)
+    with open(os.path.join(window_dir, 'ranked_0.pdb')) as f:
+      predictions.append(protein.from_pdb_string(f.read()))
+  stitched, rmsds = tiling.stitch(windows, predictions, num_res)
+  logging.info('Stitched %s with overlap CA RMSDs %s', fasta_name, rmsds)
+
+  with open(os.path.join(output_dir, 'stitched.pdb'), 'w') as f:
+    f.write(protein.to_pdb(stitched))
+  run_alphafold._save_mmcif_file(  # pylint: disable=protected-access
+      prot=stitched, output_dir=output_dir, model_name='stitched',
+      file_id='0', model_type='Monomer')
+  plddt = stitched.b_factors[:, residue_constants.atom_order['CA']]
+  run_alphafold._save_confidence_json_file(  # pylint: disable=protected-access
+      plddt, output_dir, 'stitched')
+  with open(os.path.join(output_dir, 'tiling.json'), 'w') as f:
+    json.dump({'windows': [[start + 1, end] for start, end in windows],
+               'overlap_ca_rmsd': rmsds,
+               'mean_plddt': float(np.mean(plddt))}, f, indent=4)
+  return rmsds
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if 'multimer' in FLAGS.model_preset:
+    raise ValueError('Tiled prediction requires a monomer --model_preset.')
+  run_alphafold.check_flags(run_multimer_system=False)
+  if FLAGS.tile_worker_index >= FLAGS.num_tile_workers:
+    raise ValueError('--tile_worker_index must be smaller than '
+                     '--num_tile_workers.')
+  pae_paths = FLAGS.tile_pae_paths or [None] * len(FLAGS.fasta_paths)
+  if len(pae_paths) != len(FLAGS.fasta_paths):
+    raise ValueError('--tile_pae_paths must have one path per FASTA path.')
+
+  data_pipeline = run_alphafold.make_data_pipeline(run_multimer_system=False)
+  model_runners = run_alphafold.make_model_runners(
+      FLAGS.model_preset, num_predictions_per_model=1)
+  amber_relaxer = run_alphafold.make_amber_relaxer()
+
+  random_seed = FLAGS.random_seed
+  if random_seed is None:
+    if FLAGS.num_tile_workers > 1:
+      raise ValueError('--random_seed must be set with several workers, so '
+                       'that they predict the windows with the same seed.')
+    random_seed = random.randrange(sys.maxsize // len(model_runners))
+  logging.info('Using random seed %d for the data pipeline', random_seed)
+
+  for fasta_path, pae_path in zip(FLAGS.fasta_paths, pae_paths):
+    predict_tiled(
+        fasta_path=fasta_path,
+        fasta_name=pathlib.Path(fasta_path).stem,
+        output_dir_base=FLAGS.output_dir,
+        data_pipeline=data_pipeline,
+        model_runners=model_runners,
+        amber_relaxer=amber_relaxer,
+        benchmark=FLAGS.benchmark,
+        random_seed=random_seed,
+        models_to_relax=FLAGS.models_to_relax,
+        tile_size=FLAGS.tile_size,
+        tile_overlap=FLAGS.tile_overlap,
+        pae=load_pae_json(pae_path) if pae_path else None,
+        num_workers=FLAGS.num_tile_workers,
+        worker_index=FLAGS.tile_worker_index)
+
+
+if __name__ == '__main__':
+  flags.mark_flags_as_required([
+      'fasta_paths',
+      'output_dir',
+      'data_dir',
+      'uniref90_database_path',
+      'mgnify_database_path',
+      'template_mmcif_dir',
+      'max_template_date',
+      'obsolete_pdbs_path',
+      'use_gpu_relax',
+  ])
+
+  app.run(main)
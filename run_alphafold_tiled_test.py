@@ -0,0 +1,103 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for run_alphafold_tiled."""
+
+import json
+import os
+import tempfile
+
+from absl.testing import absltest
+from alphafold.common import protein
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+import mock
+import numpy as np
+import run_alphafold
+import run_alphafold_tiled
+
+
+class RunAlphafoldTiledTest(absltest.TestCase):
+
+  def test_workers_predict_windows_and_last_one_stitches(self):
+    num_res = 150
+    sequence = 'A' * num_res
+    data_pipeline_mock = mock.Mock()
+    data_pipeline_mock.process.return_value = pipeline.make_sequence_features(
+        sequence=sequence, description='test', num_res=num_res)
+    # A straight chain of CA atoms 3.8A apart.
+    ca_positions = np.arange(num_res)[:, None] * np.array([3.8, 0., 0.])
+    predicted_windows = []
+
+    def fake_predict(feature_dict, output_dir, **_):
+      residue_index = feature_dict['residue_index']
+      predicted_windows.append((residue_index[0], residue_index[-1] + 1))
+      atom_mask = np.zeros((len(residue_index), 37))
+      atom_mask[:, residue_constants.atom_order['CA']] = 1
+      positions = ca_positions[residue_index][:, None] + 5.
+      prot = protein.Protein(
+          atom_positions=positions.repeat(37, 1) * atom_mask[..., None],
+          aatype=np.zeros(len(residue_index), np.int32),
+          atom_mask=atom_mask,
+          residue_index=residue_index + 1,
+          chain_index=np.zeros(len(residue_index), np.int32),
+          b_factors=np.full((len(residue_index), 37), 80.))
+      with open(os.path.join(output_dir, 'ranked_0.pdb'), 'w') as f:
+        f.write(protein.to_pdb(prot))
+      with open(os.path.join(output_dir, 'ranking_debug.json'), 'w') as f:
+        f.write('{}')
+
+    out_dir = self.enter_context(tempfile.TemporaryDirectory())
+    kwargs = dict(
+        fasta_path='test.fasta',
+        fasta_name='test',
+        output_dir_base=out_dir,
+        data_pipeline=data_pipeline_mock,
+        model_runners={'model_1': mock.Mock()},
+        amber_relaxer=mock.Mock(),
+        benchmark=False,
+        random_seed=0,
+        models_to_relax=run_alphafold.ModelsToRelax.NONE,
+        tile_size=60,
+        tile_overlap=20,
+        num_workers=2)
+    with mock.patch.object(run_alphafold, 'predict_structure_from_features',
+                           side_effect=fake_predict):
+      self.assertIsNone(
+          run_alphafold_tiled.predict_tiled(worker_index=0, **kwargs))
+      rmsds = run_alphafold_tiled.predict_tiled(worker_index=1, **kwargs)
+
+    self.assertEqual(predicted_windows,
+                     [(0, 48), (65, 122), (28, 85), (102, 150)])
+    # The data pipeline ran once and its features were shared.
+    data_pipeline_mock.process.assert_called_once()
+    self.assertLen(rmsds, 3)
+    np.testing.assert_allclose(rmsds, 0., atol=1e-3)
+
+    with open(os.path.join(out_dir, 'test', 'stitched.pdb')) as f:
+      stitched = protein.from_pdb_string(f.read())
+    np.testing.assert_array_equal(stitched.residue_index,
+                                  np.arange(1, num_res + 1))
+    ca = residue_constants.atom_order['CA']
+    np.testing.assert_allclose(stitched.atom_positions[:, ca],
+                               ca_positions + 5., atol=1e-2)
+    with open(os.path.join(out_dir, 'test', 'tiling.json')) as f:
+      tiling_json = json.load(f)
+    self.assertEqual(tiling_json['windows'],
+                     [[1, 48], [29, 85], [66, 122], [103, 150]])
+    self.assertAlmostEqual(tiling_json['mean_plddt'], 80.)
+
+
+if __name__ == '__main__':
+  absltest.main()
@@ -0,0 +1,237 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Predicts point mutants of a protein, reusing the wild type's MSA features.
+
+The data pipeline (MSA and template search) runs once for the wild type. The
+features of each variant are derived from them by substituting the mutated
+residues in the query sequence. Since all variants have the wild type's shapes,
+they are predicted in batches of --predict_batch_size variants with one model
+call per batch, unless the wild type is longer than --predict_batch_max_length.
+Confidence metrics of every variant and their change from the wild type are
+written to `variants_summary.tsv` in the output directory, which is rewritten
+after every batch.
+
+All flags of run_alphafold.py apply, except --fasta_paths which is replaced by
+--wild_type_fasta_path together with --variants or --variants_path.
+"""
+import os
+import random
+import sys
+from typing import Dict, Mapping, Optional, Sequence
+
+from absl import app
+from absl import flags
+from absl import logging
+from alphafold.data import pipeline
+from alphafold.data import variants
+from alphafold.model import model
+from alphafold.relax import relax
+import numpy as np
+import pandas as pd
+import run_alphafold
+
+flags.DEFINE_string('wild_type_fasta_path', None, 'Path to a FASTA file with '
+                    'the single wild type sequence.')
+flags.DEFINE_list('variants', None, 'Variants to predict, e.g. A12G,A12G:L45P. '
+                  'Mutations use 1-based positions in the wild type sequence '
+                  'and mutations of a multiple mutant are separated by colons.')
+flags.DEFINE_string('variants_path', None, 'Path to a file with one variant '
+                    'per line, in the format of --variants. Can be combined '
+                    'with --variants.')
+
+FLAGS = flags.FLAGS
+
+WILD_TYPE_NAME = 'wild_type'
+METRICS = ('mean_plddt', 'ptm', 'ranking_confidence')
+SUMMARY_COLUMNS = (('variant',) + METRICS +
+                   tuple(f'delta_{m}' for m in METRICS) + ('best_model',))
+
+
+def _best_model_row(name: str,
+                    model_confidences: Mapping[str, Mapping[str, float]]
+                    ) -> Dict[str, object]:
+  best_model = max(model_confidences,
+                   key=lambda m: model_confidences[m]['ranking_confidence'])
+  row = {'variant': name, 'best_model': best_model}
+  for metric in METRICS:
+    row[metric] = model_confidences[best_model].get(metric, np.nan)
+  return row
+
+
+def _write_summary(wild_type_row: Mapping[str, object],
+                   variant_rows: Sequence[Mapping[str, object]],
+                   output_dir: str) -> pd.DataFrame:
+  summary = pd.DataFrame([wild_type_row, *variant_rows],
+                         columns=SUMMARY_COLUMNS)
+  for metric in METRICS:
+    summary[f'delta_{metric}'] = summary[metric] - wild_type_row[metric]
+  summary.to_csv(os.path.join(output_dir, 'variants_summary.tsv'), sep='\t',
+                 index=False, float_format='%.4f')
+  return summary
+
+
+def scan_variants(
+    wild_type_fasta_path: str,
+    variant_names: Sequence[str],
+    output_dir_base: str,
+    data_pipeline: pipeline.DataPipeline,
+    model_runners: Dict[str, model.RunModel],
+    amber_relaxer: relax.AmberRelaxation,
+    benchmark: bool,
+    random_seed: int,
+    models_to_relax: run_alphafold.ModelsToRelax,
+    batch_size: int = 1,
+    batch_max_length: Optional[int] = None,
+) -> pd.DataFrame:
+  """Predicts the wild type and each variant from the wild type's features.
+
+  Args:
+    wild_type_fasta_path: Path to the FASTA file of the wild type.
+    variant_names: Variants in the format parsed by variants.parse_mutations.
+    output_dir_base: Directory in which a subdirectory per variant is made.
+    data_pipeline: The monomer data pipeline.
+    model_runners: Mapping from model name to the runner of that model.
+    amber_relaxer: Relaxer used for the models selected by `models_to_relax`.
+    benchmark: Whether to rerun every model to time it without compilation.
+    random_seed: The random seed used for every variant.
+    models_to_relax: Which models to relax.
+    batch_size: Maximum number of variants predicted with one model call, see
+      run_alphafold.predict_structures_batched_from_features.
+    batch_max_length: If set, variants are predicted one at a time when the
+      wild type is longer than this.
+
+  Returns:
+    The summary table, with the wild type in the first row followed by one row
+    per variant.
+  """
+  # Validate all variants before running anything expensive.
+  variant_mutations = [variants.parse_mutations(v) for v in variant_names]
+  variant_names = [':'.join(map(str, m)) for m in variant_mutations]
+  if len(set(variant_names)) != len(variant_names):
+    raise ValueError('Variants must be unique.')
+
+  prediction_kwargs = dict(
+      model_runners=model_runners,
+      amber_relaxer=amber_relaxer,
+      benchmark=benchmark,
+      random_seed=random_seed,
+      models_to_relax=models_to_relax,
+      model_type='Monomer')
+
+  output_dir = os.path.join(output_dir_base, WILD_TYPE_NAME)
+  msa_output_dir = os.path.join(output_dir, 'msas')
+  os.makedirs(msa_output_dir, exist_ok=True)
+  wild_type_features = data_pipeline.process(
+      input_fasta_path=wild_type_fasta_path, msa_output_dir=msa_output_dir)
+  wild_type_sequence = wild_type_features['sequence'][0].decode('utf-8')
+  for mutations in variant_mutations:
+    variants.apply_mutations(wild_type_sequence, mutations)
+
+  model_confidences = run_alphafold.predict_structure_from_features(
+      feature_dict=wild_type_features,
+      fasta_name=WILD_TYPE_NAME,
+      output_dir=output_dir,
+      **prediction_kwargs)
+  wild_type_row = _best_model_row(WILD_TYPE_NAME, model_confidences)
+  summary = _write_summary(wild_type_row, [], output_dir_base)
+
+  if (batch_max_length is not None and
+      len(wild_type_sequence) > batch_max_length):
+    batch_size = 1
+  batch_size = max(batch_size, 1)
+  rows = []
+  for start in range(0, len(variant_names), batch_size):
+    batch_names = variant_names[start:start + batch_size]
+    logging.info('Predicting variants %s', ', '.join(batch_names))
+    feature_dicts = [
+        variants.make_variant_features(wild_type_features, mutations)
+        for mutations in variant_mutations[start:start + batch_size]]
+    output_dirs = [os.path.join(output_dir_base, name.replace(':', '_'))
+                   for name in batch_names]
+    if len(batch_names) > 1:
+      all_model_confidences = (
+          run_alphafold.predict_structures_batched_from_features(
+              feature_dicts=feature_dicts,
+              fasta_names=batch_names,
+              output_dirs=output_dirs,
+              save_features=False,
+              **prediction_kwargs))
+    else:
+      all_model_confidences = [run_alphafold.predict_structure_from_features(
+          feature_dict=feature_dicts[0],
+          fasta_name=batch_names[0],
+          output_dir=output_dirs[0],
+          save_features=False,
+          **prediction_kwargs)]
+    for variant_name, model_confidences in zip(
+        batch_names, all_model_confidences):
+      rows.append(_best_model_row(variant_name, model_confidences))
+    summary = _write_summary(wild_type_row, rows, output_dir_base)
+  return summary
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if 'multimer' in FLAGS.model_preset:
+    raise ValueError('Variant scanning requires a monomer --model_preset.')
+  run_alphafold.check_flags(run_multimer_system=False)
+
+  variant_names = list(FLAGS.variants or [])
+  if FLAGS.variants_path:
+    with open(FLAGS.variants_path) as f:
+      variant_names.extend(line.strip() for line in f if line.strip())
+  if not variant_names:
+    raise ValueError('Either --variants or --variants_path must be set.')
+
+  data_pipeline = run_alphafold.make_data_pipeline(run_multimer_system=False)
+  model_runners = run_alphafold.make_model_runners(
+      FLAGS.model_preset, num_predictions_per_model=1)
+  amber_relaxer = run_alphafold.make_amber_relaxer()
+
+  random_seed = FLAGS.random_seed
+  if random_seed is None:
+    random_seed = random.randrange(sys.maxsize // len(model_runners))
+  logging.info('Using random seed %d for the data pipeline', random_seed)
+
+  scan_variants(
+      wild_type_fasta_path=FLAGS.wild_type_fasta_path,
+      variant_names=variant_names,
+      output_dir_base=FLAGS.output_dir,
+      data_pipeline=data_pipeline,
+      model_runners=model_runners,
+      amber_relaxer=amber_relaxer,
+      benchmark=FLAGS.benchmark,
+      random_seed=random_seed,
+      models_to_relax=FLAGS.models_to_relax,
+      batch_size=FLAGS.predict_batch_size,
+      batch_max_length=FLAGS.predict_batch_max_length)
+
+
+if __name__ == '__main__':
+  flags.mark_flags_as_required([
+      'wild_type_fasta_path',
+      'output_dir',
+      'data_dir',
+      'uniref90_database_path',
+      'mgnify_database_path',
+      'template_mmcif_dir',
+      'max_template_date',
+      'obsolete_pdbs_path',
+      'use_gpu_relax',
+  ])
+
+  app.run(main)
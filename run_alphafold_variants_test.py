@@ -0,0 +1,139 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for run_alphafold_variants."""
+
+import json
+import os
+import tempfile
+
+from absl.testing import absltest
+from alphafold.common import residue_constants
+from alphafold.data import pipeline
+from alphafold.model import config
+import mock
+import numpy as np
+import pandas as pd
+import run_alphafold
+import run_alphafold_variants
+
+
+def _wild_type_features(sequence):
+  features = pipeline.make_sequence_features(
+      sequence=sequence, description='wild type', num_res=len(sequence))
+  features['msa'] = np.array(
+      [[residue_constants.HHBLITS_AA_TO_ID[r] for r in sequence]],
+      dtype=np.int32)
+  return features
+
+
+def _process_features(raw_features, random_seed):
+  del random_seed
+  aatype = np.argmax(raw_features['aatype'], axis=-1).astype(np.int32)
+  num_res = aatype.shape[0]
+  return {
+      'aatype': np.tile(aatype[None], (12, 1)),
+      'residue_index': np.tile(np.arange(num_res, dtype=np.int32)[None],
+                               (12, 1)),
+  }
+
+
+def _predict(feat, random_seed, **_):
+  del random_seed
+  # The confidence is the sum of the residue type indices of the sequence.
+  aatype = feat['aatype'][0]
+  num_res = aatype.shape[0]
+  return {
+      'structure_module': {
+          'final_atom_positions': np.zeros((num_res, 37, 3)),
+          'final_atom_mask': np.ones((num_res, 37)),
+      },
+      'plddt': np.full(num_res, float(np.sum(aatype))),
+      'ranking_confidence': float(np.sum(aatype)),
+  }
+
+
+class RunAlphafoldVariantsTest(absltest.TestCase):
+
+  def test_scan_variants_predicts_variants_in_batches(self):
+    data_pipeline_mock = mock.Mock()
+    data_pipeline_mock.process.return_value = _wild_type_features('MAVL')
+    model_runner_mock = mock.Mock()
+    model_runner_mock.process_features.side_effect = _process_features
+    model_runner_mock.predict.side_effect = _predict
+    model_runner_mock.predict_batch.side_effect = (
+        lambda feats, random_seeds, num_res: [
+            _predict(f, s) for f, s in zip(feats, random_seeds)])
+    model_runner_mock.multimer_mode = False
+    model_runner_mock.config = config.model_config('model_1')
+
+    out_dir = self.enter_context(tempfile.TemporaryDirectory())
+    summary = run_alphafold_variants.scan_variants(
+        wild_type_fasta_path='wild_type.fasta',
+        variant_names=['a2g', 'A2G:L4P', 'V3P'],
+        output_dir_base=out_dir,
+        data_pipeline=data_pipeline_mock,
+        model_runners={'model_1': model_runner_mock},
+        amber_relaxer=mock.Mock(),
+        benchmark=False,
+        random_seed=0,
+        models_to_relax=run_alphafold.ModelsToRelax.NONE,
+        batch_size=2)
+
+    data_pipeline_mock.process.assert_called_once()
+    # The first two variants are predicted together, the wild type and the
+    # last variant alone.
+    model_runner_mock.predict_batch.assert_called_once()
+    self.assertLen(model_runner_mock.predict_batch.call_args.args[0], 2)
+    self.assertEqual(model_runner_mock.predict.call_count, 2)
+
+    for name in ('wild_type', 'A2G', 'A2G_L4P', 'V3P'):
+      output_files = os.listdir(os.path.join(out_dir, name))
+      self.assertIn('ranked_0.pdb', output_files)
+      # Only the wild type features are saved, as the variants derive theirs.
+      self.assertEqual('features.pkl' in output_files, name == 'wild_type')
+      with open(os.path.join(out_dir, name, 'confidence_model_1.json')) as f:
+        self.assertLen(json.load(f)['confidenceScore'], 4)
+
+    # M, A, V and L are residue types 12, 0, 19 and 10.
+    written_summary = pd.read_csv(
+        os.path.join(out_dir, 'variants_summary.tsv'), sep='\t')
+    pd.testing.assert_frame_equal(written_summary, summary, check_dtype=False)
+    self.assertEqual(list(summary['variant']),
+                     ['wild_type', 'A2G', 'A2G:L4P', 'V3P'])
+    np.testing.assert_allclose(summary['mean_plddt'], [41., 48., 52., 36.])
+    np.testing.assert_allclose(summary['delta_mean_plddt'], [0., 7., 11., -5.])
+    np.testing.assert_allclose(summary['delta_ranking_confidence'],
+                               [0., 7., 11., -5.])
+    self.assertTrue(summary['ptm'].isna().all())
+    self.assertEqual(list(summary['best_model']), ['model_1'] * 4)
+
+  def test_scan_variants_rejects_repeated_variants(self):
+    data_pipeline_mock = mock.Mock()
+    with self.assertRaisesRegex(ValueError, 'unique'):
+      run_alphafold_variants.scan_variants(
+          wild_type_fasta_path='wild_type.fasta',
+          variant_names=['A2G', 'a2g'],
+          output_dir_base=self.enter_context(tempfile.TemporaryDirectory()),
+          data_pipeline=data_pipeline_mock,
+          model_runners={'model_1': mock.Mock()},
+          amber_relaxer=mock.Mock(),
+          benchmark=False,
+          random_seed=0,
+          models_to_relax=run_alphafold.ModelsToRelax.NONE)
+    data_pipeline_mock.process.assert_not_called()
+
+
+if __name__ == '__main__':
+  absltest.main()
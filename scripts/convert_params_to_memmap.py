@@ -0,0 +1,63 @@
+# Copyright 2021 DeepMind Technologies Limited
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Converts the AlphaFold parameters to the memory-mappable format.
+
+The converted parameters are written next to the `.npz` files and preferred by
+`data.get_model_haiku_params`, which then maps them into memory instead of
+decompressing them. The `.npz` files are kept.
+
+Example:
+  python scripts/convert_params_to_memmap.py --data_dir=/path/to/data
+"""
+
+import glob
+import os
+
+from absl import app
+from absl import flags
+from absl import logging
+from alphafold.model import data
+
+flags.DEFINE_string('data_dir', None, 'Path to the AlphaFold data directory, '
+                    'containing the `params` directory.')
+flags.DEFINE_boolean('overwrite', False, 'Whether to convert parameters that '
+                     'were already converted.')
+
+FLAGS = flags.FLAGS
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  npz_paths = sorted(
+      glob.glob(os.path.join(FLAGS.data_dir, 'params', 'params_*.npz')))
+  if not npz_paths:
+    raise ValueError(f'No parameters found in {FLAGS.data_dir}/params.')
+
+  for npz_path in npz_paths:
+    output_path = os.path.splitext(npz_path)[0] + data.MEMMAP_PARAMS_SUFFIX
+    if os.path.exists(output_path) and not FLAGS.overwrite:
+      logging.info('Skipping %s, already converted to %s.', npz_path,
+                   output_path)
+      continue
+    data.convert_npz_params(npz_path)
+    logging.info('Converted %s to %s.', npz_path, output_path)
+
+
+if __name__ == '__main__':
+  flags.mark_flags_as_required(['data_dir'])
+  app.run(main)